@@ -8,15 +8,9 @@ import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
-import time as _time
-RENAME_COOLDOWN_SEC = 30.0
-_last_rename_at = {}
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)-8s %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("bot.log", encoding="utf-8")]
-)
+# ログはキューに積むだけ。bot.log（サイズで回す）への書き込みは別スレッド（logpipe.py）
+from logpipe import setup_logging
+log_pipe = setup_logging(logging.INFO)
 logger = logging.getLogger("taskbot")
 
 intents = discord.Intents.default()
@@ -32,52 +26,49 @@ bot = commands.Bot(
     max_messages=100,
 )
 
-DB_PATH = "reminder_bot.db"
+from db import get_db, get_adb, DB_PATH
+from looplag import monitor as loop_lag
+from scheduler import ReminderScheduler, offset_of, parse_offsets
+from delivery import deliver
+from interactions import lifecycle
+from dispatch import Dispatcher, TASK_ACTIONS, transition
+from threadsync import ThreadReconciler
+from task import STATUS_EMOJI, Task
+from dateparse import parse_date
+from timezones import tzstore
+from taskcache import task_cache
+from channels import ChannelRegistry
+from assign import Renderer, TaskService, resolve_assignees
+from router import MessageRouter, mentions, prefixed
+from settings import settings
+from startup import Startup
+from metrics import instrument_bot, metrics, serve_from_env
+
+# スレッド名の色（先頭絵文字）は状態変更イベントで同期する（threadsync.py）
+thread_sync = ThreadReconciler(bot)
+# ボタン操作の唯一の入口（custom_id -> handler）
+dispatcher = Dispatcher()
 
 def db_exec(q: str, params: tuple = (), fetch=False):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(q, params)
-    rows = cur.fetchall() if fetch else None
-    conn.commit()
-    conn.close()
-    return rows
+    # 常駐コネクション（db.py）経由。毎回 connect/close しない
+    return get_db().run(q, params, fetch)
+
+async def adb_exec(q: str, params: tuple = (), fetch=False):
+    # async ハンドラ用：DBスレッドで実行してイベントループを止めない
+    return await get_adb().run(q, params, fetch)
 
 def init_db():
-    db_exec("""CREATE TABLE IF NOT EXISTS admins(user_id INTEGER, guild_id INTEGER, added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY(user_id,guild_id))""")
-    db_exec("""CREATE TABLE IF NOT EXISTS instructors(user_id INTEGER, guild_id INTEGER, target_users TEXT, added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY(user_id,guild_id))""")
-    db_exec("""CREATE TABLE IF NOT EXISTS tasks(
-        id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, instructor_id INTEGER, assignee_id INTEGER,
-        task_name TEXT, due_date TIMESTAMP, status TEXT DEFAULT 'pending',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        message_id INTEGER, channel_id INTEGER, reminder_sent INTEGER DEFAULT 0, thread_id INTEGER)""")
-    
-    # thread_idカラムが存在するかチェック
-    cols = db_exec("PRAGMA table_info(tasks)", fetch=True)
-    if "thread_id" not in [c[1] for c in cols]:
-        db_exec("ALTER TABLE tasks ADD COLUMN thread_id INTEGER")
-
-def is_admin(uid:int, gid:int) -> bool:
-    return bool(db_exec("SELECT 1 FROM admins WHERE user_id=? AND guild_id=?", (uid,gid), fetch=True))
-
-def is_instructor(uid:int, gid:int) -> bool:
-    return bool(db_exec("SELECT 1 FROM instructors WHERE user_id=? AND guild_id=?", (uid,gid), fetch=True))
-
-def insert_task(gid:int, iid:int, aid:int, name:str, due:datetime, mid:int=None, cid:int=None) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name,due_date,message_id,channel_id) VALUES (?,?,?,?,?,?,?)",
-        (gid, iid, aid, name, due, mid, cid)
-    )
-    tid = cur.lastrowid or 0
-    conn.commit()
-    conn.close()
-    return tid
-
-def get_task(tid:int):
-    r = db_exec("SELECT * FROM tasks WHERE id=?", (tid,), fetch=True)
-    return r[0] if r else None
+    # スキーマは schema.py のマイグレーションが唯一の定義元（get_db() 初回で適用済み）
+    get_db()
+
+async def is_admin(uid:int, gid:int) -> bool:
+    return bool(await adb_exec("SELECT 1 FROM admins WHERE user_id=? AND guild_id=?", (uid,gid), fetch=True))
+
+async def is_instructor(uid:int, gid:int) -> bool:
+    return bool(await adb_exec("SELECT 1 FROM instructors WHERE user_id=? AND guild_id=?", (uid,gid), fetch=True))
+
+async def get_task(tid:int):
+    return await task_cache.get(tid)
 
 async def ensure_mgmt(guild:discord.Guild) -> Optional[discord.TextChannel]:
     for name in ("task-management","タスク管理"):
@@ -91,82 +82,19 @@ async def ensure_mgmt(guild:discord.Guild) -> Optional[discord.TextChannel]:
         logger.error(f"mgmt create failed: {e}")
         return None
 
+# 個人チャンネルは (guild, user) -> channel_id の登録簿で引く（channels.py。名前は "<表示名>へ"）
+personal_channels = ChannelRegistry(name=lambda u: f"{u.display_name}へ".replace(" ", ""), topic="{} の個人タスク")
+
 async def ensure_personal(guild:discord.Guild, user:discord.Member) -> Optional[discord.TextChannel]:
-    name = f"{user.display_name}へ".replace(" ","")
-    ch = discord.utils.get(guild.channels, name=name)
-    if isinstance(ch, discord.TextChannel):
-        return ch
     try:
-        ow = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            user: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        }
-        return await guild.create_text_channel(name=name, overwrites=ow, topic=f"{user.display_name} の個人タスク")
+        return await personal_channels.resolve(guild, user)
     except Exception as e:
-        logger.error(f"personal create failed: {e}")
+        logger.error(f"personal channel failed: {e}")
         return None
 
-def parse_date(s:str) -> Optional[datetime]:
-    now = datetime.now()
-    t = s.strip().lower()
-    m = re.search(r'(\d{1,2}):(\d{2})$', t)
-    if m:
-        hour, minute = int(m.group(1)), int(m.group(2))
-        t = t[:m.start()].strip()
-    else:
-        hour, minute = 23, 59
-    
-    pats = [
-        (r'^(今日|today)$', lambda m: now),
-        (r'^(明日|tomorrow)$', lambda m: now + timedelta(days=1)),
-        (r'^(明後日|day after tomorrow)$', lambda m: now + timedelta(days=2)),
-        (r'^(昨日|yesterday)$', lambda m: now - timedelta(days=1)),
-        (r'^(\d+)\s*(日後|days?)$', lambda m: now + timedelta(days=int(m.group(1)))),
-        (r'^(\d+)\s*(週間後|weeks?)$', lambda m: now + timedelta(weeks=int(m.group(1)))),
-        (r'^(\d+)\s*(時間後|hours?)$', lambda m: now + timedelta(hours=int(m.group(1)))),
-        (r'^(\d+)\s*(分後|mins?|minutes?)$', lambda m: now + timedelta(minutes=int(m.group(1))))
-    ]
-    
-    for pat, fn in pats:
-        mm = re.match(pat, t)
-        if mm:
-            dt = fn(mm)
-            return dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
-    
-    wk = {
-        '月':0,'火':1,'水':2,'木':3,'金':4,'土':5,'日':6,
-        'monday':0,'tuesday':1,'wednesday':2,'thursday':3,'friday':4,'saturday':5,'sunday':6,
-        'mon':0,'tue':1,'wed':2,'thu':3,'fri':4,'sat':5,'sun':6
-    }
-    
-    for name, num in wk.items():
-        if name in t:
-            d = num - now.weekday()
-            d += 7 if d <= 0 else 0
-            return (now + timedelta(days=d)).replace(hour=hour, minute=minute, second=0, microsecond=0)
-    
-    abs_p = [
-        r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$',
-        r'^(\d{1,2})[/-](\d{1,2})$',
-        r'^(\d{4})年(\d{1,2})月(\d{1,2})日$',
-        r'^(\d{1,2})月(\d{1,2})日$'
-    ]
-    
-    for pat in abs_p:
-        mm = re.match(pat, t)
-        if mm:
-            g = mm.groups()
-            if len(g) == 3 and len(g[0]) == 4:
-                y, mo, d = int(g[0]), int(g[1]), int(g[2])
-            elif len(g) == 3:
-                mo, d, y = int(g[0]), int(g[1]), now.year
-            else:
-                mo, d, y = int(g[0]), int(g[1]), now.year
-            try:
-                return datetime(y, mo, d, hour, minute)
-            except ValueError:
-                return None
-    return None
+@bot.listen("on_guild_channel_delete")
+async def _forget_personal_channel(channel):
+    personal_channels.on_channel_delete(channel)
 
 STATUS_COLORS = {
     'pending': discord.Color.red(),
@@ -176,14 +104,6 @@ STATUS_COLORS = {
     'abandoned': discord.Color.orange()
 }
 
-STATUS_EMOJI = {
-    'pending': '🟥',
-    'accepted': '🟨',
-    'completed': '🟩',
-    'declined': '⚪',
-    'abandoned': '⚠️'
-}
-
 STATUS_NAME_JP = {
     'pending': '未受託',
     'accepted': '進行中',
@@ -193,35 +113,20 @@ STATUS_NAME_JP = {
 }
 
 # 最小限のメイン用Embed（タスク名と期日のみ・日本語）
-def build_main_embed_jp(task_row) -> discord.Embed:
-    title = f"📋 {task_row[4]}"
-    try:
-        due_raw = task_row[5]
-        try:
-            due_ts = int(datetime.fromisoformat(str(due_raw)).timestamp())
-        except Exception:
-            due_ts = int(datetime.strptime(str(due_raw), "%Y-%m-%d %H:%M:%S").timestamp())
-    except Exception:
-        due_ts = int(datetime.now().timestamp())
-    emb = discord.Embed(title=title, description=f"期日: <t:{due_ts}:F>", color=discord.Color.gold())
+def build_main_embed_jp(task: Task) -> discord.Embed:
+    due_ts = task.due if task.due is not None else int(datetime.now().timestamp())
+    emb = discord.Embed(title=f"📋 {task.name}", description=f"期日: <t:{due_ts}:F>", color=discord.Color.gold())
     return emb
 
 # 詳細用Embed（スレッド内・日本語）
-def build_detail_embed_jp(task_row, status: Optional[str]=None) -> discord.Embed:
-    st = status or task_row[6]
-    try:
-        due_raw = task_row[5]
-        try:
-            due_ts = int(datetime.fromisoformat(str(due_raw)).timestamp())
-        except Exception:
-            due_ts = int(datetime.strptime(str(due_raw), "%Y-%m-%d %H:%M:%S").timestamp())
-    except Exception:
-        due_ts = int(datetime.now().timestamp())
-    emb = discord.Embed(title=f"📋 {task_row[4]}", color=STATUS_COLORS.get(st, discord.Color.blurple()))
+def build_detail_embed_jp(task: Task, status: Optional[str]=None) -> discord.Embed:
+    st = status or task.status
+    due_ts = task.due if task.due is not None else int(datetime.now().timestamp())
+    emb = discord.Embed(title=f"📋 {task.name}", color=STATUS_COLORS.get(st, discord.Color.blurple()))
     emb.add_field(name="期日", value=f"<t:{due_ts}:F>", inline=True)
     emb.add_field(name="状態", value=f"{STATUS_EMOJI.get(st,'⚪')} {STATUS_NAME_JP.get(st, st)}", inline=True)
     emb.add_field(name="更新", value=f"<t:{int(datetime.now().timestamp())}:R>", inline=True)
-    emb.set_footer(text=f"Task ID: {task_row[0]}")
+    emb.set_footer(text=f"Task ID: {task.id}")
     return emb
 
 class TaskView(discord.ui.View):
@@ -245,202 +150,180 @@ class TaskView(discord.ui.View):
             self.add_item(UndoButton(self.tid))
             self.add_item(CompleteButton(self.tid))
 
+# ボタンは custom_id を運ぶだけ。クリックは on_interaction → dispatcher が一括で処理する（dispatch.py）
 class _BaseBtn(discord.ui.Button):
     def __init__(self, label, style, cid):
         super().__init__(label=label, style=style, custom_id=cid)
-    
-    async def _notify_instructor(self, guild: discord.Guild, instructor_id: int, assignee_id: int, tname: str, status: str, thread: Optional[discord.Thread]):
-        inst = guild.get_member(instructor_id)
-        ass = guild.get_member(assignee_id)
-        if not inst:
-            return
-        msg = f"📣 タスク状態が更新されました\nタスク: {tname}\n担当: {ass.mention if ass else assignee_id}\n状態: {STATUS_EMOJI.get(status,'⚪')} {STATUS_NAME_JP.get(status,status)}"
-        try:
-            if thread:
-                msg += f"\nスレッド: {thread.mention}"
-        except Exception:
-            pass
-        try:
-            await inst.send(msg)
-        except Exception:
-            ch = await ensure_mgmt(guild)
-            if ch:
-                await ch.send(inst.mention + "\n" + msg)
-
-    async def _rename_thread(self, guild: discord.Guild, task_id: int, status: str):
-        # thread_id からスレッド取得
-        rows = db_exec("SELECT thread_id, task_name FROM tasks WHERE id=?", (task_id,), fetch=True)
-        if not rows or not rows[0] or not rows[0][0]:
-            return None
-        tid, tname = rows[0][0], rows[0][1] if len(rows[0]) > 1 else None
-        th = guild.get_channel(tid)
-        if not isinstance(th, discord.Thread):
-            try:
-                th = await guild.fetch_channel(tid)
-            except Exception:
-                th = None
-        if not isinstance(th, discord.Thread):
-            return None
-        # クールダウン
-        now = _time.monotonic()
-        last = _last_rename_at.get(th.id, 0.0)
-        if now - last < RENAME_COOLDOWN_SEC:
-            return th
-        cur = th.name or ""
-        em = STATUS_EMOJI.get(status, '⚪')
-        for e in ("🟥","🟨","🟩","⚠️","❌","⚪"):
-            if cur.startswith(e):
-                new = em + cur[len(e):]
-                break
-        else:
-            new = f"{em} {cur}"
-        new = new.lstrip()
-        if new != cur:
-            try:
-                await th.edit(name=new)
-                _last_rename_at[th.id] = now
-            except Exception:
-                pass
-        return th
-
-    async def _handle(self, it:discord.Interaction, new_status:str):
-        t_rows = db_exec("SELECT * FROM tasks WHERE id=?", (int(self.custom_id.split('_')[-1]),), fetch=True)
-        if not t_rows:
-            await it.response.send_message("❌ タスクが見つかりません。", ephemeral=True)
-            return
-        t = t_rows[0]
-        if len(t) < 7:
-            await it.response.send_message("❌ タスクデータが不正です。", ephemeral=True)
-            return
-        if it.user.id != t[3]:
-            await it.response.send_message("❌ あなたは担当者ではありません。", ephemeral=True)
-            return
-        db_exec("UPDATE tasks SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?", (new_status, t[0]))
-        t2_rows = db_exec("SELECT * FROM tasks WHERE id=?", (t[0],), fetch=True)
-        if not t2_rows:
-            await it.response.send_message("❌ 再読込に失敗しました。", ephemeral=True)
-            return
-        t2 = t2_rows[0]
-        # メッセージは詳細Embedで更新（日本語）
-        try:
-            await it.response.edit_message(embed=build_detail_embed_jp(t2, new_status), view=TaskView(t2[0], t2[3], t2[2], new_status))
-        except Exception:
-            try:
-                await it.message.edit(embed=build_detail_embed_jp(t2, new_status), view=TaskView(t2[0], t2[3], t2[2], new_status))
-            except Exception:
-                pass
-        # 先にスレッド名を更新
-        thread = await self._rename_thread(it.guild, t2[0], new_status)
-        # 指示者に通知
-        await self._notify_instructor(it.guild, t2[2], t2[3], t2[4], new_status, thread)
 
 class AcceptButton(_BaseBtn):
     def __init__(self, tid:int):
         super().__init__("✅ 受託", discord.ButtonStyle.success, f"accept_task_{tid}")
-    async def callback(self, it):
-        await self._handle(it, 'accepted')
 
 class DeclineButton(_BaseBtn):
     def __init__(self, tid:int):
         super().__init__("❌ 辞退", discord.ButtonStyle.danger, f"decline_task_{tid}")
-    async def callback(self, it):
-        await self._handle(it, 'declined')
 
 class CompleteButton(_BaseBtn):
     def __init__(self, tid:int):
         super().__init__("📝 完了", discord.ButtonStyle.success, f"complete_task_{tid}")
-    async def callback(self, it):
-        await self._handle(it, 'completed')
 
 class AbandonButton(_BaseBtn):
     def __init__(self, tid:int):
         super().__init__("⚠️ 問題", discord.ButtonStyle.danger, f"abandon_task_{tid}")
-    async def callback(self, it):
-        await self._handle(it, 'abandoned')
 
 class UndoButton(_BaseBtn):
     def __init__(self, tid:int):
         super().__init__("↩️ 戻す", discord.ButtonStyle.secondary, f"undo_completion_{tid}")
-    async def callback(self, it):
-        await self._handle(it, 'accepted')
-
-# タスク通知（個人CHに最小、スレッドで詳細、日本語、thread_id保存、指示者に通知）
-async def send_task_notification_jp(guild: discord.Guild, assignee: discord.Member, instructor: discord.Member, task_row: tuple):
-    # 個人CH確保
-    ch = await ensure_personal(guild, assignee)
-    if not ch:
-        try:
-            ch = await assignee.create_dm()
-        except Exception:
-            ch = None
-    # メインは最小表示（ボタンなし）
-    main_msg = None
-    if ch:
-        main_msg = await ch.send(assignee.mention, embed=build_main_embed_jp(task_row))
-    # 詳細スレッド（ボタン付き）
-    thread = None
+
+async def _notify_instructor(guild: discord.Guild, instructor_id: int, assignee_id: int, tname: str, status: str,
+                             thread_id: Optional[int]):
+    inst = guild.get_member(instructor_id)
+    ass = guild.get_member(assignee_id)
+    if not inst:
+        return
+    msg = f"📣 タスク状態が更新されました\nタスク: {tname}\n担当: {ass.mention if ass else assignee_id}\n状態: {STATUS_EMOJI.get(status,'⚪')} {STATUS_NAME_JP.get(status,status)}"
+    if thread_id:
+        msg += f"\nスレッド: <#{thread_id}>"
     try:
-        base = main_msg if isinstance(main_msg, discord.Message) else None
-        if base and hasattr(base, 'create_thread'):
-            thread = await base.create_thread(name=f"{STATUS_EMOJI.get(task_row[6],'⚪')} {task_row[4]} - 詳細", auto_archive_duration=60, reason="タスク詳細")
-        elif ch and hasattr(ch, 'create_thread'):
-            thread = await ch.create_thread(name=f"{STATUS_EMOJI.get(task_row[6],'⚪')} {task_row[4]} - 詳細", type=discord.ChannelType.public_thread)
+        await inst.send(msg)
+    except Exception:
+        ch = await ensure_mgmt(guild)
+        if ch:
+            await ch.send(inst.mention + "\n" + msg)
+
+async def _safely(name: str, coro):
+    try:
+        await coro
+    except Exception as e:
+        logger.error(f"[{name}] {e}", exc_info=True)
+
+# --- ボタン操作：状態遷移（DBは1往復）→ 応答 → スレッド名・リマインダ・指示者通知は並行で ---
+@dispatcher.route(*TASK_ACTIONS)
+async def on_task_action(ack, action:str, tid:int):
+    it = ack.inter
+    new_status = TASK_ACTIONS[action]
+    # 担当者チェック・遷移の検証・UPDATE・再読込を1トランザクション（DB往復1回）で
+    res, thread_id, t2 = await transition(get_adb(), tid, it.user.id, action)
+    if res == "missing":
+        await ack.send("❌ タスクが見つかりません。", ephemeral=True)
+        return
+    if res == "forbidden":
+        await ack.send("❌ あなたは担当者ではありません。", ephemeral=True)
+        return
+    if res == "invalid":
+        await ack.send("❌ このタスクは既に状態が変わっています。", ephemeral=True)
+        return
+    # メッセージは詳細Embedで更新（日本語）。これが ack になるので他の処理より先に
+    embed, view = build_detail_embed_jp(t2, new_status), TaskView(t2.id, t2.assignee_id, t2.instructor_id, new_status)
+    try:
+        await ack.edit(embed=embed, view=view)
     except Exception:
-        thread = None
-    # 詳細情報投稿（ここにボタンを付ける）
-    if isinstance(thread, discord.Thread):
-        try:
-            det = build_detail_embed_jp(task_row)
-            await thread.send(embed=det, view=TaskView(task_row[0], task_row[3], task_row[2], task_row[6]))
-        except Exception:
-            pass
         try:
-            db_exec("UPDATE tasks SET thread_id=?, message_id=? WHERE id=?", (thread.id, main_msg.id if main_msg else None, task_row[0]))
+            await it.message.edit(embed=embed, view=view)
         except Exception:
             pass
-    # 指示者に通知
-    try:
-        msg = f"📣 タスクを指示しました\nタスク: {task_row[4]}\n担当: {assignee.mention}\n期日: {task_row[5]}"
-        if isinstance(thread, discord.Thread):
-            msg += f"\nスレッド: {thread.mention}"
-        await instructor.send(msg)
-    except Exception:
-        mg = await ensure_mgmt(guild)
-        if mg:
-            await mg.send(instructor.mention + "\n" + msg)
+    # 応答は済んでいるので待たせない。スレッド名は threadsync（10分2回の枠は renamer）が反映する
+    thread_sync.publish(thread_id, new_status)
+    lifecycle.spawn(_safely("reminder", reminders.on_status(t2.id, new_status, t2.due, t2.guild_id)))
+    if it.guild:
+        lifecycle.spawn(_safely("notify", _notify_instructor(
+            it.guild, t2.instructor_id, t2.assignee_id, t2.name, new_status, thread_id)))
+
+@bot.event
+async def on_interaction(inter:discord.Interaction):
+    await dispatcher.dispatch(inter)
+
+# タスク通知（個人CHに最小、スレッドで詳細＋ボタン、日本語、指示者に通知）。作成の流れは assign.TaskService
+class JpRenderer(Renderer):
+    async def mode(self, guild: discord.Guild) -> str:
+        return "jp"                                       # この Bot は日本語だけ（表示モードを引かない）
+
+    def thread_name(self, t: Task) -> str:
+        return f"{STATUS_EMOJI.get(t.status,'⚪')} {t.name} - 詳細"
+
+    def main(self, t: Task, member: discord.Member, mode: str = "jp") -> dict:
+        return {"content": member.mention, "embed": build_main_embed_jp(t)}      # メインはボタンなし
+
+    def detail(self, t: Task, instructor, mode: str = "jp") -> dict:
+        return {"embed": build_detail_embed_jp(t), "view": TaskView(t.id, t.assignee_id, t.instructor_id, t.status)}
+
+    async def announce(self, guild: discord.Guild, instructor, posted):
+        tz = await tzstore.get(guild.id, instructor.id)
+        blocks = [f"タスク: {t.name}\n担当: {m.mention}\n期日: {t.due_text(tz, '%Y-%m-%d %H:%M')}"
+                  + (f"\nスレッド: {th.mention}" if th else "") for t, m, th in posted]
+        msgs, cur = [], "📣 タスクを指示しました"
+        for b in blocks:                                  # 1通 2000 文字まで
+            if len(cur) + len(b) + 2 > 1900:
+                msgs.append(cur); cur = ""
+            cur = f"{cur}\n\n{b}" if cur else b
+        msgs.append(cur)
+        for msg in msgs:
+            try:
+                await instructor.send(msg)
+            except Exception:
+                mg = await ensure_mgmt(guild)
+                if mg:
+                    await mg.send(instructor.mention + "\n" + msg)
+
+task_service = TaskService(JpRenderer(), registry=personal_channels)
+
+# READY 後の処理は1プロセス1回（再接続の READY では何もしない）。スラッシュは定義が変わったギルドだけ並列に同期
+startup = Startup(bot)
+instrument_bot(bot)
 
 @bot.event
 async def on_ready():
     logger.info(f"{bot.user} logged in. Guilds={len(bot.guilds)}")
-    init_db()
+    if startup.started:
+        return
+    loop_lag.start()
+    thread_sync.start()
+    await serve_from_env(health=lambda: bot.is_ready() and not bot.is_closed())
+    await get_adb().call(init_db)
+    await settings.load()
+    if not reminders.running:
+        await reminders.load()
+        reminders.start()
     try:
         logger.info("Text commands: %s", ", ".join(sorted(c.name for c in bot.commands)))
     except Exception:
         pass
-    try:
-        for g in bot.guilds:
-            await bot.tree.sync(guild=g)
-        logger.info("Slash commands synced.")
-    except Exception as e:
-        logger.error(f"Slash sync error: {e}")
+    startup.start()
 
 @bot.event
-async def on_message(message:discord.Message):
-    if message.author.bot:
-        return
-    text = message.content.strip()
-    if re.match(rf"^(?:<@!?{bot.user.id}>\s*)?[/!！]?\s*setup\b", text, flags=re.I):
-        ctx = await bot.get_context(message)
-        await setup_cmd(ctx)
-        return
+async def on_guild_join(guild: discord.Guild):
+    await startup.join(guild)
+
+# メッセージは router が振り分ける（安い判定で最初に当たった1つだけ。それ以外は何もしない）
+router = MessageRouter()
+_SETUP = re.compile(r"^(?:<@!?(\d+)>\s*)?[/!！]?\s*setup\b", re.I)
+
+def _is_setup(m:discord.Message, text:str) -> bool:
+    # "setup" / "@Bot setup" はプレフィックス無しでも拾う（正規表現は "setup" を含む時だけ）
+    if "setup" not in text[:40].lower():
+        return False
+    mm = _SETUP.match(text)
+    return bool(mm) and (mm.group(1) is None or (bot.user is not None and int(mm.group(1)) == bot.user.id))
+
+@router.route("setup", _is_setup, order=0)
+async def _setup_route(message:discord.Message):
+    await setup_cmd(await bot.get_context(message))
+
+@router.route("commands", prefixed("!", "！", "/"), order=10)
+@router.route("mention", mentions(bot, names=False), order=20)
+async def _commands(message:discord.Message):
     await bot.process_commands(message)
 
+@bot.event
+async def on_message(message:discord.Message):
+    await router.dispatch(message)
+
 @bot.command(name="setup", aliases=["init","セットアップ"])
 async def setup_cmd(ctx:commands.Context):
     if not ctx.guild:
         await ctx.reply("❌ サーバー内で実行してください")
         return
-    db_exec("INSERT OR IGNORE INTO admins(user_id,guild_id) VALUES(?,?)", (ctx.author.id, ctx.guild.id))
+    await adb_exec("INSERT OR IGNORE INTO admins(user_id,guild_id) VALUES(?,?)", (ctx.author.id, ctx.guild.id))
     await ctx.reply("✅ Setup complete. Use `!channels` → `!test`")
 
 @bot.command(name="channels")
@@ -448,7 +331,7 @@ async def channels_cmd(ctx:commands.Context):
     try:
         if not ctx.guild:
             return
-        if not is_admin(ctx.author.id, ctx.guild.id):
+        if not await is_admin(ctx.author.id, ctx.guild.id):
             await ctx.reply("❌ Admin only")
             return
         created = []
@@ -476,15 +359,9 @@ async def test_cmd(ctx:commands.Context):
     try:
         if not ctx.guild:
             return
-        due = datetime.now() + timedelta(hours=1, minutes=5)
-        tid = insert_task(ctx.guild.id, ctx.author.id, ctx.author.id, "テストタスク", due, ctx.message.id, ctx.channel.id)
-        task = get_task(tid)
-        if not task:
-            logger.error(f"DB readback failed for task id={tid}")
-            await ctx.reply("❌ タスク作成後の読み出しに失敗しました。もう一度お試しください。")
-            return
-        await send_task_notification_jp(ctx.guild, ctx.author, ctx.author, task)
-        await ctx.reply(f"✅ テスト作成 (ID={tid})")
+        due = datetime.now(await tzstore.get(ctx.guild.id, ctx.author.id)) + timedelta(hours=1, minutes=5)
+        res = await task_service.create(ctx.guild, ctx.author, [ctx.author], "テストタスク", due, origin=ctx.message)
+        await ctx.reply(f"✅ テスト作成 (ID={res.task_ids[0]})" + (f"\n{res.summary()}" if res.failed else ""))
     except Exception as e:
         logging.error("test_cmd failed", exc_info=True)
         try:
@@ -494,7 +371,16 @@ async def test_cmd(ctx:commands.Context):
 
 @bot.command(name="ping")
 async def ping_cmd(ctx:commands.Context):
-    await ctx.reply("pong")
+    await ctx.reply(f"pong\n{lifecycle.hist.summary()}\n{task_cache.stats()}\n{personal_channels.stats()}\n{task_service.stats()}\n{settings.stats()}\n{startup.stats()}\n{router.stats()}\n{log_pipe.stats()}")
+
+# メトリクス（metrics.py）の要約。METRICS_PORT があれば同じものを GET /metrics でも出す
+@bot.command(name="stats")
+async def stats_cmd(ctx:commands.Context):
+    try:
+        await ctx.reply(f"```\n{metrics.summary()[:1900]}\n```")
+    except Exception as e:
+        try: logger.error(f"[stats] {e}", exc_info=True)
+        except: pass
 
 @bot.command(name="assign", aliases=["指示","assign_task"])
 async def assign_cmd(ctx: commands.Context, *, content: str):
@@ -502,13 +388,13 @@ async def assign_cmd(ctx: commands.Context, *, content: str):
         if not ctx.guild:
             await ctx.reply("❌ サーバー内で実行してください")
             return
-        # 対象ユーザー（Bot以外のメンション）
-        assignees = [m for m in ctx.message.mentions if m.id != bot.user.id]
+        # 対象ユーザー（Bot以外のメンション＋メンションされたロールのメンバー）
+        assignees = resolve_assignees(ctx.message, exclude=(bot.user.id,))
         if not assignees:
             await ctx.reply("❌ 指示対象のユーザーをメンションしてください。例: !assign @太郎, 明日 18:00, レポート提出")
             return
         # メンションを本文から取り除き、 "期日, タスク名" を抽出
-        text_wo_mentions = re.sub(r'<@!?[0-9]+>', '', content).strip()
+        text_wo_mentions = re.sub(r'<@[!&]?[0-9]+>', '', content).strip()
         m = re.search(r'[，,]', text_wo_mentions)
         if not m:
             await ctx.reply("❌ 形式: !assign @ユーザー, 期日, タスク名（半角`,` を2つ）")
@@ -522,22 +408,12 @@ async def assign_cmd(ctx: commands.Context, *, content: str):
         if not task_name:
             await ctx.reply("❌ タスク名が空です。")
             return
-        due_dt = parse_date(due_str)
+        due_dt = parse_date(due_str, tz=await tzstore.get(ctx.guild.id, ctx.author.id))
         if not due_dt:
             await ctx.reply("❌ 期日が読めませんでした。例: 明日 18:00 / 3日後 / 金曜 14:30 / 2025/08/23 09:00")
             return
-        created = 0
-        for member in assignees:
-            tid = insert_task(ctx.guild.id, ctx.author.id, member.id, task_name, due_dt, ctx.message.id, ctx.channel.id)
-            task_row = get_task(tid)
-            if not task_row:
-                continue
-            await send_task_notification_jp(ctx.guild, member, ctx.author, task_row)
-            created += 1
-        if created:
-            await ctx.reply(f"✅ {created}件のタスクを指示しました。")
-        else:
-            await ctx.reply("❌ 作成に失敗しました。")
+        res = await task_service.create(ctx.guild, ctx.author, assignees, task_name, due_dt, origin=ctx.message)
+        await ctx.reply(res.summary())
     except Exception as e:
         logging.error("assign_cmd failed", exc_info=True)
         try:
@@ -546,93 +422,109 @@ async def assign_cmd(ctx: commands.Context, *, content: str):
             pass
 
 # 共通ハンドラ: スラッシュ指示の実装本体
-async def _handle_assign_slash(it: discord.Interaction, user: discord.Member, due: str, title: str):
+async def _handle_assign_slash(ack, user: discord.Member, due: str, title: str):
+    it = ack.inter
     if not it.guild:
-        await it.response.send_message("❌ サーバー内で実行してください", ephemeral=True)
+        await ack.send("❌ サーバー内で実行してください", ephemeral=True)
         return
-    due_dt = parse_date(due)
+    due_dt = parse_date(due, tz=await tzstore.get(it.guild.id, it.user.id))
     if not due_dt:
-        await it.response.send_message("❌ 期日が読めませんでした。例: 明日 18:00 / 3日後 / 金曜 14:30 / 2025/08/23 09:00", ephemeral=True)
-        return
-    tid = insert_task(it.guild.id, it.user.id, user.id, title, due_dt, getattr(it.message, 'id', None), getattr(it.channel, 'id', None))
-    row = get_task(tid)
-    if not row:
-        await it.response.send_message("❌ 作成に失敗しました。", ephemeral=True)
+        await ack.send("❌ 期日が読めませんでした。例: 明日 18:00 / 3日後 / 金曜 14:30 / 2025/08/23 09:00", ephemeral=True)
         return
-    await send_task_notification_jp(it.guild, user, it.user, row)
-    await it.response.send_message(f"✅ {user.mention} にタスクを指示しました。", ephemeral=True)
-
-# 既存の /assign を共通ハンドラに委譲
-@bot.tree.command(name="assign", description="タスクを指示（@ユーザー, 期日, タスク名）")
-@app_commands.describe(user="対象ユーザー", due="期日（例: 明日 18:00 / 3日後 / 2025/09/01 09:00）", title="タスク名")
-async def assign_slash(it: discord.Interaction, user: discord.Member, due: str, title: str):
+    # DBに入った時点で応答し、チャンネル・スレッド作成と通知はその後（3秒の締切に掛からないように）
+    async def _ack(tasks):
+        await ack.send(f"✅ {user.mention} にタスクを指示しました。", ephemeral=True)
+    res = await task_service.create(it.guild, it.user, [user], title, due_dt, on_insert=_ack)
+    if res.failed:
+        await ack.send(res.summary(), ephemeral=True)
+
+async def _assign_slash_work(ack, user: discord.Member, due: str, title: str):
     try:
-        await _handle_assign_slash(it, user, due, title)
+        await _handle_assign_slash(ack, user, due, title)
     except Exception as e:
-        logging.error("assign_slash failed", exc_info=True)
+        logging.error(f"{ack.name} failed", exc_info=True)
         try:
-            if not it.response.is_done():
-                await it.response.send_message(f"❌ assign error\n`{type(e).__name__}: {e}`", ephemeral=True)
-            else:
-                await it.followup.send(f"❌ assign error\n`{type(e).__name__}: {e}`", ephemeral=True)
+            await ack.send(f"❌ assign error\n`{type(e).__name__}: {e}`", ephemeral=True)
         except Exception:
             pass
 
+# 既存の /assign を共通ハンドラに委譲
+@bot.tree.command(name="assign", description="タスクを指示（@ユーザー, 期日, タスク名）")
+@app_commands.describe(user="対象ユーザー", due="期日（例: 明日 18:00 / 3日後 / 2025/09/01 09:00）", title="タスク名")
+async def assign_slash(it: discord.Interaction, user: discord.Member, due: str, title: str):
+    await lifecycle.run(it, "assign", lambda ack: _assign_slash_work(ack, user, due, title), ephemeral=True)
+
 # 日本語エイリアス /指示 も同じ本体に委譲
 @bot.tree.command(name="指示", description="タスクを指示（@ユーザー, 期日, タスク名）")
 @app_commands.describe(user="対象ユーザー", due="期日（例: 明日 18:00 / 3日後 / 2025/09/01 09:00）", title="タスク名")
 async def 指示(it: discord.Interaction, user: discord.Member, due: str, title: str):
-    try:
-        await _handle_assign_slash(it, user, due, title)
-    except Exception as e:
-        logging.error("assign_slash(jp) failed", exc_info=True)
+    await lifecycle.run(it, "指示", lambda ack: _assign_slash_work(ack, user, due, title), ephemeral=True)
+
+def _offset_label(minutes: int) -> str:
+    if minutes % 1440 == 0: return f"{minutes // 1440} day(s)"
+    if minutes % 60 == 0: return f"{minutes // 60} hour(s)"
+    return f"{minutes} minute(s)"
+
+# リマインダ：段階ごとの予定時刻ちょうどに送る（scheduler.py が reminders テーブルから取り出して呼ぶ）
+# タスクはバッチ分を1クエリで引き、宛先ごとに1通へまとめて delivery.py で並行に送る
+_fallback_lock = asyncio.Lock()   # 管理/個人チャンネルの作成が並行して二重にならないように
+
+async def _send_reminder(key, embeds):
+    # 送れなかった時は例外にする：scheduler は送信済み（sent_at）にしてあるので、黙って戻ると
+    # deliver が送れた件数に数えてしまい、失敗したことがどこにも残らない
+    gid, uid, kind = key
+    guild = bot.get_guild(gid)
+    if guild is None:
+        raise LookupError(f"guild {gid} is not available")
+    member = guild.get_member(uid)
+    if member is None:
+        # members intent のキャッシュに居ないだけのことがある
         try:
-            if not it.response.is_done():
-                await it.response.send_message(f"❌ assign error\n`{type(e).__name__}: {e}`", ephemeral=True)
-            else:
-                await it.followup.send(f"❌ assign error\n`{type(e).__name__}: {e}`", ephemeral=True)
-        except Exception:
-            pass
-
-@tasks.loop(minutes=5)
-async def check_reminders():
-    now = datetime.now()
-    soon = now + timedelta(hours=1)
-    rows = db_exec("SELECT id,guild_id,assignee_id,task_name,due_date FROM tasks WHERE status='accepted' AND reminder_sent=0 AND due_date>? AND due_date<=?", (now,soon), fetch=True)
-    for tid, gid, aid, tname, due in rows:
-        guild = bot.get_guild(gid)
-        if not guild:
-            continue
-        user = guild.get_member(aid)
-        if not user:
+            member = await guild.fetch_member(uid)
+        except discord.NotFound:
+            raise LookupError(f"member {uid} is not in guild {gid}") from None
+    try:
+        await member.send(embeds=embeds)
+    except (discord.Forbidden, discord.NotFound):
+        # DM 不可：overdue は管理チャンネル、通常は個人チャンネルへ
+        async with _fallback_lock:
+            ch = await (ensure_mgmt(guild) if kind == "overdue" else ensure_personal(guild, member))
+        if not ch:
+            raise LookupError(f"DM to {uid} refused and no fallback channel in guild {gid}")
+        await ch.send(member.mention, embeds=embeds)
+
+async def check_reminders(batch):
+    ids = sorted({tid for _, tid, _ in batch})
+    by_id = await task_cache.get_many(ids)
+    items = []
+    for rid, tid, kind in batch:
+        t = by_id.get(tid)
+        if not t or t.status != 'accepted' or t.due is None:
             continue
+        gid, iid, aid, tname, due_ts = t.guild_id, t.instructor_id, t.assignee_id, t.name, t.due
         try:
-            try:
-                due_ts = int(datetime.fromisoformat(str(due)).timestamp())
-            except Exception:
-                due_ts = int(datetime.strptime(str(due), "%Y-%m-%d %H:%M:%S").timestamp())
-            emb = discord.Embed(title="⏰ Task Reminder", description=f"**{tname}**\nDue in less than 1 hour!", color=discord.Color.orange())
+            if kind == "overdue":
+                # 期日超過：指示者へエスカレーション
+                emb = discord.Embed(title="🚨 期日超過", description=f"**{tname}**\n担当: <@{aid}>\n期日を過ぎても完了していません。", color=discord.Color.red())
+                emb.add_field(name="期日", value=f"<t:{due_ts}:F>", inline=True)
+                items.append(((gid, iid, "overdue"), emb))
+                continue
+            emb = discord.Embed(title="⏰ Task Reminder", description=f"**{tname}**\nDue in {_offset_label(offset_of(kind) or 0)}!", color=discord.Color.orange())
             emb.add_field(name="Due", value=f"<t:{due_ts}:F>", inline=True)
-            try:
-                await user.send(embed=emb)
-            except Exception:
-                ch = await ensure_personal(guild, user)
-                if ch:
-                    await ch.send(user.mention, embed=emb)
-            db_exec("UPDATE tasks SET reminder_sent=1 WHERE id=?", (tid,))
+            items.append(((gid, aid, "remind"), emb))
         except Exception as e:
-            logging.error(f"reminder failed: {e}")
-            db_exec("UPDATE tasks SET reminder_sent=1 WHERE id=?", (tid,))
+            logging.error(f"reminder {rid} ({kind}) failed: {e}")
+    if items:
+        sent, failed = await deliver(items, _send_reminder)
+        logger.info(f"[reminder] delivered {sent}/{len(items)} ({failed} failed)")
 
-@check_reminders.before_loop
-async def _b1():
-    await bot.wait_until_ready()
+reminders = ReminderScheduler(check_reminders)
 
 @tasks.loop(minutes=1)
 async def heartbeat_check():
     try:
         if heartbeat_check.current_loop % 5 == 0:
-            logger.info(f"Heartbeat OK. Guilds={len(bot.guilds)} Latency={round(bot.latency*1000)}ms")
+            logger.info(f"Heartbeat OK. Guilds={len(bot.guilds)} Latency={round(bot.latency*1000)}ms {loop_lag.summary()} {lifecycle.hist.summary()} {task_cache.stats()}")
     except Exception as e:
         logger.error(f"Heartbeat error: {e}")
 
@@ -684,13 +576,60 @@ async def on_app_command_error(interaction: discord.Interaction, error: Exceptio
 async def on_error(event_method, *args, **kwargs):
     logging.error(f"on_error in {event_method}", exc_info=True)
 
+@bot.command(name="remind", aliases=["リマインド設定"])
+async def remind_cmd(ctx: commands.Context, *, offsets: str = ""):
+    """!remind 1440,60,10 … 期日の何分前に通知するか（ギルド既定）。引数なしで確認"""
+    try:
+        if not ctx.guild:
+            return
+        if not offsets.strip():
+            cur = await reminders.offsets_for(ctx.guild.id)
+            await ctx.reply("⏰ リマインド: " + ", ".join(_offset_label(m) for m in cur) + " 前 + 期日超過時に指示者へ通知")
+            return
+        if not await is_admin(ctx.author.id, ctx.guild.id):
+            await ctx.reply("❌ Admin only")
+            return
+        vals = parse_offsets(offsets)
+        if not vals:
+            await ctx.reply("❌ 例: !remind 1440,60,10（分）")
+            return
+        await reminders.set_offsets(ctx.guild.id, vals)
+        await ctx.reply("✅ リマインドを設定しました: " + ", ".join(_offset_label(m) for m in vals) + " 前（以後に受託したタスクから適用）")
+    except ValueError:
+        await ctx.reply("❌ 例: !remind 1440,60,10（分）")
+    except Exception as e:
+        logging.error("remind_cmd failed", exc_info=True)
+        await ctx.reply(f"❌ remind error\n`{type(e).__name__}: {e}`")
+
+@bot.command(name="timezone", aliases=["tz","タイムゾーン"])
+async def timezone_cmd(ctx: commands.Context, name: str = "", scope: str = ""):
+    """!timezone … 確認 / !timezone Asia/Tokyo … ギルド既定（Admin）/ !timezone Asia/Tokyo me … 自分だけ"""
+    try:
+        if not ctx.guild:
+            return
+        if not name:
+            tz = await tzstore.get(ctx.guild.id, ctx.author.id)
+            await ctx.reply(f"🕒 タイムゾーン: {tz}（期日の入力・表示に使います）")
+            return
+        personal = scope.lower() in ("me", "自分")
+        if not personal and not await is_admin(ctx.author.id, ctx.guild.id):
+            await ctx.reply("❌ Admin only（自分だけなら !timezone Asia/Tokyo me）")
+            return
+        await tzstore.set(ctx.guild.id, name, ctx.author.id if personal else None)
+        await ctx.reply(f"✅ {'あなた' if personal else 'このサーバー'}のタイムゾーンを {name} にしました。")
+    except ValueError:
+        await ctx.reply("❌ タイムゾーン名が不正です。例: Asia/Tokyo / Asia/Singapore / UTC")
+    except Exception as e:
+        logging.error("timezone_cmd failed", exc_info=True)
+        await ctx.reply(f"❌ timezone error\n`{type(e).__name__}: {e}`")
+
 @bot.command(name="syncslash", aliases=["sync","fixslash","スラッシュ同期"])
 async def syncslash_cmd(ctx: commands.Context):
     try:
         if not ctx.guild:
             await ctx.reply("❌ サーバー内で実行してください")
             return
-        if not is_admin(ctx.author.id, ctx.guild.id):
+        if not await is_admin(ctx.author.id, ctx.guild.id):
             await ctx.reply("❌ Admin only")
             return
         # ギルド用コマンドを一旦クリアしてから、グローバル定義をコピー→同期
@@ -702,12 +641,11 @@ async def syncslash_cmd(ctx: commands.Context):
             bot.tree.copy_global_to(guild=ctx.guild)
         except Exception:
             pass
-        # グローバルとギルド両方を同期（片方だけの環境でもOK）
-        try:
-            await bot.tree.sync()
-        except Exception:
-            pass
-        updated = await bot.tree.sync(guild=ctx.guild)
+        # グローバルとギルド両方を同期（片方だけの環境でもOK）。同期したハッシュは startup が覚える
+        await startup.sync(None, force=True)
+        if not await startup.sync(ctx.guild, force=True):
+            raise RuntimeError("guild sync failed")
+        updated = bot.tree.get_commands(guild=ctx.guild)
         await ctx.reply(f"✅ Slash commands synced ({len(updated)} in guild). 再度 /assign や /指示 をお試しください。")
     except Exception as e:
         logging.error("syncslash_cmd failed", exc_info=True)
@@ -2,16 +2,6 @@
 import logging, sqlite3
 logger = logging.getLogger(__name__)
 
-# init_database が無ければスタブを用意
-try:
-    init_database
-except NameError:
-    def init_database():
-        try: logger.info("[init] スタブ実行（本体未定義）")
-        except Exception: pass
-        # DBファイルを触っておくだけ（本体があればそちらが使われる）
-        conn = sqlite3.connect('reminder_bot.db'); conn.close()
-
 # setup_roles が無ければスタブを用意
 try:
     setup_roles
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# assign.py - タスク作成の唯一の経路（TaskService.create）
+# 以前はメンション指示（2つ）・/指示（2つ）・文字の "/指示"・!指示・Reminderbot の !assign / /assign が
+# それぞれ INSERT・個人チャンネル探索・通知を持っていて、多くは未定義の send_task_notification で落ちて
+# 最低限のフォールバック通知になっていた。今はどの入口も「担当者・期日・タスク名」まで解析したら create() に渡す。
+# create() は段階ごとにまとめて流す：
+#   1. tasks を1トランザクションで全員分 INSERT（on_insert があればここで呼ぶ：スラッシュはここで応答する）
+#   2. 個人チャンネルを登録簿（channels.py）から引く。無い分だけ並列に作る（同時数は登録簿側で制限）
+#   3. 本文 → スレッド → 詳細 を担当者ごとに並行（同時 CONCURRENCY 件。宛先チャンネルが別ならバケットも別）
+#   4. thread_id / message_id を1トランザクションで書き戻す
+# 見た目（embed・ボタン・スレッド名・指示者への連絡）は Renderer だけが決める。Bot ごとに継承して差し替える。
+# 文言はギルドの表示モード（i18n.py）で送る前に決める（送った後に日本語へ edit し直すことはしない）。
+import asyncio, logging, time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+import i18n
+from channels import personal_channels as default_registry
+from delivery import CONCURRENCY
+from i18n import DEFAULT_MODE, display_modes
+from task import Task
+from taskcache import task_cache
+from timezones import to_epoch
+
+logger = logging.getLogger("taskbot")
+
+INSERT_SQL = ("INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name,due_date,message_id,channel_id) "
+              "VALUES (?,?,?,?,?,?,?)")
+
+
+def resolve_assignees(message: discord.Message, exclude: Iterable[int] = ()) -> List[discord.Member]:
+    """メンションされたユーザーとメンションされたロールのメンバー（Bot と重複は除く。出てきた順）"""
+    skip = set(exclude)
+    out: Dict[int, discord.Member] = {}
+    for m in [*message.mentions, *(m for r in message.role_mentions for m in r.members)]:
+        if m.bot or m.id in skip:
+            continue
+        out.setdefault(m.id, m)
+    return list(out.values())
+
+async def personal_channels(guild: discord.Guild, members: List[discord.Member],
+                            registry=None) -> Dict[int, Optional[discord.abc.Messageable]]:
+    """member.id -> 個人チャンネル（channels.py の登録簿。作れなければ DM、それも駄目なら None）"""
+    registry = registry or default_registry
+
+    async def _one(m: discord.Member):
+        try:
+            ch = await registry.resolve(guild, m)
+        except Exception as e:
+            logger.warning(f"[assign] personal channel for {m.id}: {type(e).__name__}: {e}")
+            ch = None
+        if ch is None:
+            try: ch = await m.create_dm()
+            except Exception: ch = None
+        return m.id, ch
+
+    return dict(await asyncio.gather(*(_one(m) for m in members)))
+
+
+class Renderer:
+    """新規タスクの通知の見た目。view(task_id, assignee_id, instructor_id, status) はボタン付きの View"""
+
+    def __init__(self, view: Optional[Callable[..., discord.ui.View]] = None):
+        self.view = view
+
+    def _view(self, t: Task) -> Optional[discord.ui.View]:
+        return self.view(t.id, t.assignee_id, t.instructor_id, t.status) if self.view else None
+
+    async def mode(self, guild: discord.Guild) -> str:
+        """guild の表示モード（create() が1回だけ引いて main / detail に渡す）"""
+        return await display_modes.get(guild.id)
+
+    def thread_name(self, t: Task) -> str:
+        return f"🟥 {t.name} - 詳細"
+
+    def main(self, t: Task, member: discord.Member, mode: str = DEFAULT_MODE) -> dict:
+        """個人チャンネルに出す本文（ch.send の引数）"""
+        emb = discord.Embed(title=f"📋 {t.name}", description=f"**{i18n.label(mode, 'due')}: <t:{t.due}:F>**",
+                            color=discord.Color.gold())
+        return {"content": member.mention, "embed": emb, "view": self._view(t)}
+
+    def detail(self, t: Task, instructor: discord.abc.User, mode: str = DEFAULT_MODE) -> dict:
+        """スレッドに出す詳細（thread.send の引数）"""
+        det = discord.Embed(title=f"📋 {i18n.label(mode, 'detail')}", color=discord.Color.blue())
+        det.add_field(name=i18n.label(mode, "instructor"), value=instructor.mention, inline=True)
+        det.add_field(name=i18n.label(mode, "status"), value=f"🟥 {i18n.status_name(mode, t.status)}", inline=True)
+        det.add_field(name=i18n.label(mode, "created"), value=f"<t:{int(time.time())}:f>", inline=True)
+        return {"embed": det, "view": self._view(t)}
+
+    async def announce(self, guild: discord.Guild, instructor: discord.abc.User,
+                       posted: List[Tuple[Task, discord.Member, Optional[discord.Thread]]]):
+        """全員分を出し終えた後に1回（指示者への連絡など。既定では何もしない）"""
+
+
+class AssignResult:
+    __slots__ = ("tasks", "posted", "failed", "elapsed")
+
+    def __init__(self, tasks: List[Task], posted: int, failed: List[discord.Member], elapsed: float):
+        self.tasks, self.posted, self.failed, self.elapsed = tasks, posted, failed, elapsed
+
+    @property
+    def task_ids(self) -> List[int]:
+        return [t.id for t in self.tasks]
+
+    def summary(self) -> str:
+        if not self.tasks:
+            return "❌ 作成に失敗しました。"
+        msg = f"✅ {len(self.tasks)}件のタスクを指示しました。"
+        if self.failed:
+            names = ", ".join(m.display_name for m in self.failed[:20])
+            more = f" ほか{len(self.failed) - 20}名" if len(self.failed) > 20 else ""
+            msg += f"\n⚠️ 通知できなかった担当者: {names}{more}"
+        return msg
+
+
+class TaskService:
+    def __init__(self, renderer: Optional[Renderer] = None, cache=task_cache, registry=None,
+                 concurrency: int = CONCURRENCY):
+        self.renderer = renderer or Renderer()
+        self.cache = cache
+        self.registry = registry
+        self.concurrency = concurrency
+        self.created = self.posted = self.failed = 0
+        self.seconds = 0.0
+
+    def stats(self) -> str:
+        avg = self.seconds / self.created * 1000 if self.created else 0.0
+        return f"assign created={self.created} posted={self.posted} failed={self.failed} avg={avg:.0f}ms/task"
+
+    async def create(self, guild: discord.Guild, instructor: discord.abc.User, members: List[discord.Member],
+                     name: str, due: datetime, origin: Optional[discord.Message] = None,
+                     on_insert: Optional[Callable[[List[Task]], Awaitable[None]]] = None) -> AssignResult:
+        """members 全員に name を指示する。due は指示者のタイムゾーンの datetime。
+        DB エラーは呼び出し側へ（1件も作られていない）。通知の失敗は result.failed に入る"""
+        t0 = time.perf_counter()
+        cache = self.cache
+        due_ts = to_epoch(due)
+        mid, cid = (origin.id, origin.channel.id) if origin is not None else (None, None)
+        ids = await cache.transaction(lambda c: [
+            cache.write(c, INSERT_SQL, (guild.id, instructor.id, m.id, name, due_ts, mid, cid)) for m in members])
+        rows = await cache.get_many(ids)
+        tasks = [rows[i] for i in ids]
+        if on_insert is not None:
+            try:
+                await on_insert(tasks)
+            except Exception as e:
+                logger.warning(f"[assign] on_insert failed: {type(e).__name__}: {e}")
+
+        channels = await personal_channels(guild, members, self.registry)
+        r = self.renderer
+        try:
+            mode = await r.mode(guild)
+        except Exception as e:
+            logger.warning(f"[assign] display mode for guild {guild.id}: {type(e).__name__}: {e}")
+            mode = DEFAULT_MODE
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def _post(t: Task, m: discord.Member):
+            ch = channels.get(m.id)
+            if ch is None:
+                return None
+            async with sem:
+                try:
+                    main = await ch.send(**r.main(t, m, mode))
+                except Exception as e:
+                    logger.warning(f"[assign] task {t.id} -> {m.id}: {type(e).__name__}: {e}")
+                    return None
+                if isinstance(ch, discord.DMChannel):
+                    return main, None                      # DM にはスレッドを作れない
+                try:
+                    th = await main.create_thread(name=r.thread_name(t), auto_archive_duration=60, reason="タスク詳細")
+                    await th.send(**r.detail(t, instructor, mode))
+                    return main, th
+                except Exception as e:
+                    logger.warning(f"[assign] thread for task {t.id} failed: {type(e).__name__}: {e}")
+                    return main, None
+
+        results = await asyncio.gather(*(_post(t, m) for t, m in zip(tasks, members)))
+        posted = [(t, m, res) for t, m, res in zip(tasks, members, results) if res is not None]
+        if posted:
+            try:
+                await cache.transaction(lambda c: [
+                    cache.write(c, "UPDATE tasks SET thread_id=COALESCE(?,thread_id), message_id=? WHERE id=?",
+                                (th.id if th else None, main.id, t.id), t.id) for t, _, (main, th) in posted])
+            except Exception as e:
+                logger.error(f"[assign] saving thread ids failed: {e}", exc_info=True)
+            try:
+                await r.announce(guild, instructor, [(t, m, th) for t, m, (_, th) in posted])
+            except Exception as e:
+                logger.warning(f"[assign] announce failed: {type(e).__name__}: {e}")
+        res = AssignResult(tasks, len(posted), [m for m, x in zip(members, results) if x is None],
+                           time.perf_counter() - t0)
+        self.created += len(tasks); self.posted += res.posted; self.failed += len(res.failed)
+        self.seconds += res.elapsed
+        logger.info(f"[assign] {len(tasks)} task(s) in guild {guild.id}: posted {res.posted}, "
+                    f"failed {len(res.failed)}, {res.elapsed * 1000:.0f} ms")
+        return res
@@ -0,0 +1,1661 @@
+# -*- coding: utf-8 -*-
+# bench.py - 性能計測スクリプト（Discord接続不要・一時DBで実行）
+# 使い方: python bench.py            … 全部
+#         python bench.py db         … 指定したものだけ
+import os, sys, time, random, sqlite3, tempfile
+from datetime import datetime, timedelta
+
+BENCHES = {}
+
+def bench(name):
+    def deco(fn):
+        BENCHES[name] = fn
+        return fn
+    return deco
+
+def _report(label: str, n: int, sec: float):
+    print(f"  {label:<36} {n/sec:>12,.0f} ops/s  ({sec*1000:.1f} ms / {n})")
+
+def _report_time(label: str, sec: float):
+    print(f"  {label:<36} {sec*1000:>12.1f} ms")
+
+def _tmp_db() -> str:
+    return os.path.join(tempfile.mkdtemp(prefix="bench_"), "reminder_bot.db")
+
+def _create_tasks(path: str, rows: int = 1000):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS tasks(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, instructor_id INTEGER, assignee_id INTEGER,
+        task_name TEXT, due_date TIMESTAMP, status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        message_id INTEGER, channel_id INTEGER, reminder_sent INTEGER DEFAULT 0, thread_id INTEGER)""")
+    now = int(time.time())
+    conn.executemany(
+        "INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name,due_date) VALUES (?,?,?,?,?)",
+        [(1, 10, 100 + i % 50, f"task {i}", now + 60 * i) for i in range(rows)])
+    conn.commit(); conn.close()
+
+
+# ---- user-001: 毎回 connect する db_exec と常駐プールの比較 ----
+@bench("db")
+def bench_db(n: int = 5000):
+    from db import Database
+    path = _tmp_db(); _create_tasks(path)
+
+    def legacy_db_exec(q, params=(), fetch=False):
+        conn = sqlite3.connect(path); cur = conn.cursor()
+        cur.execute(q, params); rows = cur.fetchall() if fetch else None
+        conn.commit(); conn.close(); return rows
+
+    rnd = random.Random(1)
+    ops = [(rnd.randint(1, 1000), rnd.random() < 0.2) for _ in range(n)]
+    sel = "SELECT * FROM tasks WHERE id=?"
+    upd = "UPDATE tasks SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?"
+
+    t = time.perf_counter()
+    for tid, write in ops:
+        if write: legacy_db_exec(upd, ("accepted", tid))
+        else: legacy_db_exec(sel, (tid,), fetch=True)
+    _report("db_exec (connect per call)", n, time.perf_counter() - t)
+
+    db = Database(path)
+    t = time.perf_counter()
+    for tid, write in ops:
+        if write: db.run(upd, ("accepted", tid))
+        else: db.run(sel, (tid,), fetch=True)
+    _report("Database pool", n, time.perf_counter() - t)
+    db.close()
+
+
+# ---- user-002: 同期DB呼び出しと DB スレッド経由でのループラグ比較 ----
+@bench("looplag")
+def bench_looplag(handlers: int = 200, hold_sec: float = 0.2):
+    import asyncio, threading
+    from db import Database, AsyncDatabase
+    from looplag import LoopLagMonitor
+    path = _tmp_db(); _create_tasks(path)
+    db = Database(path); adb = AsyncDatabase(db)
+    sel = "SELECT * FROM tasks WHERE id=?"
+    upd = "UPDATE tasks SET status='accepted', updated_at=CURRENT_TIMESTAMP WHERE id=?"
+
+    def hold_write_lock():
+        # 遅いディスク／長い書き込みトランザクションの代わり
+        c = sqlite3.connect(path); c.execute("BEGIN IMMEDIATE")
+        time.sleep(hold_sec); c.commit(); c.close()
+
+    async def sync_handler(i):
+        db.run(sel, (i % 1000 + 1,), fetch=True)
+        db.run(upd, (i % 1000 + 1,))
+
+    async def async_handler(i):
+        await adb.run(sel, (i % 1000 + 1,), fetch=True)
+        await adb.run(upd, (i % 1000 + 1,))
+
+    async def scenario(label, handler):
+        mon = LoopLagMonitor(interval=0.005, warn_ms=1e9)
+        mon.start(); await asyncio.sleep(0.05)
+        th = threading.Thread(target=hold_write_lock); th.start()
+        await asyncio.sleep(0.01)
+        t = time.perf_counter()
+        await asyncio.gather(*(handler(i) for i in range(handlers)))
+        sec = time.perf_counter() - t
+        th.join(); await asyncio.sleep(0.05); mon.stop()
+        print(f"  {label:<36} max lag {mon.max_ms:7.1f} ms  avg {mon.avg_ms:5.2f} ms"
+              f"  ({sec*1000:.0f} ms / {handlers} handlers)")
+
+    async def main():
+        await scenario("sqlite3 on event loop", sync_handler)
+        await scenario("AsyncDatabase (db thread)", async_handler)
+    asyncio.run(main())
+    adb.close(); db.close()
+
+
+# ---- user-003: 古い reminder_bot.db（thread_id / reminder_sent 無し）のマイグレーション時間 ----
+# （結果の中身は tests/test_schema.py）
+@bench("migrate")
+def bench_migrate(rows: int = 20000):
+    import schema
+    from db import Database
+    path = _tmp_db()
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE tasks(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, instructor_id INTEGER, assignee_id INTEGER,
+        task_name TEXT, due_date TIMESTAMP, status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        message_id INTEGER, channel_id INTEGER)""")
+    conn.executemany("INSERT INTO tasks (guild_id,assignee_id,task_name,due_date) VALUES (1,?,?,?)",
+                     [(i, f"old {i}", "2025-08-23 18:00:00") for i in range(rows)])
+    conn.commit(); conn.close()
+
+    t = time.perf_counter()
+    db = Database(path)
+    sec = time.perf_counter() - t
+    db.close()
+    _report_time(f"migrate old db ({rows} rows) -> v{schema.LATEST}", sec)
+
+    t = time.perf_counter()
+    db = Database(path)   # 2回目は何もしない
+    _report_time("re-open (already migrated)", time.perf_counter() - t)
+    db.close()
+
+
+# ---- user-004: ホットクエリのインデックス（100万行）。プランの回帰チェックは tests/test_schema.py ----
+@bench("indexes")
+def bench_indexes(rows: int = 1_000_000, reps: int = 200):
+    import schema
+    path = _tmp_db()
+    conn = sqlite3.connect(path, isolation_level=None)
+    schema.migrate(conn, target=2)          # インデックス無しの状態
+    rnd = random.Random(4)
+    base = datetime(2025, 1, 1)
+    base_ts = int(base.timestamp())
+    statuses = ("pending", "accepted", "accepted", "completed", "completed", "completed", "declined")
+    def gen():
+        for i in range(rows):
+            st = rnd.choice(statuses)
+            due = base_ts + 60 * rnd.randint(0, 2 * 365 * 24 * 60)
+            yield (i % 200, 10, 100 + i % 5000, f"task {i}", due, st,
+                   rnd.random() < 0.5, (900000 + i) if rnd.random() < 0.3 else None,
+                   (base + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"))
+    t = time.perf_counter()
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name,due_date,status,"
+                     "reminder_sent,thread_id,updated_at) VALUES (?,?,?,?,?,?,?,?,?)", gen())
+    conn.execute("COMMIT")
+    _report_time(f"seed {rows:,} rows", time.perf_counter() - t)
+
+    now = base_ts + 200 * 86400
+    cases = ("open_by_due", "fixcolor")
+    def params_for(name, i):
+        if name == "open_by_due":
+            return (now + 60 * i,)
+        if name == "fixcolor":
+            return (900000 + i * 97,)
+        return ()
+    def run(label):
+        for name in cases:
+            sql, _ = schema.HOT_QUERIES[name]
+            n = max(1, reps // 20) if label == "no index" else reps
+            t = time.perf_counter()
+            for i in range(n):
+                conn.execute(sql, params_for(name, i)).fetchall()
+            _report(f"{name} ({label})", n, time.perf_counter() - t)
+
+    run("no index")
+    t = time.perf_counter()
+    schema.migrate(conn, target=3)
+    _report_time("build indexes (migration 3)", time.perf_counter() - t)
+    schema.migrate(conn)
+    run("indexed")
+    conn.close()
+
+
+# ---- user-005/006: イベント駆動リマインダの発火遅れ（旧: 5分ポーリング）と再起動時の二重送信 ----
+@bench("scheduler")
+def bench_scheduler(n: int = 2000, backlog: int = 300_000, spread: float = 2.0):
+    import asyncio
+    from db import Database, AsyncDatabase
+    from scheduler import ReminderScheduler
+    path = _tmp_db()
+    db = Database(path); adb = AsyncDatabase(db)
+    later = int(time.time()) + 86400
+    t = time.perf_counter()
+    db.executemany("INSERT INTO reminders (id,task_id,kind,fire_at) VALUES (?,?,'before_1440',?)",
+                   [(n + 1 + i, n + 1 + i, later + i) for i in range(backlog)])
+    start = int(time.time()) + 1            # fire_at は秒単位
+    fire = {i + 1: start + int(spread * i / n) for i in range(n)}
+    db.executemany("INSERT INTO reminders (id,task_id,kind,fire_at) VALUES (?,?,'before_60',?)",
+                   [(rid, rid, ts) for rid, ts in fire.items()])
+    _report_time(f"seed {n + backlog:,} pending reminder rows", time.perf_counter() - t)
+    lateness, sent = [], []
+
+    async def send(batch):
+        now = time.time()
+        for rid, tid, kind in batch:
+            sent.append(rid)
+            lateness.append(now - fire[rid])
+
+    async def main():
+        sch = ReminderScheduler(send, adb=adb)
+        t = time.perf_counter()
+        await sch.load()
+        _report_time(f"load horizon ({len(sch)} in memory)", time.perf_counter() - t)
+        sch.start()
+        await asyncio.sleep(start + spread + 0.3 - time.time())
+        sch.stop()
+        # 再起動を模して読み直す：送信済みは sent_at 済みなので何も送らない
+        sch2 = ReminderScheduler(send, adb=adb)
+        await sch2.load()
+        return await sch2.fire_due()
+
+    refired = asyncio.run(main())
+    assert sorted(sent) == sorted(fire), "missing or duplicate reminders"
+    assert refired == 0
+    lateness.sort()
+    print(f"  scheduler: {n} reminders  p50 late {lateness[n//2]*1000:.1f} ms"
+          f"  p99 {lateness[int(n*0.99)]*1000:.1f} ms  max {lateness[-1]*1000:.1f} ms")
+    print("  5-min poll (old): avg late 150000 ms, max 300000 ms")
+    print("  restart: 0 re-sent (sent_at marker)")
+    adb.close(); db.close()
+
+
+# ---- user-007: リマインダ配信（1件ずつ直列 vs 宛先ごとにまとめて並行） ----
+class _FakeHTTP:
+    """discord.py の HTTPClient もどき：1リクエスト latency 秒、ルート（宛先）ごとに
+    window 秒あたり limit 回のバケット（本物は 5回/5秒 程度。ここでは時間を1/100にしている）。
+    バケットが空なら discord.py と同じくリセットまで待つ（waits に数える）"""
+
+    def __init__(self, latency: float = 0.001, limit: int = 5, window: float = 0.05):
+        import asyncio
+        self.latency, self.limit, self.window = latency, limit, window
+        self.buckets, self.locks = {}, {}
+        self.requests = self.waits = 0
+        self._asyncio = asyncio
+
+    async def send(self, route, n_embeds: int = 1):
+        lock = self.locks.setdefault(route, self._asyncio.Lock())
+        async with lock:
+            now = time.perf_counter()
+            start, used = self.buckets.get(route, (now, 0))
+            if now - start >= self.window:
+                start, used = now, 0
+            if used >= self.limit:
+                self.waits += 1
+                await self._asyncio.sleep(start + self.window - now)
+                start, used = time.perf_counter(), 0
+            self.buckets[route] = (start, used + 1)
+        self.requests += 1
+        await self._asyncio.sleep(self.latency)
+
+@bench("delivery")
+def bench_delivery(n: int = 10_000, users: int = 200, legacy_n: int = 1000):
+    import asyncio
+    from db import Database, AsyncDatabase
+    from scheduler import ReminderScheduler
+    from delivery import deliver
+    path = _tmp_db()
+    db = Database(path); adb = AsyncDatabase(db)
+    due = int(time.time()) + 3600
+    past = int(time.time()) - 1
+    db.executemany("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,due_date,status) "
+                   "VALUES (?,1,10,?,?,?,'accepted')",
+                   [(i, 100 + i % users, f"task {i}", due) for i in range(1, n + 1)])
+    db.executemany("INSERT INTO reminders (task_id,kind,fire_at) VALUES (?,'before_60',?)",
+                   [(i, past) for i in range(1, n + 1)])
+
+    # 旧 check_reminders：1件ずつ SELECT → 送信 → UPDATE（自動コミット）
+    async def legacy(http):
+        rows = await adb.query("SELECT task_id FROM reminders WHERE sent_at IS NULL ORDER BY id LIMIT ?", (legacy_n,))
+        for (tid,) in rows:
+            t = await adb.query_one("SELECT assignee_id,task_name FROM tasks WHERE id=?", (tid,))
+            await http.send(t[0])
+            await adb.execute("UPDATE tasks SET reminder_sent=1 WHERE id=?", (tid,))
+
+    # 新：BATCH 件ずつ取り合い（1トランザクション）→ タスクは1クエリ → 宛先ごとに並行送信
+    async def batched(http):
+        delivered = [0]
+        async def send(batch):
+            ids = [tid for _, tid, _ in batch]
+            rows = await adb.query(f"SELECT id,assignee_id,task_name FROM tasks WHERE id IN ({','.join('?' * len(ids))})", tuple(ids))
+            items = [(aid, name) for _, aid, name in rows]
+            async def post(route, part):
+                await http.send(route, len(part))
+            ok, failed = await deliver(items, post)
+            delivered[0] += ok
+        sch = ReminderScheduler(send, adb=adb)
+        claimed = await sch.fire_due()
+        return claimed, delivered[0]
+
+    old = _FakeHTTP()
+    t = time.perf_counter()
+    asyncio.run(legacy(old))
+    _report(f"serial, 1 msg per reminder ({legacy_n})", legacy_n, time.perf_counter() - t)
+
+    new = _FakeHTTP()
+    t = time.perf_counter()
+    claimed, delivered = asyncio.run(batched(new))
+    _report(f"batched + grouped ({n})", n, time.perf_counter() - t)
+    assert claimed == delivered == n, (claimed, delivered)
+    assert db.query_one("SELECT COUNT(*) FROM reminders WHERE sent_at IS NULL")[0] == 0
+    print(f"  requests: {old.requests} for {legacy_n} (old) vs {new.requests} for {n} (new),"
+          f" bucket waits {new.waits}")
+    adb.close(); db.close()
+
+
+# ---- user-008: スレッド色の同期（15秒ポーリング vs 変更イベント）の1時間あたり REST 回数 ----
+@bench("threadsync")
+def bench_threadsync(threads: int = 300, cached: float = 0.7, changes: int = 20):
+    import asyncio, discord
+    from db import Database, AsyncDatabase
+    from threadsync import ThreadReconciler, renamed
+    from renamer import ThreadRenamer
+
+    class FakeThread(discord.Thread):
+        def __init__(self, tid, name):
+            self.id, self.name, self.edits = tid, name, 0
+        async def edit(self, *, name):
+            self.name = name; self.edits += 1
+
+    class FakeClient:
+        def __init__(self, ths):
+            self.threads, self.fetches = ths, 0
+            self.cache = {t.id: t for t in ths.values() if rnd.random() < cached}
+        def get_channel(self, tid):
+            return self.cache.get(tid)
+        async def fetch_channel(self, tid):
+            self.fetches += 1
+            return self.threads[tid]
+
+    rnd = random.Random(8)
+    path = _tmp_db()
+    db = Database(path); adb = AsyncDatabase(db)
+    statuses = ("pending", "accepted", "completed")
+    rows = [(i, 900000 + i, rnd.choice(statuses)) for i in range(1, threads + 1)]
+    db.executemany("INSERT INTO tasks (id,guild_id,thread_id,status,task_name) VALUES (?,1,?,?,'t')", rows)
+    ths = {th: FakeThread(th, renamed(f"task {tid}", st)) for tid, th, st in rows}
+
+    # 旧 color_enforcer：15秒ごとに直近50件、キャッシュに無ければ fetch_channel（名前が合っていても）
+    client = FakeClient(ths)
+    async def legacy_hour():
+        recent = db.query("SELECT thread_id, status FROM tasks WHERE thread_id IS NOT NULL "
+                          "ORDER BY updated_at DESC, id DESC LIMIT 50")
+        for _ in range(3600 // 15):
+            for th, st in recent:
+                ch = client.get_channel(th) or await client.fetch_channel(th)
+                new = renamed(ch.name, st)
+                if new != ch.name: await ch.edit(name=new)
+    asyncio.run(legacy_hour())
+    old_calls = client.fetches + sum(t.edits for t in ths.values())
+
+    # 新：起動時 sweep 1回 + 状態変更イベント changes 件（同じ状態への変更を含む）
+    for t in ths.values(): t.edits = 0
+    client = FakeClient(ths)
+    async def event_hour():
+        rs = ThreadReconciler(client, adb=adb, renamer=ThreadRenamer(per=0.05))
+        await rs.sweep(); await rs.drain()
+        idle = client.fetches + sum(t.edits for t in ths.values())
+        for _ in range(changes):
+            tid, th, _ = rnd.choice(rows)
+            st = rnd.choice(statuses)
+            db.execute("UPDATE tasks SET status=? WHERE id=?", (st, tid))
+            await rs.task_changed(tid, st)
+        await rs.drain()
+        return rs, idle
+    rs, idle = asyncio.run(event_hour())
+    new_calls = client.fetches + sum(t.edits for t in ths.values())
+    final = dict(db.query("SELECT thread_id, status FROM tasks"))
+    assert all(ths[th].name == renamed(ths[th].name, st) for th, st in final.items()), "thread out of sync"
+    print(f"  {'color_enforcer (15s poll), idle hour':<40} {old_calls:>6} REST calls")
+    print(f"  {'threadsync, idle hour':<40} {idle:>6} REST calls")
+    print(f"  {f'threadsync, {changes} status changes':<40} {new_calls:>6} REST calls"
+          f"  ({rs.renames} renames, {rs.fetches} fetches, {rs.skipped} skipped)")
+    adb.close(); db.close()
+
+
+# ---- user-009: スレッド名変更のスケジューラ（クールダウンで捨てる旧方式との比較） ----
+@bench("renamer")
+def bench_renamer(threads: int = 40, changes: int = 5, span: float = 1.0, scale: float = 1500.0):
+    """時間は 1/scale に縮めて実行（10分2回 → 0.4秒2回、旧クールダウン30秒 → 0.02秒）"""
+    import asyncio, discord
+    from renamer import ThreadRenamer, RATE, PER
+    per, cooldown = PER / scale, 30.0 / scale
+
+    class FakeThread(discord.Thread):
+        def __init__(self, tid):
+            self.id, self.name, self.log = tid, "🟥 task", []
+        async def edit(self, *, name):
+            self.name = name; self.log.append(time.perf_counter())
+
+    rnd = random.Random(9)
+    emojis = ("🟥", "🟨", "🟩", "⚠️")
+    plan = {tid: sorted((rnd.uniform(0, span), rnd.choice(emojis) + " task") for _ in range(changes))
+            for tid in range(1, threads + 1)}
+
+    async def run(apply):
+        ths = {tid: FakeThread(tid) for tid in plan}
+        t0 = time.perf_counter()
+        async def feed(tid):
+            for at, name in plan[tid]:
+                await asyncio.sleep(max(0.0, t0 + at - time.perf_counter()))
+                await apply(ths[tid], name)
+        await asyncio.gather(*(feed(tid) for tid in plan))
+        return ths
+
+    def violations(ths):
+        # どの per 秒の窓にも RATE 回を超える変更があってはいけない
+        return sum(1 for th in ths.values() for a, b in zip(th.log, th.log[RATE:]) if b - a < per * 0.99)
+
+    def stale(ths):
+        return sum(1 for tid, th in ths.items() if th.name != plan[tid][-1][1])
+
+    # 旧：クールダウン中の rename は捨てる（Reminderbot の RENAME_COOLDOWN_SEC / _last_rename_at）
+    last = {}
+    async def legacy(th, name):
+        now = time.perf_counter()
+        if now - last.get(th.id, -1e9) < cooldown or name == th.name:
+            return
+        last[th.id] = now
+        await th.edit(name=name)
+    ths = asyncio.run(run(legacy))
+    print(f"  cooldown (old):  {sum(len(t.log) for t in ths.values()):>4} edits, "
+          f"{violations(ths):>3} over Discord's limit, {stale(ths):>3}/{threads} stale names")
+
+    async def scheduled():
+        rn = ThreadRenamer(per=per, max_threads=threads)
+        async def apply(th, name):
+            rn.request(th, name)
+        ths = await run(apply)
+        await rn.flush()
+        return ths, rn
+    t = time.perf_counter()
+    ths, rn = asyncio.run(scheduled())
+    elapsed = time.perf_counter() - t
+    print(f"  renamer (new):   {sum(len(t.log) for t in ths.values()):>4} edits, "
+          f"{violations(ths):>3} over Discord's limit, {stale(ths):>3}/{threads} stale names"
+          f"  ({rn.coalesced} coalesced, {rn.deferred} deferred, done in {elapsed:.2f}s)")
+    assert violations(ths) == 0 and stale(ths) == 0
+    assert len(rn) <= threads
+
+
+# ---- user-010: ボタン押下から応答（ack）までの時間（旧: 重ねたリスナー群 vs 単一ディスパッチャ） ----
+class _FakeResponse:
+    def __init__(self):
+        self.done_at = None
+        self.deferred = False
+    def is_done(self):
+        return self.done_at is not None
+    async def edit_message(self, *a, **kw):
+        self.done_at = time.perf_counter()
+    send_message = edit_message
+    async def defer(self, **kw):
+        self.deferred = True
+        await self.edit_message()
+
+class _FakeFollowup:
+    def __init__(self):
+        self.sent = 0
+    async def send(self, *a, **kw):
+        self.sent += 1
+
+class _FakeInteraction:
+    def __init__(self, cid: str, user_id: int, component: bool = True):
+        import discord
+        from datetime import timezone
+        self.type = discord.InteractionType.component if component else discord.InteractionType.application_command
+        self.data = {"custom_id": cid}
+        self.user = type("U", (), {"id": user_id})()
+        self.response = _FakeResponse()
+        self.followup = _FakeFollowup()
+        self.message = None
+        self.guild = None
+        self.created = time.perf_counter()
+        self.created_at = datetime.now(timezone.utc)
+    async def edit_original_response(self, **kw):
+        await self.followup.send(**kw)
+
+def _percentiles(vals):
+    vals = sorted(vals)
+    return vals[len(vals) // 2], vals[int(len(vals) * 0.99)], vals[-1]
+
+@bench("dispatch")
+def bench_dispatch(tasks: int = 2000, clicks: int = 2000, burst: int = 50):
+    import asyncio, re
+    from db import Database, AsyncDatabase
+    from dispatch import Dispatcher, TASK_ACTIONS, transition as apply
+    path = _tmp_db()
+    db = Database(path); adb = AsyncDatabase(db)
+    due = int(time.time()) + 86400
+    db.executemany("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,due_date,status,thread_id) "
+                   "VALUES (?,1,10,?,?,?,'pending',?)",
+                   [(i, 100 + i % 50, f"task {i}", due, 900000 + i) for i in range(1, tasks + 1)])
+    rnd = random.Random(10)
+    plan = [(rnd.choice(list(TASK_ACTIONS)), rnd.randint(1, tasks)) for _ in range(clicks)]
+
+    # 旧：TaskView のコールバック（SELECT → UPDATE → SELECT）と、同じクリックを受ける
+    # on_interaction（正規表現 + SELECT）・__link_rename_notify（0.30秒待って SELECT）が並走
+    async def legacy(inter, action, tid):
+        async def button():
+            t = await adb.run("SELECT * FROM tasks WHERE id=?", (tid,), True)
+            if not t or inter.user.id != t[0][3]:
+                await inter.response.send_message(content="x"); return
+            await adb.run("UPDATE tasks SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?", (TASK_ACTIONS[action], tid))
+            t2 = (await adb.run("SELECT * FROM tasks WHERE id=?", (tid,), True))[0]
+            await inter.response.edit_message(embed=t2)
+        async def listener():
+            m = re.match(r"^(accept_task|decline_task|complete_task|abandon_task|undo_completion)_(\d+)$", inter.data["custom_id"])
+            await adb.run("SELECT assignee_id, instructor_id, status FROM tasks WHERE id = ?", (int(m.group(2)),), True)
+        async def rename_notify():
+            re.match(r"^(accept_task|complete_task|undo_completion|abandon_task|decline_task)_(\d+)$", inter.data["custom_id"])
+            await asyncio.sleep(0.30)
+            await adb.query_one("SELECT instructor_id,assignee_id,task_name,due_date,status,thread_id FROM tasks WHERE id=?", (tid,))
+        await asyncio.gather(button(), listener(), rename_notify())
+
+    d = Dispatcher()
+    @d.route(*TASK_ACTIONS)
+    async def transition(ack, action, tid):
+        res, thread_id, t = await apply(adb, tid, ack.inter.user.id, action)
+        if res != "ok":
+            await ack.send(content="x"); return
+        await ack.edit(embed=t)
+
+    async def run(handle):
+        acks = []
+        for i in range(0, clicks, burst):
+            inters = [_FakeInteraction(f"{a}_{tid}", 100 + tid % 50) for a, tid in plan[i:i + burst]]
+            await asyncio.gather(*(handle(it) for it in inters))
+            acks += [(it.response.done_at - it.created) * 1000 for it in inters]
+        return acks
+
+    async def old_handle(it):
+        a, _, n = it.data["custom_id"].rpartition("_")
+        await legacy(it, a, int(n))
+
+    for label, handle in (("stacked listeners (old)", old_handle), ("dispatcher (new)", d.dispatch)):
+        t = time.perf_counter()
+        acks = asyncio.run(run(handle))
+        p50, p99, mx = _percentiles(acks)
+        print(f"  {label:<28} ack p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {mx:6.2f} ms"
+              f"  ({clicks / (time.perf_counter() - t):,.0f} clicks/s)")
+    assert d.handled == clicks
+    adb.close(); db.close()
+
+
+# ---- user-010: Reminderbot のボタン（旧: ボタンごとの callback で後続を順に vs dispatcher + 並行） ----
+@bench("reminderbot_click")
+def bench_reminderbot_click(clicks: int = 400, burst: int = 20, fetch: float = 0.08, send: float = 0.12):
+    """REST は fetch_channel fetch 秒・DM 送信 send 秒の待ちで模擬。ack はメッセージの edit、done は後続が全部済んだ時刻"""
+    import asyncio, discord
+    from db import Database, AsyncDatabase
+    from dispatch import Dispatcher, TASK_ACTIONS, transition
+    from interactions import InteractionLifecycle
+    from renamer import ThreadRenamer
+    from scheduler import ReminderScheduler
+    from taskcache import TaskCache
+    from threadsync import ThreadReconciler, renamed
+
+    class FakeThread(discord.Thread):
+        def __init__(self, tid):
+            self.id, self.name, self.edited = tid, "🟥 task - 詳細", None
+        async def edit(self, *, name):
+            self.name, self.edited = name, time.perf_counter()
+            return self
+
+    class FakeClient:
+        def __init__(self):
+            self.threads = {}
+        def get_channel(self, tid):
+            return None                              # キャッシュに無い（毎回 fetch）
+        async def fetch_channel(self, tid):
+            await asyncio.sleep(fetch)
+            return self.threads.setdefault(tid, FakeThread(tid))
+
+    def setup():
+        path = _tmp_db()
+        db = Database(path); adb = AsyncDatabase(db)
+        due = int(time.time()) + 7 * 86400
+        db.executemany("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,due_date,thread_id) "
+                       "VALUES (?,1,10,?,?,?,?)", [(i, 100 + i, f"task {i}", due, 900000 + i) for i in range(1, clicks + 1)])
+        return db, adb, TaskCache(adb), ReminderScheduler(lambda rows: None, adb=adb), FakeClient()
+
+    async def notify(done, tid):
+        await asyncio.sleep(send)                    # 指示者への DM
+        done[tid] = time.perf_counter()
+
+    # 旧：_BaseBtn._transition。ack の後に on_status → _rename_thread（get + fetch_channel）→ 通知を順に
+    async def legacy(adb, cache, sched, client, lc, its, done):
+        rn = ThreadRenamer()
+        async def work(ack, tid):
+            res, _, t = await transition(adb, tid, ack.inter.user.id, "accept_task", cache=cache)
+            await ack.edit(embed=t)
+            await sched.on_status(t.id, "accepted", t.due, t.guild_id)
+            t = await cache.get(tid)
+            th = await client.fetch_channel(t.thread_id)
+            rn.request(th, renamed(th.name, "accepted"))
+            await notify(done, tid)
+        await asyncio.gather(*(lc.run(it, "accept_task", lambda ack, tid=tid: work(ack, tid)) for tid, it in its))
+        await lc.drain(); await rn.flush()
+
+    # 新：dispatcher の1経路。ack の後はスレッド名を publish、リマインダと通知は spawn して並行に
+    async def dispatched(adb, cache, sched, client, lc, its, done):
+        rs = ThreadReconciler(client, adb=adb, renamer=ThreadRenamer(), cache=cache)
+        rs.start()
+        d = Dispatcher(lc)
+        @d.route(*TASK_ACTIONS)
+        async def on_task_action(ack, action, tid):
+            res, thread_id, t = await transition(adb, tid, ack.inter.user.id, action, cache=cache)
+            await ack.edit(embed=t)
+            rs.publish(thread_id, TASK_ACTIONS[action])
+            lc.spawn(sched.on_status(t.id, TASK_ACTIONS[action], t.due, t.guild_id))
+            lc.spawn(notify(done, tid))
+        await asyncio.gather(*(d.dispatch(it) for _, it in its))
+        await lc.drain()
+        while any(getattr(client.threads.get(900000 + tid), "edited", None) is None for tid, _ in its):
+            await asyncio.sleep(0.005)               # スレッド名はワーカーが1件ずつ
+        rs.stop()
+
+    for label, fn in (("per-button callbacks (old)", legacy), ("dispatcher + fan-out (new)", dispatched)):
+        db, adb, cache, sched, client = setup()
+        lc = InteractionLifecycle()
+        acks, dones, done = [], [], {}
+        async def main():
+            for i in range(1, clicks + 1, burst):
+                its = [(tid, _FakeInteraction(f"accept_task_{tid}", 100 + tid)) for tid in range(i, min(i + burst, clicks + 1))]
+                await fn(adb, cache, sched, client, lc, its, done)
+                for tid, it in its:
+                    th = client.threads.get(900000 + tid)
+                    acks.append((it.response.done_at - it.created) * 1000)
+                    dones.append((max(done[tid], th.edited) - it.created) * 1000)
+        t = time.perf_counter()
+        asyncio.run(main())
+        sec = time.perf_counter() - t
+        a50, a99, _ = _percentiles(acks)
+        d50, d99, _ = _percentiles(dones)
+        print(f"  {label:<28} ack p50 {a50:6.2f} ms  p99 {a99:6.2f} ms   done p50 {d50:6.0f} ms  p99 {d99:6.0f} ms"
+              f"  ({clicks / sec:,.0f} clicks/s)")
+        assert db.query_one("SELECT COUNT(*) FROM tasks WHERE status='accepted'")[0] == clicks
+        adb.close(); db.close()
+
+
+# ---- user-011: 締切（3秒）に対する ack の保証（全部終えてから応答 vs lifecycle） ----
+@bench("ack")
+def bench_ack(n: int = 400, scale: float = 20.0):
+    """時間は 1/scale（締切 3秒 → 0.15秒、予算 1.5秒 → 0.075秒）。REST は 0.2〜5秒相当の待ちで模擬"""
+    import asyncio
+    from interactions import InteractionLifecycle, AckHistogram, ACK_BUDGET
+    deadline = 3.0 / scale
+    rnd = random.Random(11)
+    jobs = [("assign" if i % 2 else "accept_task", rnd.uniform(0.2, 5.0) / scale) for i in range(n)]
+
+    # 旧：DB・チャンネル作成・送信を全部終えてから response
+    async def legacy():
+        hist = AckHistogram()
+        async def one(name, rest):
+            it = _FakeInteraction(f"{name}_1", 1, component=(name != "assign"))
+            await asyncio.sleep(0.002)           # DB
+            await asyncio.sleep(rest)            # チャンネル・スレッド作成など
+            await it.response.send_message("ok")
+            hist.record(name, (it.response.done_at - it.created) * 1000)
+            return it
+        return hist, await asyncio.gather(*(one(*j) for j in jobs))
+
+    # 新：DB が済んだら即応答、残りはバックグラウンド。間に合わなければ予算で defer
+    async def managed():
+        lc = InteractionLifecycle(budget=ACK_BUDGET / scale)
+        async def one(name, rest):
+            it = _FakeInteraction(f"{name}_1", 1, component=(name != "assign"))
+            async def work(ack):
+                await asyncio.sleep(0.002)
+                if rnd.random() < 0.5:           # 半分は応答前に REST が要る処理（予算切れで defer される）
+                    await asyncio.sleep(rest)
+                    await ack.send("ok")
+                else:
+                    await ack.send("ok")
+                    await asyncio.sleep(rest)
+            await lc.run(it, name, work)
+            return it
+        its = await asyncio.gather(*(one(*j) for j in jobs))
+        await lc.drain()
+        return lc.hist, its
+
+    for label, fn in (("respond after work (old)", legacy), ("lifecycle (new)", managed)):
+        hist, its = asyncio.run(fn())
+        late = sum(1 for it in its if it.response.done_at - it.created > deadline)
+        print(f"  {label:<26} {late:>4}/{n} past the deadline, {sum(it.response.deferred for it in its):>4} deferred")
+        for name in sorted(hist.counts):
+            p50, p99 = hist.percentile(name, 0.5) * scale, hist.percentile(name, 0.99) * scale
+            print(f"    {name:<14} p50 ≤ {p50:>6.0f} ms  p99 ≤ {p99:>6.0f} ms  (real-time equivalent)")
+        if label.startswith("lifecycle"):
+            assert late == 0
+            assert all(it.followup.sent or not it.response.deferred for it in its)
+
+
+# ---- user-012: tasks の write-through キャッシュ（DB 直読みとの比較。整合性は tests/test_taskcache.py） ----
+@bench("taskcache")
+def bench_taskcache(tasks: int = 2000, reads: int = 20000, burst: int = 20):
+    import asyncio
+    from db import Database, AsyncDatabase
+    from taskcache import TaskCache
+    rnd = random.Random(12)
+    path = _tmp_db()
+    db = Database(path); adb = AsyncDatabase(db)
+    db.executemany("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,due_date,thread_id) "
+                   "VALUES (?,1,10,?,?,?,?)",
+                   [(i, 100 + i % 50, f"task {i}", int(time.time()), 500000 + i) for i in range(1, tasks + 1)])
+    hot = [rnd.randint(1, tasks) for _ in range(reads)]
+
+    # 旧：クリック・!色直す のたびに SELECT
+    async def direct():
+        t0 = time.perf_counter()
+        for tid in hot:
+            await adb.query_one("SELECT * FROM tasks WHERE id=?", (tid,))
+            await adb.query_one("SELECT status FROM tasks WHERE thread_id=?", (500000 + tid,))
+        return time.perf_counter() - t0
+
+    async def cached():
+        cache = TaskCache(adb)
+        t0 = time.perf_counter()
+        for tid in hot:
+            await cache.get(tid)
+            await cache.status_by_thread(500000 + tid)
+        return time.perf_counter() - t0, cache
+
+    _report("SELECT per read (old)", reads * 2, asyncio.run(direct()))
+    sec, cache = asyncio.run(cached())
+    _report("task cache", reads * 2, sec)
+    print(f"  {cache.stats()}")
+
+    # 読み取りと並行して別の行への書き込みが走る（クリックが続く時）。捨てるのは書き込まれた行だけ
+    async def mixed():
+        cache = TaskCache(adb)
+        t0 = time.perf_counter()
+        for i in range(0, reads, burst):
+            ops = [cache.get(tid) for tid in hot[i:i + burst]]
+            ops.append(cache.execute("UPDATE tasks SET status='accepted' WHERE id=?", (hot[i],), hot[i]))
+            await asyncio.gather(*ops)
+        return time.perf_counter() - t0, cache
+
+    sec, cache = asyncio.run(mixed())
+    _report(f"task cache, 1 write per {burst} reads", reads, sec)
+    print(f"  {cache.stats()}")
+    adb.close(); db.close()
+
+
+# ---- user-013: tasks 行をタプルで持つか Task（__slots__・期日は epoch 済み）で持つか ----
+@bench("task")
+def bench_task(n: int = 20000, embeds: int = 20000):
+    import tracemalloc, discord
+    from task import COLUMNS, Task, task_factory
+    rnd = random.Random(13)
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE tasks({', '.join(COLUMNS)})")
+    base = datetime(2025, 8, 1, 9, 0)
+    conn.executemany(f"INSERT INTO tasks VALUES ({','.join('?' * len(COLUMNS))})",
+                     [(i, 1, 10, 100 + i % 50, f"task {i}", str(base + timedelta(minutes=rnd.randint(0, 99999))),
+                       rnd.choice(("pending", "accepted", "completed")), 900000 + i, 800000, 700000 + i,
+                       "2025-08-01 09:00:00")
+                      for i in range(n)])
+    sql = f"SELECT {', '.join(COLUMNS)} FROM tasks"
+
+    def footprint(fetch):
+        tracemalloc.start()
+        rows = fetch()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return rows, size
+
+    tuples, tsize = footprint(lambda: conn.execute(sql).fetchall())
+    def as_tasks():
+        cur = conn.execute(sql); cur.row_factory = task_factory
+        return cur.fetchall()
+    records, rsize = footprint(as_tasks)
+    print(f"  {'tuple row':<36} {tsize / n:>8.0f} bytes / task")
+    print(f"  {'Task (__slots__, epoch due)':<36} {rsize / n:>8.0f} bytes / task")
+
+    # 旧 build_embed：毎回 due_date を文字列から読み直す
+    def embed_tuple(trow):
+        try: due_ts = int(datetime.fromisoformat(str(trow[5])).timestamp())
+        except Exception: due_ts = int(datetime.strptime(str(trow[5]), "%Y-%m-%d %H:%M:%S").timestamp())
+        emb = discord.Embed(title=f"📋 {trow[4]}")
+        emb.add_field(name="Due Date", value=f"<t:{due_ts}:F>"); emb.add_field(name="Status", value=trow[6])
+        return emb
+    def embed_task(t: Task):
+        emb = discord.Embed(title=f"📋 {t.name}")
+        emb.add_field(name="Due Date", value=f"<t:{t.due}:F>"); emb.add_field(name="Status", value=t.status)
+        return emb
+    pick = [rnd.randrange(n) for _ in range(embeds)]
+    for label, fn, rows in (("build_embed from tuple (old)", embed_tuple, tuples),
+                            ("build_embed from Task", embed_task, records)):
+        t0 = time.perf_counter()
+        out = [fn(rows[k]) for k in pick]
+        _report(label, embeds, time.perf_counter() - t0)
+        assert len(out) == embeds
+    assert all(embed_tuple(tuples[k]).to_dict() == embed_task(records[k]).to_dict() for k in pick[:200])
+    conn.close()
+
+
+# ---- user-014: parse_date（コンパイル済み1パス＋分単位メモ）と旧実装の比較。コーパスと正しさは tests/test_dateparse.py ----
+def _legacy_parse_date(s, now):
+    import re
+    t=s.strip().lower()
+    m=re.search(r'(\d{1,2}):(\d{2})$',t)
+    if m: hour,minute=int(m.group(1)),int(m.group(2)); t=t[:m.start()].strip()
+    else: hour,minute=23,59
+    pats=[(r'^(今日|today)$',lambda m:now),(r'^(明日|tomorrow)$',lambda m:now+timedelta(days=1)),
+          (r'^(明後日|day after tomorrow)$',lambda m:now+timedelta(days=2)),(r'^(昨日|yesterday)$',lambda m:now-timedelta(days=1)),
+          (r'^(\d+)\s*(日後|days?)$',lambda m:now+timedelta(days=int(m.group(1)))),
+          (r'^(\d+)\s*(週間後|weeks?)$',lambda m:now+timedelta(weeks=int(m.group(1)))),
+          (r'^(\d+)\s*(時間後|hours?)$',lambda m:now+timedelta(hours=int(m.group(1)))),
+          (r'^(\d+)\s*(分後|mins?|minutes?)$',lambda m:now+timedelta(minutes=int(m.group(1)))) ]
+    for pat,fn in pats:
+        mm=re.match(pat,t)
+        if mm: dt=fn(mm); return dt.replace(hour=hour,minute=minute,second=0,microsecond=0)
+    wk={'月':0,'火':1,'水':2,'木':3,'金':4,'土':5,'日':6,'monday':0,'tuesday':1,'wednesday':2,'thursday':3,'friday':4,'saturday':5,'sunday':6,'mon':0,'tue':1,'wed':2,'thu':3,'fri':4,'sat':5,'sun':6}
+    for name,num in wk.items():
+        if name in t:
+            d=num-now.weekday(); d+=7 if d<=0 else 0
+            return (now+timedelta(days=d)).replace(hour=hour,minute=minute,second=0,microsecond=0)
+    abs_p=[r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$',r'^(\d{1,2})[/-](\d{1,2})$',r'^(\d{4})年(\d{1,2})月(\d{1,2})日$',r'^(\d{1,2})月(\d{1,2})日$']
+    for pat in abs_p:
+        mm=re.match(pat,t)
+        if mm:
+            g=mm.groups()
+            if len(g)==3 and len(g[0])==4: y,mo,d=int(g[0]),int(g[1]),int(g[2])
+            elif len(g)==3: mo,d,y=int(g[0]),int(g[1]),now.year
+            else: mo,d,y=int(g[0]),int(g[1]),now.year
+            try: return datetime(y,mo,d,hour,minute)
+            except ValueError: return None
+    return None
+
+@bench("parse_date")
+def bench_parse_date(n: int = 50000):
+    import dateparse
+    from dateparse import parse_date
+    from tests.test_dateparse import CORPUS, NOW
+    def legacy(s):
+        try: return _legacy_parse_date(s, NOW)
+        except ValueError: return None        # 呼び出し側の try で None 扱いになっていた
+    legacy_wrong = sum(1 for s, want in CORPUS if legacy(s) != want)
+    print(f"  corpus: {len(CORPUS)} expressions (old parse_date got {legacy_wrong} of them wrong)")
+
+    rnd = random.Random(14)
+    inputs = [rnd.choice(CORPUS)[0] for _ in range(n)]
+    def run_legacy():
+        for s in inputs:
+            legacy(s)
+    def run_new(memo: bool):
+        for s in inputs:
+            if not memo:
+                dateparse._memo.clear()
+            parse_date(s, NOW)
+    for label, fn in (("parse_date (old)", run_legacy),
+                      ("compiled, no memo", lambda: run_new(False)),
+                      ("compiled + per-minute memo", lambda: run_new(True))):
+        t0 = time.perf_counter(); fn(); _report(label, n, time.perf_counter() - t0)
+
+
+@bench("timezones")
+def bench_timezones(rows: int = 500_000, reps: int = 300):
+    """期日の範囲検索：TEXT（旧）と INTEGER epoch（v6）。あわせてサーバーの TZ に依らないことを確認"""
+    import asyncio, dateparse
+    from db import AsyncDatabase, Database
+    from timezones import TimezoneStore, to_epoch, zone
+    base = int(datetime(2025, 1, 1).timestamp())
+    rnd = random.Random(15)
+    dues = [base + 60 * rnd.randint(0, 365 * 24 * 60) for _ in range(rows)]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t_text (id INTEGER PRIMARY KEY, due TEXT)")
+    conn.execute("CREATE TABLE t_int (id INTEGER PRIMARY KEY, due INTEGER)")
+    conn.executemany("INSERT INTO t_text (due) VALUES (?)",
+                     ((datetime.fromtimestamp(d).strftime("%Y-%m-%d %H:%M:%S"),) for d in dues))
+    conn.executemany("INSERT INTO t_int (due) VALUES (?)", ((d,) for d in dues))
+    conn.execute("CREATE INDEX i_text ON t_text(due)")
+    conn.execute("CREATE INDEX i_int ON t_int(due)")
+    lo = [base + 86400 * rnd.randint(0, 360) for _ in range(reps)]
+    for label, sql, conv in (
+            ("range scan, TEXT due_date (old)", "SELECT id FROM t_text WHERE due BETWEEN ? AND ?",
+             lambda a: datetime.fromtimestamp(a).strftime("%Y-%m-%d %H:%M:%S")),
+            ("range scan, INTEGER epoch", "SELECT id FROM t_int WHERE due BETWEEN ? AND ?", int)):
+        t0 = time.perf_counter()
+        for a in lo:
+            conn.execute(sql, (conv(a), conv(a + 86400))).fetchall()
+        _report(label, reps, time.perf_counter() - t0)
+    try:
+        size = [conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name=?", (n,)).fetchone()[0] / 1e6
+                for n in ("i_text", "i_int")]
+        print(f"  index size: TEXT {size[0]:.1f} MB  INTEGER {size[1]:.1f} MB")
+    except sqlite3.OperationalError:
+        pass                                # dbstat 無しのビルド
+
+    # "明日 18:00" は Asia/Tokyo のユーザーなら 09:00Z。プロセスの TZ（Render は UTC 等）は関係しない
+    path = _tmp_db()
+    adb = AsyncDatabase(Database(path))
+    store = TimezoneStore(adb)
+    now = datetime(2025, 8, 20, 1, 15, tzinfo=zone("UTC"))
+    async def check():
+        await store.set(1, "America/New_York")
+        await store.set(1, "Asia/Tokyo", user_id=10)
+        jp, ny = await store.get(1, 10), await store.get(1, 20)
+        assert (str(jp), str(ny), str(await store.get(2, 10))) == ("Asia/Tokyo", "America/New_York", "Asia/Tokyo")
+        return jp, ny
+    jp, ny = asyncio.run(check())
+    old_tz = os.environ.get("TZ")
+    try:
+        for server in ("UTC", "Asia/Singapore", "America/Los_Angeles"):
+            os.environ["TZ"] = server
+            time.tzset()
+            dateparse._memo.clear()
+            assert to_epoch(dateparse.parse_date("明日 18:00", now, jp)) == int(
+                datetime(2025, 8, 21, 9, 0, tzinfo=zone("UTC")).timestamp()), server
+            assert to_epoch(dateparse.parse_date("8/23 9:00", now, ny)) == int(
+                datetime(2025, 8, 23, 13, 0, tzinfo=zone("UTC")).timestamp()), server
+    finally:
+        if old_tz is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = old_tz
+        time.tzset()
+        adb.close()
+    print("  epoch checks: Asia/Tokyo / America/New_York users identical under UTC, SGT, PST servers")
+
+
+# ---- user-016: 40人のロールへの一括指示（担当者ごとに直列 vs assign.py のパイプライン） ----
+class _FakeThread:
+    def __init__(self, http, tid):
+        self.http, self.id = http, tid
+    async def send(self, *a, **kw):
+        await self.http.send(("thread", self.id))
+
+class _FakeMessage:
+    def __init__(self, http, ch, mid):
+        self.http, self.channel, self.id = http, ch, mid
+    async def create_thread(self, **kw):
+        await self.http.send(("channel", self.channel.id))
+        return _FakeThread(self.http, 900000 + self.id)
+
+class _FakeChannel:
+    _ids = iter(range(1, 10 ** 9))
+    def __init__(self, http, name):
+        self.http, self.name, self.id = http, name, next(self._ids)
+    async def send(self, *a, **kw):
+        await self.http.send(("channel", self.id))
+        return _FakeMessage(self.http, self, next(self._ids))
+
+class _FakeMember:
+    bot = False
+    def __init__(self, uid):
+        self.id, self.display_name, self.mention = uid, f"Member {uid}", f"<@{uid}>"
+
+class _FakeGuild:
+    """discord.Guild もどき：channels は毎回 list を作り、text_channels は並べ替える（本物と同じ）"""
+    default_role = None
+    def __init__(self, http, gid=1):
+        self.http, self.id, self._channels = http, gid, {}
+    @property
+    def channels(self):
+        return list(self._channels.values())
+    @property
+    def text_channels(self):
+        return sorted(self._channels.values(), key=lambda c: c.id)
+    def add(self, ch):
+        self._channels[ch.id] = ch
+        return ch
+    def get_channel(self, cid):
+        return self._channels.get(cid)
+    async def create_text_channel(self, name, **kw):
+        await self.http.send(("guild", self.id))       # チャンネル作成はギルド単位のルート
+        return self.add(_FakeChannel(self.http, name))
+
+@bench("assign")
+def bench_assign(members: int = 40, existing: float = 0.5, latency: float = 0.01):
+    import asyncio, discord
+    from assign import TaskService
+    from channels import ChannelRegistry, channel_name
+    from db import AsyncDatabase, Database
+    from taskcache import TaskCache
+    from timezones import to_epoch, zone
+    due = datetime(2025, 9, 1, 18, 0, tzinfo=zone("Asia/Tokyo"))
+    instructor = _FakeMember(10)
+    team = [_FakeMember(100 + i) for i in range(members)]
+
+    def setup():
+        db = Database(_tmp_db()); adb = AsyncDatabase(db)
+        http = _FakeHTTP(latency=latency)
+        guild = _FakeGuild(http)
+        for m in team[:int(members * existing)]:
+            guild.add(_FakeChannel(http, channel_name(m)))
+        return db, adb, TaskCache(adb), ChannelRegistry(adb), http, guild
+
+    # 旧 __assign_fallback_v2 / !指示：担当者ごとに INSERT → チャンネル → 本文 → スレッド → 詳細 → UPDATE を直列
+    async def legacy(cache, guild):
+        for m in team:
+            tid = await cache.execute(
+                "INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name,due_date) VALUES (?,?,?,?,?)",
+                (guild.id, instructor.id, m.id, "研修レポート", to_epoch(due)))
+            ch = discord.utils.get(guild.text_channels, name=channel_name(m))
+            if not ch:
+                ch = await guild.create_text_channel(channel_name(m))
+                await ch.send()
+            main = await ch.send(m.mention)
+            th = await main.create_thread(name="詳細")
+            await th.send()
+            await cache.execute("UPDATE tasks SET thread_id=?, message_id=? WHERE id=?", (th.id, main.id, tid), tid)
+
+    results = {}
+    for label, run in (("serial per assignee (old)", lambda c, r, g: legacy(c, g)),
+                       ("TaskService.create", lambda c, r, g: TaskService(cache=c, registry=r).create(
+                           g, instructor, team, "研修レポート", due))):
+        db, adb, cache, reg, http, guild = setup()
+        t0 = time.perf_counter()
+        asyncio.run(run(cache, reg, guild))
+        results[label] = elapsed = time.perf_counter() - t0
+        _report_time(f"{label}: {members} assignees", elapsed)
+        rows = db.query("SELECT COUNT(*), COUNT(thread_id), COUNT(DISTINCT assignee_id) FROM tasks")
+        assert rows == [(members, members, members)], rows
+        assert len(guild.text_channels) == members
+        print(f"    {http.requests} requests, {http.waits} bucket waits")
+        adb.close(); db.close()
+    old, new = results.values()
+    print(f"  speedup x{old / new:.1f}")
+
+    # 1人ずつの入口（/指示 等）：DB 確定で応答（on_insert）→ 残りはその後
+    db, adb, cache, reg, http, guild = setup()
+    svc = TaskService(cache=cache, registry=reg)
+    acks, totals = [], []
+    async def singles():
+        for m in team:
+            t0 = time.perf_counter()
+            async def on_insert(tasks):
+                acks.append(time.perf_counter() - t0)
+            await svc.create(guild, instructor, [m], "単発", due, on_insert=on_insert)
+            totals.append(time.perf_counter() - t0)
+    asyncio.run(singles())
+    a, t = _percentiles(acks), _percentiles(totals)
+    print(f"  single assignee x{members}: ack p50 {a[0] * 1000:.1f} ms  p99 {a[1] * 1000:.1f} ms,"
+          f"  done p50 {t[0] * 1000:.1f} ms  ({svc.stats()})")
+    assert db.query_one("SELECT COUNT(*), COUNT(thread_id) FROM tasks") == (members, members)
+    adb.close(); db.close()
+
+
+# ---- user-017: 個人チャンネルの引き方（名前で全件走査 vs 登録簿） ----
+@bench("channels")
+def bench_channels(channels: int = 500, users: int = 200, lookups: int = 20000):
+    import asyncio, discord
+    from channels import ChannelRegistry, channel_name
+    from db import AsyncDatabase, Database
+    db = Database(_tmp_db()); adb = AsyncDatabase(db)
+    http = _FakeHTTP(latency=0.005)
+    guild = _FakeGuild(http)
+    for i in range(channels - users):
+        guild.add(_FakeChannel(http, f"general-{i}"))
+    team = [_FakeMember(100 + i) for i in range(users)]
+    for m in team:
+        guild.add(_FakeChannel(http, channel_name(m)))
+    rnd = random.Random(17)
+    picks = [rnd.choice(team) for _ in range(lookups)]
+
+    t0 = time.perf_counter()
+    for m in picks:
+        discord.utils.get(guild.channels, name=f"to-{m.display_name}".lower().replace(" ", "-"))
+    _report(f"name scan over {channels} channels (old)", lookups, time.perf_counter() - t0)
+
+    reg = ChannelRegistry(adb)
+    async def run():
+        for m in team:                                  # 既存チャンネルを名前で1回だけ拾って登録
+            await reg.resolve(guild, m)
+        t0 = time.perf_counter()
+        for m in picks:
+            await reg.resolve(guild, m)
+        _report("registry resolve", lookups, time.perf_counter() - t0)
+        assert reg.created == 0 and len(reg) == users
+
+        # 改名しても同じチャンネル（旧: 名前で見つからず2つ目を作っていた）
+        m = team[0]
+        before = await reg.resolve(guild, m)
+        m.display_name = "Renamed Member"
+        assert await reg.resolve(guild, m) is before and reg.created == 0
+        # 同じ人への同時指示 20件でも作るのは1回
+        newbie = _FakeMember(9999)
+        got = await asyncio.gather(*(reg.resolve(guild, newbie) for _ in range(20)))
+        assert reg.created == 1 and len({c.id for c in got}) == 1
+        assert not reg._locks                           # 終わったらユーザーごとのロックは残らない
+        # 消されたら登録を外し、次で作り直す（DB からも消える）
+        del guild._channels[got[0].id]
+        reg.on_channel_delete(got[0])
+        again = await reg.resolve(guild, newbie)
+        assert again.id != got[0].id and reg.created == 2 and reg.healed == 1
+        await asyncio.sleep(0.05)
+        # 再起動後：DB から読み直して同じ対応
+        fresh = ChannelRegistry(adb)
+        assert await fresh.load() == users + 1
+        assert (await fresh.resolve(guild, newbie)).id == again.id and fresh.created == 0
+        print(f"  rename / 20 concurrent creates / delete+heal / reload OK  ({reg.stats()})")
+    asyncio.run(run())
+    adb.close(); db.close()
+
+
+# ---- user-019: on_message（旧: リスナー5本＋2重の process_commands vs router 1本）の1コアあたり処理量 ----
+class _FakeUser:
+    def __init__(self, uid, bot=False, name="user"):
+        self.id, self.bot, self.name, self.display_name = uid, bot, name, name
+        self.mention = f"<@{uid}>"
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+    __hash__ = object.__hash__
+
+class _FakeMsg:
+    def __init__(self, content, author, mentions=(), embeds=()):
+        self.content, self.author, self.mentions, self.embeds = content, author, list(mentions), list(embeds)
+        self.guild = type("G", (), {"id": 1})()
+        self.channel = type("C", (), {"id": 2})()
+
+def _message_stream(n, me, rnd):
+    """雑談 94% / "!" コマンド 3% / Bot へのメンション 1% / 他人へのメンション 1% / Bot 自身の embed 1%"""
+    users = [_FakeUser(1000 + i, name=f"user{i}") for i in range(50)]
+    chatter = ["おはようございます", "了解です！", "今日の会議は15時からです", "lol", "see you tomorrow",
+               "資料を共有フォルダに置きました。確認お願いします。", "https://example.com/x", "👍"]
+    out = []
+    for _ in range(n):
+        u, x = rnd.choice(users), rnd.random()
+        if x < 0.94:
+            out.append(_FakeMsg(rnd.choice(chatter), u))
+        elif x < 0.97:
+            out.append(_FakeMsg("!ping", u))
+        elif x < 0.98:
+            out.append(_FakeMsg(f"<@{me.id}> <@{u.id}>, 明日 18:00, レポート", u, [me, u]))
+        elif x < 0.99:
+            v = rnd.choice(users)
+            out.append(_FakeMsg(f"<@{v.id}> ありがとう", u, [v]))
+        else:
+            out.append(_FakeMsg("", me, embeds=[object()]))
+    return out
+
+@bench("router")
+def bench_router(n: int = 100_000):
+    import asyncio, io, logging
+    from router import MessageRouter, mentions, prefixed
+    me = _FakeUser(42, bot=True, name="リマインダくん")
+    client = type("Client", (), {"user": me})()
+    msgs = _message_stream(n, me, random.Random(19))
+    handled = {"commands": 0, "assign": 0, "text_slash": 0, "localize": 0}
+    # 旧 probe は INFO を毎回出していた（ハンドラは StringIO に書く：書式化とハンドラの分だけ）
+    probe_log = logging.getLogger("bench.probe")
+    probe_log.handlers[:] = [logging.StreamHandler(io.StringIO())]
+    probe_log.setLevel(logging.INFO); probe_log.propagate = False
+
+    # 旧：discord.py はリスナー1本ごとに task を作る。on_message（既定 on_message → guard + 明示の process_commands）
+    async def fallback(message):                      # __assign_fallback_v2（2重）
+        if message.author.bot or message.guild is None: return
+        text = message.content.strip()
+        is_real = me in message.mentions
+        heads = [f"@{me.display_name}", f"@{me.name}"]
+        if not (is_real or any(text.startswith(v) for v in heads)): return
+        handled["assign"] += 1
+    async def text_slash(msg):
+        if msg.author.bot or msg.guild is None: return
+        if not (msg.content or "").strip().startswith("/指示"): return
+        handled["text_slash"] += 1
+    async def localize(msg):
+        if msg.author.id != me.id or not msg.embeds: return
+        handled["localize"] += 1
+    async def probe(msg):
+        if msg.author.bot: return
+        content = msg.content or ""
+        probe_log.info(f"[probe] g={msg.guild.id} ch={msg.channel.id} len={len(content)} "
+                       f"bang={content.lstrip().startswith('!')} mentionBot={me in msg.mentions}")
+    async def guarded(message):
+        if message.author.bot: return
+        if not (message.content or "").lstrip().startswith("!"): return
+        handled["commands"] += 1
+    async def on_message(message):
+        await guarded(message)                        # 既定の Bot.on_message → process_commands
+        if message.author.bot: return
+        if message.content.lstrip().startswith("!"):
+            await guarded(message)
+    old_listeners = (fallback, fallback, text_slash, localize, probe, on_message)
+
+    router = MessageRouter()
+    async def count(name):
+        handled[name] += 1
+    router.route("commands", prefixed("!"), order=10)(lambda m: count("commands"))
+    router.route("text_slash", prefixed("/指示"), order=20)(lambda m: count("text_slash"))
+    router.route("assign", mentions(client), order=30)(lambda m: count("assign"))
+    router.route("localize", lambda m, t: bool(m.embeds) and m.author.id == me.id, order=0, bots=True)(
+        lambda m: count("localize"))
+
+    async def run_old():
+        for m in msgs:
+            await asyncio.gather(*(asyncio.ensure_future(fn(m)) for fn in old_listeners))
+    async def run_new():
+        for m in msgs:
+            await asyncio.ensure_future(router.dispatch(m))     # on_message の task 1本
+
+    results = {}
+    for label, fn in (("listeners x6 (old)", run_old), ("router", run_new)):
+        for k in handled: handled[k] = 0
+        t0 = time.perf_counter(); asyncio.run(fn()); dt = time.perf_counter() - t0
+        _report(label, n, dt)
+        results[label] = dict(handled)
+    old, new = results.values()
+    print(f"  old handled {old}  (commands run twice)")
+    print(f"  new handled {new}")
+    assert new["commands"] * 2 == old["commands"] and new["assign"] * 2 == old["assign"]
+    assert new["localize"] == old["localize"]
+    print(f"  {router.stats()}")
+
+
+# ---- user-020: 状態カードの日本語化（英語で送って自分の発言を拾い edit し直す vs 最初から表示モードの文言） ----
+@bench("localize")
+def bench_localize(n: int = 200, latency: float = 0.005, cpu_n: int = 20000):
+    import asyncio, discord, i18n
+    from i18n import DisplayModes
+    from db import AsyncDatabase, Database
+    en_label = {"Due Date": "期日", "Status": "状態", "Updated": "更新"}
+    en_status = {"Pending": "未受託", "In Progress": "受託", "Completed": "完了", "Declined": "辞退", "Problem": "問題発生"}
+    statuses = ["pending", "accepted", "completed", "declined", "abandoned"]
+
+    def card(tid, st, mode):
+        emb = discord.Embed(title=f"📋 task {tid}", color=discord.Color.gold())
+        emb.add_field(name=i18n.label(mode, "due"), value="<t:1756717200:F>", inline=True)
+        emb.add_field(name=i18n.label(mode, "status"), value=f"🟥 {i18n.status_name(mode, st)}", inline=True)
+        emb.add_field(name=i18n.label(mode, "updated"), value="<t:1756717200:R>", inline=True)
+        emb.set_footer(text=f"Task ID: {tid}")
+        return emb
+
+    def localized(emb):                                # 旧 _jp_build_localized（フィールドの付け替え）
+        new = discord.Embed(title=emb.title, description=emb.description, color=emb.color)
+        if emb.footer and emb.footer.text:
+            new.set_footer(text=emb.footer.text)
+        for f in emb.fields:
+            name = en_label.get(f.name, f.name)
+            value = f.value
+            if name == "状態":
+                emoji, _, label = f.value.partition(" ")
+                value = f"{emoji} {en_status.get(label, label)}"
+            new.add_field(name=name, value=value, inline=f.inline)
+        return new
+
+    class Channel:
+        def __init__(self, http):
+            self.http, self.edits = http, 0
+        async def send(self, embed):
+            await self.http.send(("channel", 1))
+            return embed
+        async def edit(self, embed):                   # 自分の発言の PATCH も同じチャンネルのバケット
+            await self.http.send(("channel", 1))
+            self.edits += 1
+
+    async def old(ch):
+        for i in range(n):
+            emb = await ch.send(card(i, statuses[i % 5], "en"))
+            loc = localized(emb)                       # on_message（Bot 自身の発言）→ _jp_auto_localize
+            if loc.fields != emb.fields:
+                await ch.edit(loc)
+    async def new(ch, modes):
+        for i in range(n):
+            await ch.send(card(i, statuses[i % 5], await modes.get(1)))
+
+    db = Database(_tmp_db()); adb = AsyncDatabase(db)
+    modes = DisplayModes(adb)
+    results = {}
+    for label, run in (("send en + edit ja (old)", old), ("send ja once", lambda ch: new(ch, modes))):
+        http = _FakeHTTP(latency=latency)
+        ch = Channel(http)
+        t0 = time.perf_counter(); asyncio.run(run(ch)); dt = time.perf_counter() - t0
+        _report_time(f"{label}: {n} cards", dt)
+        print(f"    {http.requests} requests ({ch.edits} edits), {http.waits} bucket waits")
+        results[label] = (http.requests, dt)
+    (old_req, old_t), (new_req, new_t) = results.values()
+    assert old_req == 2 * n and new_req == n
+    print(f"  saved {old_req - new_req} requests ({(old_req - new_req) / old_req:.0%}), x{old_t / new_t:.1f}")
+
+    # 出来上がりは旧方式の日本語化の結果と同じ（問題 / 問題発生 の揺れは i18n に寄せた）
+    for i, st in enumerate(statuses):
+        a, b = localized(card(i, st, "en")), card(i, st, "jp")
+        assert [(f.name, f.value) for f in a.fields] == [(f.name, f.value) for f in b.fields], (a.fields, b.fields)
+    # Bot の発言1通ごとに旧 listener がしていた作り直し（日本語済みでも毎回）
+    emb = card(1, "accepted", "jp")
+    t0 = time.perf_counter()
+    for _ in range(cpu_n):
+        localized(emb).fields != emb.fields
+    _report("localize listener per bot message", cpu_n, time.perf_counter() - t0)
+
+    # 表示モードはギルドごと：設定は1回だけ読んで以後はメモリ
+    async def modes_check():
+        m = DisplayModes(adb)
+        assert await m.get(1) == "jp"
+        await adb.execute("INSERT INTO settings(key,val) VALUES('display_mode','num')")
+        assert await DisplayModes(adb).get(1) == "num"      # 旧来の全体設定を引き継ぐ
+        await m.set(2, "en")
+        fresh = DisplayModes(adb)
+        assert (await fresh.get(2), await fresh.get(1), await fresh.get(None)) == ("en", "num", "num")
+        t0 = time.perf_counter()
+        for _ in range(cpu_n):
+            await fresh.get(2)
+        _report("display_modes.get (cached)", cpu_n, time.perf_counter() - t0)
+    asyncio.run(modes_check())
+    assert i18n.parse_mode("数字") == "num" and i18n.parse_mode("English") == "en" and i18n.parse_mode("日本語") == "jp"
+    assert i18n.fmt_dt(datetime(2025, 8, 23, 18, 0), "jp") == "2025年08月23日（土） 18:00"
+    adb.close(); db.close()
+
+
+# ---- user-021: 日付の整形（1件ごとに接続 + CREATE TABLE + SELECT vs メモリの設定ストア） ----
+@bench("settings")
+def bench_settings(n: int = 100_000, legacy_n: int = 2000):
+    import asyncio, i18n
+    from db import AsyncDatabase, Database
+    from i18n import DisplayModes
+    from scheduler import DEFAULT_OFFSETS, OFFSETS
+    from settings import SettingsStore
+    from timezones import TZ, zone
+    path = _tmp_db()
+    db = Database(path); adb = AsyncDatabase(db)
+    db.execute("INSERT INTO settings(key,val) VALUES('display_mode','num')")
+    dates = [datetime(2025, 1, 1) + timedelta(minutes=37 * i) for i in range(n)]
+
+    def legacy_mode():                                 # 旧 get_display_mode（__cfg_exec）
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, val TEXT)")
+            r = conn.execute("SELECT val FROM settings WHERE key='display_mode'").fetchall()
+            conn.commit()
+            return r[0][0] if r else "jp"
+        finally:
+            conn.close()
+    t0 = time.perf_counter()
+    old = [i18n.fmt_dt(d, legacy_mode()) for d in dates[:legacy_n]]
+    old_dt = time.perf_counter() - t0
+    _report("connect+DDL+SELECT per date (old)", legacy_n, old_dt)
+
+    modes = DisplayModes(adb)
+    asyncio.run(modes.get(None))                       # 起動時の load() 1回
+    t0 = time.perf_counter()
+    new = [i18n.fmt_dt(d, modes.now(1)) for d in dates]
+    new_dt = time.perf_counter() - t0
+    _report("settings store", n, new_dt)
+    assert new[:legacy_n] == old
+    print(f"  x{(old_dt / legacy_n) / (new_dt / n):.0f} per date, {modes.store.stats()}")
+
+    async def check():
+        st = SettingsStore(adb)
+        assert st.get(i18n.DISPLAY_MODE, 1) == "jp"          # load() 前は既定値（DB を見ない）
+        await st.load()
+        assert st.get(i18n.DISPLAY_MODE, 1) == "num"         # ギルド未設定 → 全体
+        assert await st.set(i18n.DISPLAY_MODE, "en", 1) == "en"
+        assert (st.get(i18n.DISPLAY_MODE, 1), st.get(i18n.DISPLAY_MODE, 2)) == ("en", "num")
+        await st.set(i18n.DISPLAY_MODE, "jp")                 # 全体を変えたら未設定のギルドだけ変わる
+        assert (st.get(i18n.DISPLAY_MODE, 1), st.get(i18n.DISPLAY_MODE, 2)) == ("en", "jp")
+        try:
+            await st.set(i18n.DISPLAY_MODE, "klingon", 3); raise AssertionError("accepted a bad mode")
+        except ValueError:
+            pass
+        await st.set(TZ, zone("Asia/Tokyo"), 1); await st.set(TZ, zone("UTC"), 1, 10)
+        await st.set(OFFSETS, (60, 5), 1)
+        await adb.execute("INSERT INTO settings(key,val) VALUES('tz:2','Mars/Olympus')")
+        fresh = SettingsStore(adb); await fresh.load()       # 再起動相当：DB から同じ値
+        assert str(fresh.get(TZ, 1, 10)) == "UTC" and str(fresh.get(TZ, 1, 20)) == "Asia/Tokyo"
+        assert fresh.get(TZ, 2) is None                       # 知らない名前は無視（警告）
+        assert fresh.get(OFFSETS, 1) == (60, 5) and fresh.get(OFFSETS, 2) == DEFAULT_OFFSETS
+        assert (fresh.get(i18n.DISPLAY_MODE, 1), fresh.get(i18n.DISPLAY_MODE, None)) == ("en", "jp")
+        assert db.query_one("SELECT val FROM settings WHERE key='display_mode:3'") is None
+    asyncio.run(check())
+    adb.close(); db.close()
+
+
+# ---- user-022: 起動（ギルドごとに直列で setup_roles + スラッシュ同期 vs startup.py） ----
+@bench("startup")
+def bench_startup(guilds: int = 200, latency: float = 0.02, new_roles: float = 0.3):
+    import asyncio, discord
+    from discord.ext import commands
+    from db import AsyncDatabase, Database
+    from settings import SettingsStore
+    from startup import Startup
+
+    real = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+    @real.tree.command(name="指示", description="タスクを指示")
+    async def _cmd(inter: discord.Interaction, タスク名: str):
+        pass
+
+    class Guild:
+        def __init__(self, gid, roles):
+            self.id, self.roles = gid, roles
+
+    class FakeBot:
+        def __init__(self, http):
+            self.http, self.tree = http, real.tree
+            rnd = random.Random(22)
+            self.guilds = [Guild(1000 + i, [] if rnd.random() < new_roles else ["タスク管理者", "タスク指示者"])
+                           for i in range(guilds)]
+            self.syncs = 0
+            async def sync(guild=None):
+                self.syncs += 1
+                await http.send(("sync", getattr(guild, "id", None)))   # PUT .../guilds/<id>/commands
+            self.tree.sync = sync
+        async def wait_until_ready(self):
+            pass
+
+    async def setup_roles(g):                          # 無いロールだけ create_role（ギルド単位のルート）
+        for name in ("タスク管理者", "タスク指示者"):
+            if name not in g.roles:
+                await bot.http.send(("guild", g.id))
+                g.roles.append(name)
+
+    async def old_ready():                             # 旧：READY のたびに直列
+        for g in bot.guilds:
+            await setup_roles(g)
+        for g in bot.guilds:
+            await bot.tree.sync(guild=g)
+
+    db = Database(_tmp_db()); adb = AsyncDatabase(db)
+    bot = FakeBot(_FakeHTTP(latency=latency))
+    t0 = time.perf_counter(); asyncio.run(old_ready()); old_cold = time.perf_counter() - t0
+    t0 = time.perf_counter(); asyncio.run(old_ready()); old_again = time.perf_counter() - t0
+    _report_time(f"serial (old), {guilds} guilds", old_cold)
+    _report_time("serial (old), reconnect READY", old_again)
+    print(f"    {bot.syncs} slash syncs")
+
+    def boot():
+        st = Startup(bot, store=SettingsStore(adb))
+        st.guild_step(setup_roles)
+        return st
+    results = []
+    async def run(st, readies=1):
+        for _ in range(readies):                       # on_ready が何度来ても1回
+            st.start()
+        await st._task
+        results.append((st.elapsed, bot.syncs))
+    for label, readies in (("startup, cold (new)", 3), ("startup, restart", 1)):
+        bot = FakeBot(_FakeHTTP(latency=latency))
+        asyncio.run(run(boot(), readies))
+        elapsed, syncs = results[-1]
+        _report_time(f"{label}", elapsed)
+        print(f"    {syncs} slash syncs")
+    (cold, cold_syncs), (warm, warm_syncs) = results
+    assert cold_syncs == 1 and warm_syncs == 0, results          # ギルド固有のコマンドは無い：グローバル1回だけ
+    print(f"  time-to-ready x{old_cold / cold:.1f} (cold), x{old_cold / warm:.0f} (restart, unchanged commands)")
+
+    # 定義を変えたら同期し直す
+    @real.tree.command(name="ping", description="応答確認")
+    async def _ping(inter: discord.Interaction):
+        pass
+    bot = FakeBot(_FakeHTTP(latency=latency))
+    asyncio.run(run(boot()))
+    assert results[-1][1] == 1, results[-1]           # グローバルだけ変わった（ギルド固有は無し）
+    adb.close(); db.close()
+
+
+@bench("profile")
+def bench_profile(runs: int = 3):
+    """python mybot.py --profile-startup（トークン無し：接続しない部分）を作業用ディレクトリで実行して報告を出す"""
+    import glob, shutil, subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = ""
+    for i in range(runs):
+        work = tempfile.mkdtemp(prefix="bench_profile_")
+        for f in glob.glob(os.path.join(here, "*.py")):
+            shutil.copy(f, work)
+        shutil.copytree(os.path.join(here, "cogs"), os.path.join(work, "cogs"))
+        env = {k: v for k, v in os.environ.items() if k != "DISCORD_BOT_TOKEN"}
+        t = time.perf_counter()
+        out = subprocess.run([sys.executable, "mybot.py", "--profile-startup"], cwd=work, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        _report_time(f"process, run {i + 1}", time.perf_counter() - t)
+        shutil.rmtree(work, ignore_errors=True)
+    print("\n".join("  " + line for line in out.strip().splitlines()))
+    assert "cogs=3" in out and "READY" in out, out
+
+
+@bench("logging")
+def bench_logging(n: int = 50_000, slow_ms: float = 0.05):
+    """LOG_PROBE（メッセージごとの INFO）を有効にした router.dispatch 1回あたりの時間：
+    同期 FileHandler（旧 basicConfig） / QueueHandler + 書き込みスレッド（logpipe） / それに間引き"""
+    import asyncio, glob, json, logging
+    from logpipe import LogPipeline
+    from router import MessageRouter, mentions, prefixed
+    me = _FakeUser(42, bot=True, name="リマインダくん")
+    client = type("Client", (), {"user": me})()
+    msgs = _message_stream(n, me, random.Random(24))
+    router = MessageRouter()
+    async def nop(m):
+        pass
+    router.route("commands", prefixed("!"), order=10)(nop)
+    router.route("assign", mentions(client), order=30)(nop)
+    root, probe = logging.getLogger(), logging.getLogger("taskbot.probe")
+    saved = root.handlers[:], root.level, probe.level
+
+    class SlowFile(logging.FileHandler):              # 遅いディスク（書き込み1回 slow_ms）
+        def emit(self, record):
+            time.sleep(slow_ms / 1000); super().emit(record)
+
+    async def run():
+        for m in msgs:
+            await router.dispatch(m)
+    def measure(label, handlers=None, pipe=None):
+        if pipe is not None:
+            pipe.install(logging.INFO)
+        else:
+            root.handlers[:] = handlers or []
+            root.setLevel(logging.INFO)
+        t0 = time.perf_counter(); asyncio.run(run()); dt = time.perf_counter() - t0
+        print(f"  {label:<36} {dt / n * 1e6:>9.1f} µs/message")
+        if pipe is not None:
+            t1 = time.perf_counter(); pipe.stop()
+            print(f"    drained in {(time.perf_counter() - t1) * 1000:.0f} ms after the loop finished, {pipe.stats()}")
+        for h in handlers or []:
+            h.close()
+        return dt
+
+    work = tempfile.mkdtemp(prefix="bench_log_")
+    fmt = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+    def sync_file(cls=logging.FileHandler, name="sync.log"):
+        h = cls(os.path.join(work, name), encoding="utf-8"); h.setFormatter(fmt); return h
+    try:
+        probe.setLevel(logging.WARNING)
+        off = measure("probe off")
+        probe.setLevel(logging.INFO)
+        old = measure("sync FileHandler (old)", [sync_file()])
+        new = measure("QueueHandler + writer thread", pipe=LogPipeline(os.path.join(work, "q.log"), stream=None))
+        js = LogPipeline(os.path.join(work, "j.log"), json_lines=True, max_bytes=1024 * 1024, backups=3, stream=None)
+        measure("  + JSON lines, 1MB rotation", pipe=js)
+        sp = LogPipeline(os.path.join(work, "s.log"), stream=None)
+        sampler = sp.sample("taskbot.probe", every=100, per_sec=50)
+        sampled = measure("  + sample 1/100, <=50/s", pipe=sp)
+        probe.removeFilter(sampler)
+        slow_old = measure(f"slow disk {slow_ms}ms/write, sync (old)", [sync_file(SlowFile, "slow.log")])
+        slow_new = measure(f"slow disk {slow_ms}ms/write, queue", pipe=_slow_pipe(work, slow_ms))
+    finally:
+        root.handlers[:] = saved[0]
+        root.setLevel(saved[1]); probe.setLevel(saved[2])
+
+    # 書き込みスレッドは全件書いている・JSON は1行1件・サイズで回っている
+    with open(os.path.join(work, "q.log"), encoding="utf-8") as f:
+        assert sum(1 for _ in f) == n
+    jfiles = sorted(glob.glob(os.path.join(work, "j.log*")))
+    assert len(jfiles) == 4, jfiles                   # j.log + j.log.1..3（古いものは消える）
+    with open(jfiles[0], encoding="utf-8") as f:
+        rec = json.loads(f.readline())
+    assert rec["logger"] == "taskbot.probe" and rec["msg"].startswith("[probe]"), rec
+    assert sampler.passed <= n // 100 and sampler.passed + sampler.dropped == n
+    print(f"  probe overhead: sync +{(old - off) / n * 1e6:.1f} µs, queue +{(new - off) / n * 1e6:.1f} µs, "
+          f"sampled +{(sampled - off) / n * 1e6:.1f} µs per message")
+    print(f"  slow disk: loop time x{slow_old / slow_new:.0f} shorter with the queue")
+
+
+def _slow_pipe(work: str, slow_ms: float):
+    import logging
+    from logpipe import LogPipeline
+    pipe = LogPipeline(os.path.join(work, "slow_q.log"), stream=None)
+    h = pipe.handlers[0]
+    emit = h.emit
+    def slow_emit(record):
+        time.sleep(slow_ms / 1000); emit(record)
+    h.emit = slow_emit
+    return pipe
+
+
+@bench("metrics")
+def bench_metrics(n: int = 200_000, queries: int = 20_000):
+    """observe / inc 1回の時間、DB 1文あたりの計測の割合、REST の包み（429 の数え方）、/metrics の書き出し"""
+    import asyncio, logging
+    from db import Database
+    from metrics import Registry, instrument_http, REST_429, REST_CALLS, MetricsServer
+    reg = Registry()
+    h = reg.histogram("bench_seconds", "bench", labels=("route",))
+    c = reg.counter("bench_total", "bench", labels=("route",))
+    routes = [f"GET /channels/{{channel_id}}/messages/{i}" for i in range(20)]
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.observe((i % 1000) / 10000, routes[i % 20])
+    _report("histogram.observe", n, time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for i in range(n):
+        c.inc(routes[i % 20])
+    _report("counter.inc", n, time.perf_counter() - t0)
+    assert h.count(routes[0]) == n // 20 and c.total() == n
+
+    # DB：計測込みの query と、同じ文をコネクションに直接
+    db = Database(_tmp_db())
+    sql = "SELECT key, val FROM settings WHERE key=?"
+    t0 = time.perf_counter()
+    for i in range(queries):
+        db.query(sql, (f"k{i % 50}",))
+    inst = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(queries):
+        with db.reader() as conn:
+            conn.execute(sql, (f"k{i % 50}",)).fetchall()
+    raw = time.perf_counter() - t0
+    _report("db.query (instrumented)", queries, inst)
+    _report("reader + execute (uninstrumented)", queries, raw)
+    print(f"    overhead {(inst - raw) / queries * 1e6:.1f} µs per statement")
+    db.close()
+
+    # REST：ルート別の回数と、discord.http が出す 429 の WARNING を同じルートで数える
+    class Route:
+        def __init__(self, method, path):
+            self.key = f"{method} {path}"
+    class HTTP:
+        async def request(self, route, **kw):
+            if route.key.endswith("/limited"):
+                logging.getLogger("discord.http").warning(
+                    "We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.", "PATCH", "x", 0.0)
+            await asyncio.sleep(0)
+            return {}
+    http = HTTP(); instrument_http(http)
+    before429, before = REST_429.value("PATCH /channels/limited"), REST_CALLS.value("GET /x", "ok")
+    http_log = logging.getLogger("discord.http")
+    saved, quiet = http_log.propagate, logging.NullHandler()
+    http_log.propagate = False; http_log.addHandler(quiet)
+    async def run():
+        for _ in range(100):
+            await http.request(Route("GET", "/x"))
+        for _ in range(3):
+            await http.request(Route("PATCH", "/channels/limited"))
+    asyncio.run(run())
+    http_log.propagate = saved; http_log.removeHandler(quiet)
+    assert REST_CALLS.value("GET /x", "ok") - before == 100
+    assert REST_429.value("PATCH /channels/limited") - before429 == 3
+    print(f"  rest: GET /x x100 counted, 3 x 429 attributed to PATCH /channels/limited")
+
+    # /metrics の書き出しと HTTP 1往復
+    async def scrape():
+        srv = await MetricsServer(reg).start("127.0.0.1", 0)
+        t0 = time.perf_counter()
+        for _ in range(50):
+            r, w = await asyncio.open_connection("127.0.0.1", srv.port)
+            w.write(b"GET /metrics HTTP/1.1\r\n\r\n"); await w.drain()
+            body = await r.read(); w.close()
+        dt = time.perf_counter() - t0
+        await srv.stop()
+        return dt, body
+    dt, body = asyncio.run(scrape())
+    assert body.startswith(b"HTTP/1.1 200") and b'bench_seconds_bucket{route=' in body
+    _report(f"GET /metrics ({len(body)} bytes)", 50, dt)
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    for name in names:
+        if name not in BENCHES:
+            raise SystemExit(f"unknown bench: {name}（{', '.join(BENCHES)}）")
+        print(f"[{name}]")
+        BENCHES[name]()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# channels.py - (guild, user) -> 個人チャンネル の登録簿
+# 以前は通知のたびに guild.channels を名前（"to-<表示名>"）で全件なめていた。表示名を変えたユーザーは
+# 見つからなくなり、同じ人のチャンネルがもう1つ作られていた。
+# ここでは notification_channels テーブル（channel_type='personal'）に channel_id を持ち、メモリの dict で
+# O(1) に引く。作成はユーザーごとのロックの中で1回だけ（同時に指示が来ても二重に作らない）。
+# チャンネルが消えたら（on_guild_channel_delete / 引いたら無かった）登録を外し、次の通知で作り直す。
+# 名前で探すのは登録が無い時の1回だけ（登録簿ができる前のチャンネルを拾うため）。
+# ユーザーごとのロックは使っている（待っている）間だけ持ち、最後の1人が抜けたら外す（ユーザー数だけ溜めない）。
+import asyncio, logging
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from db import get_adb
+
+logger = logging.getLogger("taskbot")
+
+KIND = "personal"
+CREATE_CONCURRENCY = 3   # チャンネル作成はギルド単位のルートなので同時数は控えめに
+
+
+def channel_name(member: discord.Member) -> str:
+    """mybot の個人チャンネル名（Discord は小文字・空白→"-" に直して保存する）"""
+    return f"to-{member.display_name}".lower().replace(" ", "-")
+
+
+class ChannelRegistry:
+    def __init__(self, adb=None, kind: str = KIND, name: Callable[[discord.Member], str] = channel_name,
+                 topic: str = "{}の個人タスク管理チャンネル"):
+        self._adb = adb
+        self.kind, self.name, self.topic = kind, name, topic
+        self._ids: Dict[Tuple[int, int], int] = {}
+        self._keys: Dict[int, Tuple[int, int]] = {}         # channel_id -> (guild_id, user_id)
+        self._locks: Dict[Tuple[int, int], List] = {}        # (guild_id, user_id) -> [Lock, 使用中の数]
+        self._loaded: Optional[asyncio.Task] = None
+        self._create = asyncio.Semaphore(CREATE_CONCURRENCY)
+        self.hits = self.misses = self.created = self.healed = 0
+
+    @property
+    def adb(self):
+        return self._adb or get_adb()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def stats(self) -> str:
+        return (f"channels {len(self._ids)} hit={self.hits} miss={self.misses} "
+                f"created={self.created} healed={self.healed}")
+
+    async def load(self) -> int:
+        """登録を DB から一度だけ読み込む（何度呼んでもよい）"""
+        if self._loaded is None:
+            self._loaded = asyncio.ensure_future(self._load())
+        try:
+            await asyncio.shield(self._loaded)
+        except Exception:
+            self._loaded = None                   # 次の呼び出しで読み直す
+            raise
+        return len(self._ids)
+
+    async def _load(self):
+        rows = await self.adb.query(
+            "SELECT guild_id, user_id, channel_id FROM notification_channels WHERE channel_type=?", (self.kind,))
+        for gid, uid, cid in rows:
+            self._remember((gid, uid), cid)
+
+    def _remember(self, key: Tuple[int, int], cid: int):
+        old = self._ids.get(key)
+        if old is not None:
+            self._keys.pop(old, None)
+        self._ids[key] = cid
+        self._keys[cid] = key
+
+    def _cached(self, guild: discord.Guild, user_id: int) -> Optional[discord.TextChannel]:
+        cid = self._ids.get((guild.id, user_id))
+        if cid is None:
+            return None
+        ch = guild.get_channel(cid)
+        if ch is None:                       # 停止中に消された等：登録を外して作り直させる
+            self._forget(cid)
+        return ch
+
+    def _forget(self, cid: int) -> bool:
+        key = self._keys.pop(cid, None)
+        if key is None:
+            return False
+        self._ids.pop(key, None)
+        self.healed += 1
+        logger.info(f"[channels] {self.kind} channel {cid} of {key} is gone; will recreate on next use")
+        try:
+            asyncio.get_running_loop().create_task(self.adb.execute(
+                "DELETE FROM notification_channels WHERE channel_id=? AND channel_type=?", (cid, self.kind)))
+        except RuntimeError:
+            pass
+        return True
+
+    @asynccontextmanager
+    async def _locked(self, key: Tuple[int, int]):
+        """key ごとのロック。誰も持っていない・待っていない key のロックは残さない"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def get(self, guild: discord.Guild, user_id: int) -> Optional[discord.TextChannel]:
+        """登録済みの個人チャンネル（無ければ None。作らない）"""
+        return self._cached(guild, user_id)
+
+    async def resolve(self, guild: discord.Guild, member: discord.Member,
+                      create: bool = True) -> Optional[discord.TextChannel]:
+        """member の個人チャンネル。無ければ（create なら）作って登録する。作れなければ None"""
+        if self._loaded is None or not self._loaded.done():
+            await self.load()
+        key = (guild.id, member.id)
+        ch = self._cached(guild, member.id)
+        if ch is not None:
+            self.hits += 1
+            return ch
+        self.misses += 1
+        async with self._locked(key):
+            ch = self._cached(guild, member.id)              # 待っている間に他が作った
+            if ch is not None:
+                return ch
+            ch = discord.utils.get(guild.text_channels, name=self.name(member))
+            if ch is None and create:
+                ch = await self._new(guild, member)
+            if ch is not None:
+                self._remember(key, ch.id)
+                await self.adb.execute(
+                    "INSERT INTO notification_channels(guild_id,user_id,channel_id,channel_type) VALUES(?,?,?,?) "
+                    "ON CONFLICT(guild_id,user_id,channel_type) DO UPDATE SET channel_id=excluded.channel_id",
+                    (guild.id, member.id, ch.id, self.kind))
+            return ch
+
+    async def _new(self, guild: discord.Guild, member: discord.Member) -> Optional[discord.TextChannel]:
+        async with self._create:
+            try:
+                ow = {guild.default_role: discord.PermissionOverwrite(read_messages=False),
+                      member: discord.PermissionOverwrite(read_messages=True, send_messages=True)}
+                ch = await guild.create_text_channel(self.name(member), overwrites=ow,
+                                                     topic=self.topic.format(member.display_name))
+            except Exception as e:
+                logger.error(f"[channels] create for {member.id} in {guild.id} failed: {type(e).__name__}: {e}")
+                return None
+        self.created += 1
+        try:
+            await ch.send(embed=discord.Embed(
+                title="📋 個人タスクチャンネル",
+                description=f"こんにちは、{member.display_name}さん！\nこのチャンネルでタスクの通知を受け取ります。",
+                color=discord.Color.blue()))
+        except Exception:
+            pass
+        return ch
+
+    def on_channel_delete(self, channel: discord.abc.GuildChannel):
+        """on_guild_channel_delete から呼ぶ"""
+        self._forget(channel.id)
+
+
+personal_channels = ChannelRegistry()
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+# cogs/ - mybot の拡張（bot.load_extension で読む）
+# タスク作成・ボタン・メッセージの振り分けは mybot.py 本体に置き、ここには無くても READY・指示・ボタンが動く
+# 設定／保守用のコマンドだけを置く。mybot は startup.extension(..., lazy=True) で READY 後に読む。
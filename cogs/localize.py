@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# cogs/localize.py - 英語のラベルで送られた古い embed を日本語に直す（!日本語化）
+# 新しい embed は build_embed / Renderer が表示モード（i18n.py）の文言で作るので、これは過去のメッセージ用
+import discord
+from discord.ext import commands
+
+_JP_LABEL = {
+    "Due Date": "期日",
+    "Due":      "期日",
+    "Status":   "状態",
+    "Updated":  "更新",
+    "Update":   "更新",
+}
+_JP_STATUS = {
+    "Pending":     "未受託",
+    "In Progress": "受託",
+    "Accepted":    "受託",
+    "Completed":   "完了",
+    "Declined":    "辞退",
+    "Problem":     "問題",
+    "Abandoned":   "問題発生",
+}
+
+def jp_build_localized(emb: discord.Embed, hide_task_id: bool = True) -> discord.Embed:
+    # 基本情報を引き継いで、新しいEmbedを作り直す（不要なTask IDもここで除去）
+    new = discord.Embed(title=emb.title, description=emb.description, color=emb.color)
+    new.url = emb.url
+    new.timestamp = emb.timestamp
+    if emb.author and emb.author.name:
+        new.set_author(name=emb.author.name, url=emb.author.url or discord.utils.MISSING,
+                       icon_url=emb.author.icon_url or discord.utils.MISSING)
+    if emb.footer and emb.footer.text:
+        new.set_footer(text=emb.footer.text, icon_url=emb.footer.icon_url or discord.utils.MISSING)
+    if emb.thumbnail and emb.thumbnail.url:
+        new.set_thumbnail(url=emb.thumbnail.url)
+    if emb.image and emb.image.url:
+        new.set_image(url=emb.image.url)
+
+    for f in emb.fields:
+        name = str(f.name).strip()
+        value = str(f.value)
+        if hide_task_id and name in ("Task ID", "TaskID", "タスクID"):
+            continue
+        name_jp = _JP_LABEL.get(name, name)
+        if name_jp == "状態":
+            value = _JP_STATUS.get(value.strip(), value)
+        new.add_field(name=name_jp, value=value, inline=f.inline)
+    return new
+
+
+class Localize(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    # 手動一括：直近のBotメッセージを日本語化（現在のチャンネル）
+    @commands.command(name="日本語化", aliases=["jp"])
+    async def jp(self, ctx: commands.Context, 件数: int = 30):
+        try:
+            件数 = max(1, min(件数, 200))
+            n = 0
+            me = self.bot.user.id if self.bot.user else 0
+            async for m in ctx.channel.history(limit=件数):
+                if m.author.id == me and m.embeds:
+                    emb = m.embeds[0]
+                    loc = jp_build_localized(emb, hide_task_id=True)
+                    if loc.fields != emb.fields:              # 日本語済みは PATCH しない
+                        await m.edit(embed=loc)
+                        n += 1
+            await ctx.reply(f"日本語化しました：{n}件")
+        except Exception:
+            await ctx.reply("日本語化中にエラーが発生しました。")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Localize(bot))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# cogs/preferences.py - ギルド／ユーザーごとの設定（表示モード・タイムゾーン）。値は settings.py の設定ストア
+import logging
+
+from discord.ext import commands
+
+import i18n
+from i18n import display_modes
+from timezones import tzstore
+
+logger = logging.getLogger("taskbot")
+
+MODE_NAME = {"jp": "日本語", "num": "数字", "en": "英語"}
+
+
+class Preferences(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    # 表示形式の切替（このギルドだけ）： !表示 日本語 / 数字 / 英語 / 確認
+    @commands.command(name="表示")
+    async def display(self, ctx: commands.Context, モード: str = "確認"):
+        try:
+            if モード in ("確認", "status", "check"):
+                cur = await display_modes.get(ctx.guild.id if ctx.guild else None)
+                await ctx.reply(f"現在の表示: **{MODE_NAME[cur]}**")
+                return
+            mode = i18n.parse_mode(モード)
+            if mode is None or ctx.guild is None:
+                await ctx.reply("使い方: `!表示 日本語` / `!表示 数字` / `!表示 英語` / `!表示 確認`（サーバー内で）")
+                return
+            await display_modes.set(ctx.guild.id, mode)
+            await ctx.reply(f"表示を **{MODE_NAME[mode]}** に切り替えました。")
+        except Exception:
+            await ctx.reply("表示設定の更新に失敗しました。")
+
+    @commands.command(name="タイムゾーン", aliases=["timezone", "tz"])
+    async def timezone(self, ctx: commands.Context, name: str = "", scope: str = ""):
+        """!タイムゾーン … 確認 / !タイムゾーン Asia/Tokyo … サーバー既定（管理者）/ !タイムゾーン Asia/Tokyo 自分 … 自分だけ"""
+        if not ctx.guild:
+            return
+        try:
+            if not name:
+                await ctx.reply(f"🕒 タイムゾーン: {await tzstore.get(ctx.guild.id, ctx.author.id)}（期日の入力・表示に使います）")
+                return
+            personal = scope.lower() in ("me", "自分")
+            if not personal and not ctx.author.guild_permissions.administrator:
+                await ctx.reply("❌ サーバー既定の変更は管理者のみです（自分だけなら `!タイムゾーン Asia/Tokyo 自分`）")
+                return
+            await tzstore.set(ctx.guild.id, name, ctx.author.id if personal else None)
+            await ctx.reply(f"✅ {'あなた' if personal else 'このサーバー'}のタイムゾーンを {name} にしました。")
+        except ValueError:
+            await ctx.reply("❌ タイムゾーン名が不正です。例: Asia/Tokyo / Asia/Singapore / UTC")
+        except Exception as e:
+            logger.error(f"[timezone] {e}", exc_info=True)
+            await ctx.reply("❌ 実行中にエラーが発生しました。")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Preferences(bot))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# cogs/threads.py - スレッド名の色（先頭絵文字）の手動同期と、スレッド ↔ タスクの手動紐付け
+# 以前は COLOR_COMMANDS_INSTALL / COLOR_ENFORCER / BIND_THREAD_TO_TASK（2回）が同じ補助関数をそれぞれ持っていた。
+# 名前の組み立ては threadsync.renamed、反映は renamer（スレッドごとの枠）の1か所だけ。
+import logging
+
+import discord
+from discord.ext import commands
+
+from renamer import renamer
+from taskcache import task_cache
+from threadsync import renamed
+
+logger = logging.getLogger("taskbot")
+
+
+class ThreadTools(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @property
+    def thread_sync(self):
+        return self.bot.thread_sync                # mybot が起動時に持たせる ThreadReconciler
+
+    # 手動ワンショット修正：現在のスレッドだけ即同期
+    @commands.command(name="色直す", aliases=["fixcolor"])
+    async def fixcolor(self, ctx: commands.Context):
+        """（スレッドの中で実行）スレッド名の色をDBのstatusに合わせて即同期"""
+        try:
+            if not isinstance(ctx.channel, discord.Thread):
+                await ctx.reply("このコマンドは**スレッドの中**で実行してください。")
+                return
+            status = await task_cache.status_by_thread(ctx.channel.id)
+            if status is None:
+                await ctx.reply("このスレッドに対応するタスクが見つかりませんでした。")
+                return
+            renamer.request(ctx.channel, renamed(ctx.channel.name, status))   # 10分2回の枠が空いた時に最新の名前だけ反映
+            await ctx.reply(f"同期しました： {status}")
+        except Exception as e:
+            logger.error(f"[fixcolor] error: {e}", exc_info=True)
+            await ctx.reply("エラーが発生しました。")
+
+    # 全件の突き合わせ（管理者）：ずれているスレッドだけ名前を直す
+    @commands.command(name="色全同期", aliases=["色監視オン", "resync"])
+    @commands.has_permissions(administrator=True)
+    async def resync_colors(self, ctx: commands.Context):
+        queued = await self.thread_sync.sweep()
+        await ctx.reply(f"色のずれ {queued} 件を同期キューに入れました。" if queued else "すべて同期済みです。")
+
+    @commands.command(name="紐付け", aliases=["bind"])
+    async def bind_thread(self, ctx: commands.Context, task_id: int):
+        """（スレッド内）このスレッドを指定Task IDに紐付けて、色も即同期します"""
+        try:
+            if not isinstance(ctx.channel, discord.Thread):
+                await ctx.reply("このコマンドは**スレッドの中**で実行してください。")
+                return
+            if await task_cache.execute("UPDATE tasks SET thread_id=? WHERE id=?", (ctx.channel.id, task_id), task_id) is None:
+                await ctx.reply(f"❌ Task ID {task_id} が見つかりません。")
+                return
+            t = await task_cache.get(task_id)
+            status = t.status if t else "pending"
+            self.thread_sync.publish(ctx.channel.id, status)
+            await ctx.reply(f"✅ 紐付け完了（Task ID {task_id} / status={status}）")
+        except Exception as e:
+            logger.error(f"[bind] error: {e}", exc_info=True)
+            await ctx.reply("❌ 紐付け中にエラーが発生しました。")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(ThreadTools(bot))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# dateparse.py - 期日の文字列（日本語・英語）を datetime に
+# 以前の parse_date は呼ぶたびに正規表現とラムダの表・曜日の dict を作り直し、未コンパイルの
+# パターンを順に re.match し、曜日は部分文字列で探していた（"8月23日" の "月" が月曜に、"sunset" が日曜になる）。
+# ここでは式をモジュール読み込み時に1本の正規表現にコンパイルし、1回の fullmatch で種類まで決める。
+# 結果は「今」の分単位とタイムゾーンにしか依存しないので、同じ分の中の同じ入力はメモから返す。
+# tz を渡すと「今」も結果もそのタイムゾーンの aware な datetime になる（DB には timezones.to_epoch で入れる）。
+#   受け付ける形（末尾に "18:00" / "18時" / "18時30分" / "18時半" を付けられる。無ければ 23:59）
+#     今日 明日 明後日 昨日 / today tomorrow "day after tomorrow" yesterday
+#     3日後 2週間後 5時間後 30分後 / 3 days, 2 weeks, 5 hours, 30 min（時間・分は時刻を付けなければそのまま）
+#     金 金曜 金曜日 / friday fri
+#     2025/08/23 2025-8-23 2025年8月23日 8/23 8月23日
+#     時刻だけ（"18時" "18:00"）は次にその時刻になる日時（今日、過ぎていれば明日）
+import re, unicodedata
+from datetime import datetime, timedelta, tzinfo
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TIME = (23, 59)
+MEMO_SIZE = 512
+
+_TIME = re.compile(r"\s*(?:(\d{1,2}):(\d{2})|(\d{1,2})時(?:(\d{1,2})分|(半))?)$")
+
+_DATE = re.compile(r"""
+    (?P<word>今日|today|明日|tomorrow|明後日|あさって|day\ after\ tomorrow|昨日|yesterday)
+  | (?P<n>\d+)\s*(?P<unit>日後|days?|週間後|weeks?|時間後|hours?|分後|mins?|minutes?)(?:\s*later)?
+  | (?P<wd>[月火水木金土日])(?:曜日?)?
+  | (?P<wde>monday|tuesday|wednesday|thursday|friday|saturday|sunday|mon|tue|wed|thu|fri|sat|sun)\.?
+  | (?P<y>\d{4})(?:[/-](?P<m>\d{1,2})[/-](?P<d>\d{1,2})|年(?P<m2>\d{1,2})月(?P<d2>\d{1,2})日)
+  | (?P<m3>\d{1,2})(?:[/-](?P<d3>\d{1,2})|月(?P<d4>\d{1,2})日)
+""", re.X)
+
+_WORDS = {"今日": 0, "today": 0, "明日": 1, "tomorrow": 1, "明後日": 2, "あさって": 2,
+          "day after tomorrow": 2, "昨日": -1, "yesterday": -1}
+_UNITS = {"日後": "days", "day": "days", "days": "days",
+          "週間後": "weeks", "week": "weeks", "weeks": "weeks",
+          "時間後": "hours", "hour": "hours", "hours": "hours",
+          "分後": "minutes", "min": "minutes", "mins": "minutes", "minute": "minutes", "minutes": "minutes"}
+_WEEKDAYS = {**{c: i for i, c in enumerate("月火水木金土日")},
+             **{n: i for i, n in enumerate(("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"))},
+             **{n: i for i, n in enumerate(("mon", "tue", "wed", "thu", "fri", "sat", "sun"))}}
+
+_memo: Dict[Tuple[str, Optional[tzinfo]], Optional[datetime]] = {}
+_memo_minute: Optional[datetime] = None
+
+
+def _split_time(t: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+    m = _TIME.search(t)
+    if not m:
+        return t, None
+    if m.group(1) is not None:
+        hm = (int(m.group(1)), int(m.group(2)))
+    else:
+        hm = (int(m.group(3)), 30 if m.group(5) else int(m.group(4) or 0))
+    return t[:m.start()].strip(), hm
+
+
+def _parse(t: str, now: datetime) -> Optional[datetime]:
+    t, hm = _split_time(t)
+    m = _DATE.fullmatch(t)
+    if not m and (t or hm is None):
+        return None
+    hour, minute = hm or DEFAULT_TIME
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    today = now.replace(second=0, microsecond=0)
+    if not m:
+        base = today.replace(hour=hour, minute=minute)
+        return base if base > now else base + timedelta(days=1)
+    kind = m.lastgroup
+    if kind == "word":
+        base = today + timedelta(days=_WORDS[m["word"]])
+    elif kind == "unit":
+        unit = _UNITS[m["unit"]]
+        base = today + timedelta(**{unit: int(m["n"])})
+        if hm is None and unit in ("hours", "minutes"):
+            return base                               # "3時間後" は3時間後そのもの
+    elif kind in ("wd", "wde"):
+        d = _WEEKDAYS[m[kind]] - now.weekday()
+        base = today + timedelta(days=d + 7 if d <= 0 else d)
+    else:
+        y = int(m["y"]) if m["y"] else now.year
+        mo, d = (int(x) for x in (m["m"] or m["m2"] or m["m3"], m["d"] or m["d2"] or m["d3"] or m["d4"]))
+        try:
+            return datetime(y, mo, d, hour, minute, tzinfo=now.tzinfo)
+        except ValueError:
+            return None
+    return base.replace(hour=hour, minute=minute)
+
+
+def normalize(s: str) -> str:
+    """全角数字・記号・空白を半角に、英字を小文字に、空白を1つに"""
+    return " ".join(unicodedata.normalize("NFKC", s or "").lower().split())
+
+
+def parse_date(s: str, now: Optional[datetime] = None, tz: Optional[tzinfo] = None) -> Optional[datetime]:
+    """期日の文字列 -> datetime（読めなければ None）。tz はギルド／ユーザーのタイムゾーン"""
+    global _memo_minute
+    now = now.astimezone(tz) if now and tz else now or datetime.now(tz)
+    minute = now.replace(second=0, microsecond=0)
+    if minute != _memo_minute or len(_memo) >= MEMO_SIZE:
+        _memo.clear()
+        _memo_minute = minute
+    key = (normalize(s), now.tzinfo)
+    try:
+        return _memo[key]
+    except KeyError:
+        dt = _memo[key] = _parse(key[0], now)
+        return dt
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# db.py - 常駐コネクションで SQLite に触るための共通レイヤ
+# 書き込みは1本の writer コネクション（ロックで直列化）、読み取りは N 本の reader プールを使い回す。
+# 各コネクションは prepared statement をキャッシュするので、毎回 connect/close するより圧倒的に速い。
+# WAL モードなので reader（enforcer・リマインダ）が writer（ボタン操作）をブロックしない。
+import asyncio, functools, queue, re, sqlite3, threading, time, logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Iterable, Callable
+
+import schema
+from metrics import metrics
+
+logger = logging.getLogger("taskbot")
+
+DB_PATH = "reminder_bot.db"
+READERS = 4            # 読み取りコネクション数
+STMT_CACHE = 256       # コネクションごとの prepared statement キャッシュ数
+
+# 文ごとの実行時間（reader / writer の待ちを含む）。BEGIN〜COMMIT 全体は stmt="transaction"
+DB_SECONDS = metrics.histogram("taskbot_db_seconds", "SQLite time per statement incl. waiting for a connection",
+                               (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0),
+                               labels=("stmt",))
+_IN_LIST = re.compile(r"\(\?(?:\s*,\s*\?)+\)")
+
+
+@functools.lru_cache(maxsize=512)
+def _stmt(sql: str) -> str:
+    """ラベル用：空白を詰め、IN (?,?,...) の長さの違いをまとめて先頭 80 文字"""
+    return _IN_LIST.sub("(?...)", " ".join(sql.split()))[:80]
+
+
+class Database:
+    """writer 1本 + reader N本 を保持する SQLite アクセス層"""
+
+    def __init__(self, path: str = DB_PATH, readers: int = READERS, migrate: bool = True):
+        self.path = path
+        self._wlock = threading.RLock()
+        self._writer = self._connect()
+        # スキーマはここで1回だけ（reader を開く前に）最新化する
+        self.schema_version = schema.migrate(self._writer) if migrate else None
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = [self._writer]
+        for _ in range(max(1, readers)):
+            c = self._connect()
+            self._all.append(c)
+            self._readers.put(c)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: 自動コミット。まとめたい時は transaction() を使う
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False,
+                               isolation_level=None, cached_statements=STMT_CACHE)
+        schema.apply_pragmas(conn)
+        return conn
+
+    # --- 読み取り（reader プール） ---
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def query(self, sql: str, params: tuple = (), factory: Optional[Callable] = None) -> list:
+        """factory を渡すとカーソルの row_factory にする（例: task.task_factory）"""
+        t = time.perf_counter()
+        try:
+            with self.reader() as conn:
+                cur = conn.execute(sql, params)
+                cur.row_factory = factory
+                return cur.fetchall()
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t, _stmt(sql))
+
+    def query_one(self, sql: str, params: tuple = (), factory: Optional[Callable] = None):
+        t = time.perf_counter()
+        try:
+            with self.reader() as conn:
+                cur = conn.execute(sql, params)
+                cur.row_factory = factory
+                return cur.fetchone()
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t, _stmt(sql))
+
+    # --- 書き込み（writer 1本） ---
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """書き込み1文（自動コミット）。lastrowid / rowcount は戻り値から取る"""
+        t = time.perf_counter()
+        try:
+            with self._wlock:
+                return self._writer.execute(sql, params)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t, _stmt(sql))
+
+    def executemany(self, sql: str, seq: Iterable[tuple]) -> int:
+        t = time.perf_counter()
+        try:
+            with self.transaction() as conn:
+                return conn.executemany(sql, seq).rowcount
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t, _stmt(sql))
+
+    @contextmanager
+    def transaction(self):
+        """writer を握って BEGIN IMMEDIATE〜COMMIT（例外時は ROLLBACK）"""
+        t = time.perf_counter()
+        try:
+            with self._wlock:
+                conn = self._writer
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                else:
+                    conn.execute("COMMIT")
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t, "transaction")
+
+    # --- 旧 db_exec 互換 ---
+    def run(self, sql: str, params: tuple = (), fetch: bool = False):
+        """db_exec(q, params, fetch) と同じ呼び方。SELECT は reader、それ以外は writer"""
+        if fetch and sql.lstrip()[:6].upper() == "SELECT":
+            return self.query(sql, params)
+        t = time.perf_counter()
+        try:
+            with self._wlock:
+                cur = self._writer.execute(sql, params)
+                return cur.fetchall() if fetch else None
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - t, _stmt(sql))
+
+    def close(self):
+        for c in self._all:
+            try: c.close()
+            except Exception: pass
+
+
+class AsyncDatabase:
+    """Database の各操作を専用スレッドで実行して awaitable を返す（ゲートウェイのループを止めない）。
+    db の代わりに opener（Database を返す関数）を渡すと、接続・マイグレーションも最初の操作の時に DB スレッドで行う"""
+
+    def __init__(self, db: Optional[Database] = None, workers: int = READERS + 1,
+                 opener: Optional[Callable[[], Database]] = None):
+        self._db = db
+        self._opener = opener
+        self._opening: Optional[asyncio.Future] = None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+
+    @property
+    def db(self) -> Database:
+        if self._db is None:
+            raise RuntimeError("AsyncDatabase is not open yet (await open() first)")
+        return self._db
+
+    async def open(self) -> Database:
+        """Database を DB スレッドで開く（2回目以降・同時に呼ばれても開くのは1回）"""
+        if self._db is None:
+            if self._opening is None:
+                self._opening = asyncio.get_running_loop().run_in_executor(self._pool, self._opener)
+            try:
+                self._db = await asyncio.shield(self._opening)
+            except BaseException:
+                if self._opening.done():
+                    self._opening = None          # 開けなかった：次の操作でやり直す
+                raise
+        return self._db
+
+    async def call(self, fn: Callable, *args):
+        """任意の同期関数（DBを触るもの）を DB スレッドで実行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args))
+
+    async def query(self, sql: str, params: tuple = (), factory: Optional[Callable] = None) -> list:
+        db = self._db or await self.open()
+        return await self.call(db.query, sql, params, factory)
+
+    async def query_one(self, sql: str, params: tuple = (), factory: Optional[Callable] = None):
+        db = self._db or await self.open()
+        return await self.call(db.query_one, sql, params, factory)
+
+    async def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        db = self._db or await self.open()
+        return await self.call(db.execute, sql, params)
+
+    async def executemany(self, sql: str, seq: Iterable[tuple]) -> int:
+        db = self._db or await self.open()
+        return await self.call(db.executemany, sql, list(seq))
+
+    async def run(self, sql: str, params: tuple = (), fetch: bool = False):
+        db = self._db or await self.open()
+        return await self.call(db.run, sql, params, fetch)
+
+    async def transaction(self, fn: Callable):
+        """fn(conn) を1トランザクションで実行して戻り値を返す"""
+        db = self._db or await self.open()
+        def _tx():
+            with db.transaction() as conn:
+                return fn(conn)
+        return await self.call(_tx)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+_default: Optional[Database] = None
+_default_async: Optional[AsyncDatabase] = None
+_default_lock = threading.Lock()
+
+def get_db() -> Database:
+    """プロセス共通の Database（初回呼び出し時に接続＋マイグレーション）"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Database(DB_PATH)
+    return _default
+
+def get_adb() -> AsyncDatabase:
+    """get_db() を包んだ非同期版（async ハンドラからはこちらを使う）。ここでは I/O をしない：
+    接続とマイグレーション（v6 は全行の書き換え）は最初の操作の時に DB スレッドで get_db() が行う"""
+    global _default_async
+    if _default_async is None:
+        with _default_lock:
+            if _default_async is None:
+                _default_async = AsyncDatabase(_default, opener=get_db)
+    return _default_async
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# delivery.py - リマインダの一括配信
+# 宛先ごとに embed をまとめて1通にし（1メッセージ MAX_EMBEDS 個まで）、宛先をまたいでは並行に送る。
+# discord.py の HTTPClient は送信先チャンネル（ルート）ごとのバケットでレート制限を待つので、
+# 同じ宛先は直列・別の宛先は並行にしておけば、1件ずつ直列に送るより桁違いに速く、429 も踏まない。
+# 並列度は CONCURRENCY で頭打ちにする（グローバル制限 50 req/s を一気に食い潰さないため）。
+import asyncio, logging
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Tuple
+
+logger = logging.getLogger("taskbot")
+
+MAX_EMBEDS = 10        # Discord の1メッセージあたりの embed 上限
+CONCURRENCY = 8        # 同時に送るメッセージ数
+
+
+def group(items: Iterable[Tuple[Hashable, object]]) -> Dict[Hashable, list]:
+    """(宛先キー, 中身) の列を宛先ごとにまとめる（順序は最初に出てきた順）"""
+    out: Dict[Hashable, list] = {}
+    for key, payload in items:
+        out.setdefault(key, []).append(payload)
+    return out
+
+def chunks(seq: list, n: int = MAX_EMBEDS) -> List[list]:
+    return [seq[i:i + n] for i in range(0, len(seq), n)]
+
+
+async def deliver(items: Iterable[Tuple[Hashable, object]],
+                  send: Callable[[Hashable, list], Awaitable[None]],
+                  concurrency: int = CONCURRENCY) -> Tuple[int, int]:
+    """send(key, [payload, ...]) を宛先ごとに呼ぶ。戻り値は (送れた件数, 失敗した件数)"""
+    groups = group(items)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(key, payloads) -> int:
+        ok = 0
+        for part in chunks(payloads):          # 同じ宛先（= 同じルート）は順番に
+            async with sem:
+                try:
+                    await send(key, part)
+                    ok += len(part)
+                except Exception as e:
+                    logger.warning(f"[delivery] {key}: {len(part)} item(s) failed: {type(e).__name__}: {e}")
+        return ok
+
+    results = await asyncio.gather(*(_one(k, v) for k, v in groups.items()))
+    sent = sum(results)
+    return sent, sum(len(v) for v in groups.values()) - sent
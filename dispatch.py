@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# dispatch.py - ボタン操作（コンポーネント interaction）の唯一の入口
+# custom_id は "<action>_<task_id>"（例: accept_task_12）。ここで1回だけ分解し、dict で handler に振り分ける。
+# 以前は on_interaction / __link_rename_notify / TaskView のコールバックが同じクリックをそれぞれ
+# 正規表現で解析して DB を読み直していた（0.30秒の sleep で競合を避けていた）。
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import discord
+
+from interactions import Ack, InteractionLifecycle, lifecycle
+from task import SELECT as TASK_SELECT, task_factory
+from taskcache import task_cache
+
+logger = logging.getLogger("taskbot")
+
+# action -> 遷移先の status
+TASK_ACTIONS = {
+    "accept_task": "accepted",
+    "decline_task": "declined",
+    "complete_task": "completed",
+    "abandon_task": "abandoned",
+    "undo_completion": "accepted",
+}
+# action -> その action を受け付ける現在の status（TaskView が出すボタンと同じ。古いメッセージのボタンは弾く）
+ALLOWED_FROM = {
+    "accept_task": ("pending",),
+    "decline_task": ("pending",),
+    "complete_task": ("accepted", "abandoned"),
+    "abandon_task": ("accepted",),
+    "undo_completion": ("completed", "abandoned"),
+}
+
+
+def parse_custom_id(cid: str) -> Optional[Tuple[str, int]]:
+    """'accept_task_12' -> ('accept_task', 12)。形式が違えば None"""
+    action, sep, num = (cid or "").rpartition("_")
+    if not sep or not num.isdigit():
+        return None
+    return action, int(num)
+
+
+def apply_transition(conn, task_id: int, user_id: int, action: str):
+    """状態遷移を1トランザクションで（DBスレッドで実行）。キャッシュには触らない（COMMIT 後に transition() が入れる）。
+    戻り値: ("missing" / "forbidden" / "invalid", None, None) / ("ok", thread_id, 更新後の Task)"""
+    row = conn.execute("SELECT assignee_id, status FROM tasks WHERE id=?", (task_id,)).fetchone()
+    if not row:
+        return "missing", None, None
+    if row[0] != user_id:
+        return "forbidden", None, None
+    if (row[1] or "pending") not in ALLOWED_FROM[action]:
+        return "invalid", None, None
+    conn.execute("UPDATE tasks SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?", (TASK_ACTIONS[action], task_id))
+    cur = conn.execute(f"{TASK_SELECT} WHERE id=?", (task_id,))
+    cur.row_factory = task_factory
+    t = cur.fetchone()
+    return "ok", t.thread_id, t
+
+
+async def transition(adb, task_id: int, user_id: int, action: str, cache=task_cache):
+    """apply_transition を1トランザクションで実行し、COMMIT できたら更新後の行を cache に入れる"""
+    res = await adb.transaction(lambda c: apply_transition(c, task_id, user_id, action))
+    if res[0] == "ok":
+        cache.put(res[2])
+    return res
+
+
+Handler = Callable[[Ack, str, int], Awaitable[None]]
+
+class Dispatcher:
+    def __init__(self, lc: Optional[InteractionLifecycle] = None):
+        self.routes: Dict[str, Handler] = {}
+        self.lifecycle = lc or lifecycle
+        self.handled = 0
+
+    def route(self, *actions: str):
+        """@dispatcher.route("accept_task", ...) で handler(ack, action, task_id) を登録"""
+        def deco(fn: Handler):
+            for a in actions:
+                self.routes[a] = fn
+            return fn
+        return deco
+
+    async def dispatch(self, inter: discord.Interaction) -> bool:
+        """担当の handler があれば True。handler は ack.edit / ack.send で応答し、
+        ACK_BUDGET 内に応答しなければ lifecycle が defer して handler の続きはバックグラウンドで走る"""
+        if inter.type != discord.InteractionType.component:
+            return False
+        parsed = parse_custom_id((inter.data or {}).get("custom_id"))
+        handler = self.routes.get(parsed[0]) if parsed else None
+        if handler is None:
+            return False
+        self.handled += 1
+        await self.lifecycle.run(inter, parsed[0], lambda ack: handler(ack, *parsed))
+        return True
+
+    def summary(self) -> str:
+        return self.lifecycle.hist.summary()
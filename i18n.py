@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# i18n.py - embed の文言と日付の書式（ギルドの表示モードごと）
+# 以前は build_embed が英語のラベル（Due Date / Status / Updated）で送り、Bot 自身の発言を on_message で拾って
+# _jp_build_localized で作り直し、msg.edit でもう1回 PATCH していた（1通につき REST 2回・表示のちらつき）。
+# 今は embed を作る時点でモードの文言にするので、送るのは最終形の1回だけ。
+# 表示モード（settings の "display_mode:<guild_id>"。無ければ旧来の全体設定 "display_mode"、それも無ければ jp）
+#   jp  : 日本語ラベル・日付は「2025年08月23日（土） 18:00」
+#   num : 日本語ラベル・日付は「2025/08/23 18:00」
+#   en  : 英語ラベル・日付は「2025/08/23 18:00」
+from datetime import datetime
+from typing import Optional
+
+from settings import Setting, SettingsStore, settings
+
+MODES = ("jp", "num", "en")
+DEFAULT_MODE = "jp"
+GLOBAL_KEY = "display_mode"
+
+_LABELS = {
+    "ja": {"due": "期日", "status": "状態", "updated": "更新", "task": "タスク", "assignee": "担当",
+           "instructor": "指示者", "created": "作成日時", "detail": "タスク詳細", "task_updated": "タスク更新"},
+    "en": {"due": "Due Date", "status": "Status", "updated": "Updated", "task": "Task", "assignee": "Assignee",
+           "instructor": "Instructor", "created": "Created", "detail": "Task Details", "task_updated": "Task Updated"},
+}
+_STATUS = {
+    "ja": {"pending": "未受託", "accepted": "受託", "completed": "完了", "declined": "辞退", "abandoned": "問題発生"},
+    "en": {"pending": "Pending", "accepted": "In Progress", "completed": "Completed", "declined": "Declined",
+           "abandoned": "Problem"},
+}
+_JP_WD = "月火水木金土日"
+
+
+def lang(mode: str) -> str:
+    return "en" if mode == "en" else "ja"
+
+def label(mode: str, key: str) -> str:
+    return _LABELS[lang(mode)][key]
+
+def status_name(mode: str, st: str) -> str:
+    return _STATUS[lang(mode)].get(st, st)
+
+def fmt_dt(dt: datetime, mode: str) -> str:
+    if mode == "jp":
+        return dt.strftime(f"%Y年%m月%d日（{_JP_WD[dt.weekday()]}） %H:%M")
+    return dt.strftime("%Y/%m/%d %H:%M")
+
+def parse_mode(text: str) -> Optional[str]:
+    """"日本語" / "数字" / "英語" / jp / num / en -> モード（知らなければ None）"""
+    t = (text or "").strip().lower()
+    if t.startswith("num") or t.startswith("数字"):
+        return "num"
+    if t.startswith("en") or t.startswith("英"):
+        return "en"
+    if t.startswith("jp") or t.startswith("ja") or t.startswith("日本"):
+        return "jp"
+    return None
+
+
+def _mode(raw: str) -> str:
+    if raw not in MODES:
+        raise ValueError(f"unknown display mode: {raw}")
+    return raw
+
+# ギルドの "display_mode:<guild_id>" → 全体の "display_mode" → jp
+DISPLAY_MODE = Setting(GLOBAL_KEY, DEFAULT_MODE, parse=_mode)
+
+
+class DisplayModes:
+    """ギルド -> 表示モード（settings.py の設定ストアを引くだけ）"""
+
+    def __init__(self, adb=None, store: Optional[SettingsStore] = None):
+        self.store = store if store is not None else (SettingsStore(adb) if adb is not None else settings)
+
+    def now(self, guild_id: Optional[int]) -> str:
+        """I/O なしで（設定の読み込み前は既定値）"""
+        return self.store.get(DISPLAY_MODE, guild_id)
+
+    async def get(self, guild_id: Optional[int]) -> str:
+        if not self.store.loaded:
+            await self.store.load()
+        return self.store.get(DISPLAY_MODE, guild_id)
+
+    async def set(self, guild_id: int, mode: str) -> str:
+        return await self.store.set(DISPLAY_MODE, mode, guild_id)
+
+
+display_modes = DisplayModes()
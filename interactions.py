@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# interactions.py - interaction の応答（ack）を時間内に必ず返すための層
+# Discord は interaction に 3秒以内の応答を求める。DB・チャンネル作成・送信を全部終えてから
+# response を返すと、混んでいる時にこれを超えて「インタラクションに失敗しました」になる。
+# lifecycle.run(inter, 名前, work) は work(ack) をバックグラウンドで走らせ、
+#   - 予算（ACK_BUDGET 秒）内に work が ack.send / ack.edit すればそれがそのまま応答、
+#   - 間に合わなければこちらで defer して、work の結果は followup / 元メッセージの編集で返す。
+# コマンドごとに ack までの時間をヒストグラムに記録し、p50/p99 を出せる。
+import asyncio, bisect, logging, time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import discord
+
+from metrics import metrics
+
+logger = logging.getLogger("taskbot")
+
+ACK_BUDGET = 1.5       # 受信からこの秒数で ack が無ければ defer する（締切は3秒）
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 1500, 2000, 3000, 5000)
+
+ACK_SECONDS = metrics.histogram("taskbot_interaction_ack_seconds", "Time from interaction receipt to ack, by command",
+                                [b / 1000 for b in BUCKETS_MS], labels=("command",))
+DEFERRED = metrics.counter("taskbot_interaction_deferred_total", "Interactions deferred because work missed the ack budget",
+                           labels=("command",))
+
+
+class AckHistogram:
+    """コマンドごとの ack 時間（ms）の固定バケット・ヒストグラム"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts: Dict[str, List[int]] = {}
+        self.deferred: Dict[str, int] = {}
+
+    def record(self, name: str, ms: float, deferred: bool = False):
+        c = self.counts.setdefault(name, [0] * (len(self.buckets) + 1))
+        c[bisect.bisect_left(self.buckets, ms)] += 1
+        if deferred:
+            self.deferred[name] = self.deferred.get(name, 0) + 1
+
+    def total(self, name: str) -> int:
+        return sum(self.counts.get(name, ()))
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        """q (0〜1) 分位が入るバケットの上限（ms）。最後のバケットを超えたものは inf"""
+        c = self.counts.get(name)
+        if not c:
+            return None
+        need, seen = q * sum(c), 0
+        for i, n in enumerate(c):
+            seen += n
+            if n and seen >= need:
+                return float(self.buckets[i]) if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def summary(self) -> str:
+        parts = []
+        for name in sorted(self.counts):
+            parts.append(f"{name}: n={self.total(name)} p50≤{self.percentile(name, 0.5):.0f}ms "
+                         f"p99≤{self.percentile(name, 0.99):.0f}ms deferred={self.deferred.get(name, 0)}")
+        return "ack " + (" / ".join(parts) if parts else "(none)")
+
+
+class Ack:
+    """work に渡す応答窓口。ack 前なら response、ack 後なら followup / 元メッセージ編集に振り分ける"""
+
+    def __init__(self, inter: discord.Interaction, name: str, hist: AckHistogram, started: float):
+        self.inter = inter
+        self.name = name
+        self._hist = hist
+        self._started = started
+        self._lock = asyncio.Lock()
+        self.acked = asyncio.Event()
+        self.ack_ms: Optional[float] = None
+        self.deferred = False
+
+    def _mark(self, deferred: bool = False):
+        self.ack_ms = (time.perf_counter() - self._started) * 1000
+        self.deferred = deferred
+        self._hist.record(self.name, self.ack_ms, deferred)
+        ACK_SECONDS.observe(self.ack_ms / 1000, self.name)
+        if deferred:
+            DEFERRED.inc(self.name)
+        self.acked.set()
+
+    async def send(self, *args, **kw):
+        async with self._lock:
+            if not self.inter.response.is_done():
+                await self.inter.response.send_message(*args, **kw)
+                self._mark()
+                return
+        await self.inter.followup.send(*args, **kw)
+
+    async def edit(self, **kw):
+        """ボタンの付いたメッセージを編集（component 用）"""
+        async with self._lock:
+            if not self.inter.response.is_done():
+                await self.inter.response.edit_message(**kw)
+                self._mark()
+                return
+        await self.inter.edit_original_response(**kw)
+
+    async def defer(self, **kw):
+        async with self._lock:
+            if not self.inter.response.is_done():
+                await self.inter.response.defer(**kw)
+                self._mark(deferred=True)
+
+
+def _elapsed_since_created(inter: discord.Interaction) -> float:
+    """ゲートウェイから届くまでにすでに経った秒数（取れなければ 0）"""
+    try:
+        return max(0.0, (datetime.now(timezone.utc) - inter.created_at).total_seconds())
+    except Exception:
+        return 0.0
+
+
+class InteractionLifecycle:
+    def __init__(self, budget: float = ACK_BUDGET):
+        self.budget = budget
+        self.hist = AckHistogram()
+        self._bg: set = set()          # 走っている work（GC で消えないように参照を持つ）
+
+    def spawn(self, coro) -> asyncio.Task:
+        """応答の後に続ける処理をバックグラウンドで（参照を持ち、drain() で待てる）"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._bg.add(task)
+        task.add_done_callback(self._bg.discard)
+        return task
+
+    async def run(self, inter: discord.Interaction, name: str,
+                  work: Callable[[Ack], Awaitable[None]], *, ephemeral: bool = False) -> Ack:
+        """work(ack) を走らせ、ack が済んだら（または予算切れで defer したら）戻る。work はその後も続く"""
+        ack = Ack(inter, name, self.hist, time.perf_counter())
+        task = self.spawn(self._guard(ack, work, ephemeral))
+        waiter = asyncio.ensure_future(ack.acked.wait())
+        budget = max(0.0, self.budget - _elapsed_since_created(inter))
+        try:
+            await asyncio.wait({task, waiter}, timeout=budget, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if not ack.acked.is_set():
+            try:
+                if inter.type == discord.InteractionType.component:
+                    await ack.defer()                                   # 「考え中」を出さずに元メッセージを保持
+                else:
+                    await ack.defer(ephemeral=ephemeral, thinking=True)
+            except Exception as e:
+                logger.warning(f"[ack] {name}: defer failed: {e}")
+        return ack
+
+    async def _guard(self, ack: Ack, work, ephemeral: bool):
+        try:
+            await work(ack)
+        except Exception as e:
+            logger.error(f"[ack] {ack.name}: {e}", exc_info=True)
+            try:
+                await ack.send("❌ 実行中にエラーが発生しました。", ephemeral=True)
+            except Exception:
+                pass
+        if not ack.acked.is_set():
+            # 何も返さずに終わった work：interaction を失敗させないよう defer だけしておく
+            try:
+                if ack.inter.type == discord.InteractionType.component:
+                    await ack.defer()
+                else:
+                    await ack.defer(ephemeral=ephemeral)
+            except Exception:
+                pass
+
+    async def drain(self):
+        """走っている work を全部待つ（停止時・テスト用）"""
+        if self._bg:
+            await asyncio.gather(*list(self._bg), return_exceptions=True)
+
+
+lifecycle = InteractionLifecycle()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# logpipe.py - ログはキューに積むだけにして、ファイル／コンソールへの書き込みは別スレッドで
+# 以前は logging.basicConfig が root に同期の FileHandler("bot.log") を付けていて、logger.info 1回ごとに
+# イベントループの上でファイルへ write していた（safe_run.py は discord.http / discord.gateway を DEBUG にする）。
+# ここでは:
+#   - root には QueueHandler だけを付け、QueueListener（スレッド1本）が StreamHandler と RotatingFileHandler に書く
+#   - bot.log はサイズで回す（LOG_MAX_BYTES / LOG_BACKUPS）。LOG_JSON=1 なら1行1 JSON
+#   - 量の多いロガー（メッセージごとの probe 等）には sample() で間引き（N件に1件）と毎秒の上限を付けられる
+#     WARNING 以上は間引かない
+# 環境変数：LOG_FILE（既定 bot.log）LOG_JSON LOG_MAX_BYTES LOG_BACKUPS
+#           LOG_PROBE=1 でメッセージごとの probe（"taskbot.probe"、router.py）を出す。LOG_PROBE_EVERY / LOG_PROBE_PER_SEC で間引き
+import atexit, json, logging, logging.handlers, os, queue, sys, threading, time
+from typing import Dict, List, Optional
+
+FORMAT = "%(asctime)s %(levelname)-8s %(message)s"
+PROBE = "taskbot.probe"
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1 JSON（ts, level, logger, msg。extra= で渡した値もそのまま入れる）"""
+    _STD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+               "msg": record.getMessage()}
+        for k, v in vars(record).items():
+            if k not in self._STD:
+                out[k] = v
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class Sampler(logging.Filter):
+    """every 件に1件だけ通し、さらに毎秒 per_sec 件まで（トークンバケツ）。WARNING 以上は常に通す"""
+
+    def __init__(self, every: int = 1, per_sec: Optional[float] = None):
+        super().__init__()
+        self.every = max(1, int(every))
+        self.per_sec = per_sec
+        self._n = 0
+        self._tokens = per_sec or 0.0
+        self._t = time.monotonic()
+        self._lock = threading.Lock()                     # DB スレッドや discord.py のスレッドからも呼ばれる
+        self.passed = self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            self._n += 1
+            keep = self._n % self.every == 0
+            if keep and self.per_sec is not None:
+                now = time.monotonic()
+                self._tokens = min(self.per_sec, self._tokens + (now - self._t) * self.per_sec)
+                self._t = now
+                keep = self._tokens >= 1.0
+                if keep:
+                    self._tokens -= 1.0
+            if keep:
+                self.passed += 1
+            else:
+                self.dropped += 1
+            return keep
+
+
+class _Enqueue(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 標準の prepare は record を copy して書式化までする。同じプロセスのスレッドに渡すだけなので
+        # 引数を埋めた本文にするだけ（書式化・例外の整形は書き込みスレッドで）
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class _Listener(logging.handlers.QueueListener):
+    written = 0
+
+    def handle(self, record):
+        self.written += 1
+        super().handle(record)
+
+
+class LogPipeline:
+    def __init__(self, path: Optional[str] = "bot.log", json_lines: bool = False, max_bytes: int = 10 * 1024 * 1024,
+                 backups: int = 5, stream=sys.stderr):
+        fmt = JsonFormatter() if json_lines else logging.Formatter(FORMAT)
+        self.handlers: List[logging.Handler] = []
+        if stream is not None:
+            self.handlers.append(logging.StreamHandler(stream))
+        if path:
+            self.handlers.append(logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True))
+        for h in self.handlers:
+            h.setFormatter(fmt)
+        self.queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.handler = _Enqueue(self.queue)
+        self.listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+        self.samplers: Dict[str, Sampler] = {}
+        self._running = False
+
+    def install(self, level: int = logging.INFO, logger: Optional[logging.Logger] = None):
+        """logger（既定 root）のハンドラをこのキューだけにして書き込みスレッドを起こす"""
+        root = logger or logging.getLogger()
+        root.handlers[:] = [self.handler]
+        root.setLevel(level)
+        if not self._running:
+            self.listener.start()
+            self._running = True
+        return self
+
+    def stop(self):
+        """残りを書き切ってからスレッドを止める（atexit からも）"""
+        if self._running:
+            self._running = False
+            self.listener.stop()
+            for h in self.handlers:
+                try: h.flush()
+                except Exception: pass
+
+    def sample(self, name: str, every: int = 1, per_sec: Optional[float] = None) -> Sampler:
+        """ロガー name に間引きを付ける（付け直すと前のものは外す）"""
+        lg = logging.getLogger(name)
+        old = self.samplers.pop(name, None)
+        if old is not None:
+            lg.removeFilter(old)
+        s = self.samplers[name] = Sampler(every, per_sec)
+        lg.addFilter(s)
+        return s
+
+    def stats(self) -> str:
+        sampled = " ".join(f"{n}:{s.passed}/{s.passed + s.dropped}" for n, s in self.samplers.items())
+        return (f"log written={self.listener.written} queued={self.queue.qsize()}"
+                + (f" sampled {sampled}" if sampled else ""))
+
+
+pipeline: Optional[LogPipeline] = None
+
+
+def setup_logging(level: int = logging.INFO) -> LogPipeline:
+    """プロセスで1回だけ（2回目以降は level を下げるだけ。safe_run.py が DEBUG で先に呼ぶ）"""
+    global pipeline
+    if pipeline is not None:
+        root = logging.getLogger()
+        root.setLevel(min(root.level, level))
+        return pipeline
+    pipeline = LogPipeline(os.getenv("LOG_FILE", "bot.log"), json_lines=os.getenv("LOG_JSON") == "1",
+                           max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+                           backups=int(os.getenv("LOG_BACKUPS", 5))).install(level)
+    probe = logging.getLogger(PROBE)
+    if os.getenv("LOG_PROBE") == "1":
+        probe.setLevel(logging.INFO)
+        per_sec = os.getenv("LOG_PROBE_PER_SEC")
+        pipeline.sample(PROBE, every=int(os.getenv("LOG_PROBE_EVERY", 1)), per_sec=float(per_sec) if per_sec else None)
+    else:
+        probe.setLevel(logging.WARNING)
+    from metrics import metrics
+    metrics.gauge("taskbot_log_queue", "Log records waiting for the writer thread", pipeline.queue.qsize)
+    atexit.register(pipeline.stop)
+    return pipeline
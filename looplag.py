@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# looplag.py - イベントループの詰まり（ラグ）を計測する
+# 一定間隔で sleep し、予定より何 ms 遅れて起きたかを記録する。
+# 同期 I/O などでループが止まると、その分だけラグとして現れる。
+import asyncio, logging
+from typing import Optional
+
+from metrics import metrics
+
+logger = logging.getLogger("taskbot")
+
+LOOP_LAG = metrics.histogram("taskbot_loop_lag_seconds", "How late the event loop woke from a timed sleep",
+                             (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.25, warn_ms: float = 50.0):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+        self.over = 0              # warn_ms を超えた回数
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.samples if self.samples else 0.0
+
+    def record(self, lag_ms: float):
+        self.samples += 1
+        LOOP_LAG.observe(lag_ms / 1000)
+        self.last_ms = lag_ms
+        self.total_ms += lag_ms
+        if lag_ms > self.max_ms:
+            self.max_ms = lag_ms
+        if lag_ms > self.warn_ms:
+            self.over += 1
+            logger.warning(f"[looplag] event loop blocked {lag_ms:.1f}ms")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, (loop.time() - t - self.interval) * 1000))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def reset(self):
+        self.samples = 0; self.last_ms = self.max_ms = self.total_ms = 0.0; self.over = 0
+
+    def summary(self) -> str:
+        return (f"loop lag: last={self.last_ms:.1f}ms avg={self.avg_ms:.1f}ms "
+                f"max={self.max_ms:.1f}ms over{self.warn_ms:.0f}ms={self.over}")
+
+
+monitor = LoopLagMonitor()
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+# metrics.py - プロセス内のメトリクス（カウンタ・ヒストグラム・ゲージ）と /metrics（Prometheus テキスト）
+# 以前は実行時の情報を出す所が無かった（Reminderbot の heartbeat_check は定義だけで .start() されていない）。
+# 各モジュールは import 時に metrics.counter / histogram / gauge で自分の指標を登録し、その場で inc / observe する。
+#   interactions.py : ack までの時間（コマンド別）      db.py      : 文ごとの実行時間
+#   instrument_http : REST のルート別の回数・時間・429   renamer.py : 名前変更の適用待ち
+#   scheduler.py    : リマインダの遅れ（fire_at → 送信）  looplag.py : イベントループのラグ
+# 書き出しは !stats と、METRICS_PORT がある時だけ開く小さな HTTP（GET /metrics と /healthz）。
+# PORT しか無い時（PaaS の web）は 0.0.0.0 に /healthz だけを出す（ルート別の REST・DB の時間は公開しない）。
+# observe は DB スレッドからも呼ばれるので指標ごとにロックを持つ（bisect 1回と加算だけ）。
+import asyncio, bisect, contextvars, logging, math, os, threading, time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+logger = logging.getLogger("taskbot")
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _q(v) -> str:
+    return '"' + _esc(v) + '"'
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f"{n}={_q(v)}" for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._v: Dict[tuple, float] = {}
+
+    def inc(self, *labels, n: float = 1):
+        with self._lock:
+            self._v[labels] = self._v.get(labels, 0) + n
+
+    def value(self, *labels) -> float:
+        return self._v.get(labels, 0)
+
+    def total(self) -> float:
+        return sum(self._snapshot().values())
+
+    def _snapshot(self) -> Dict[tuple, float]:
+        with self._lock:
+            return dict(self._v)
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.labels, k)} {v:g}" for k, v in sorted(self._snapshot().items())]
+
+    def summary(self, top: int = 3) -> str:
+        worst = sorted(self._snapshot().items(), key=lambda kv: -kv[1])[:top]
+        detail = " ".join(f"{'/'.join(map(str, k))}={v:g}" for k, v in worst if k)
+        return f"{self.name} {self.total():g}" + (f" ({detail})" if detail else "")
+
+
+class Histogram(_Metric):
+    """固定バケット（上限の昇順）。percentile は分位が入るバケットの上限を返す"""
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets: Iterable[float] = SECONDS, labels=()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[tuple, List[int]] = {}
+        self._sums: Dict[tuple, float] = {}
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            c = self._counts.get(labels)
+            if c is None:
+                c = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            c[i] += 1
+            self._sums[labels] += value
+
+    def count(self, *labels) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def _snapshot(self) -> Tuple[Dict[tuple, List[int]], Dict[tuple, float]]:
+        with self._lock:                              # 書き出し中に DB スレッドがラベルを増やしてもよいように
+            return {k: list(c) for k, c in self._counts.items()}, dict(self._sums)
+
+    def _merged(self, labels: Optional[tuple]) -> List[int]:
+        counts = self._snapshot()[0]
+        if labels is not None:
+            return counts.get(labels, [])
+        return [sum(col) for col in zip(*counts.values())] if counts else []
+
+    def percentile(self, q: float, labels: Optional[tuple] = None) -> Optional[float]:
+        """labels=None なら全ラベルを合わせて"""
+        c = self._merged(labels)
+        need, seen = q * sum(c), 0
+        for i, n in enumerate(c):
+            seen += n
+            if n and seen >= need:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return None
+
+    def render(self) -> List[str]:
+        out = self.header()
+        counts, sums = self._snapshot()
+        for k in sorted(counts):
+            c, acc = counts[k], 0
+            for le, n in zip(self.buckets, c):
+                acc += n
+                out.append(f"{self.name}_bucket{_labels(self.labels, k, 'le=' + _q(f'{le:g}'))} {acc}")
+            acc += c[-1]
+            out.append(f"{self.name}_bucket{_labels(self.labels, k, 'le=' + _q('+Inf'))} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labels, k)} {sums[k]:.6g}")
+            out.append(f"{self.name}_count{_labels(self.labels, k)} {acc}")
+        return out
+
+    def summary(self, top: int = 3) -> str:
+        n = sum(self._merged(None))
+        if not n:
+            return f"{self.name} n=0"
+        counts = self._snapshot()[0]
+        worst = sorted(counts, key=lambda k: -sum(counts[k]))[:top]
+        detail = " ".join(f"{'/'.join(map(str, k))}:p99≤{_fmt(self.percentile(0.99, k))}" for k in worst if k)
+        return (f"{self.name} n={n} p50≤{_fmt(self.percentile(0.5))} p99≤{_fmt(self.percentile(0.99))}"
+                + (f" ({detail})" if detail else ""))
+
+
+class Gauge(_Metric):
+    """書き出す時に fn() を呼んで値を取る（キューの長さ等）"""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def value(self) -> Optional[float]:
+        try:
+            v = float(self.fn())
+        except Exception:
+            return None
+        return v if math.isfinite(v) else None          # 接続前の bot.latency は nan / inf
+
+    def render(self) -> List[str]:
+        v = self.value()
+        return self.header() + ([f"{self.name} {v:g}"] if v is not None else [])
+
+    def summary(self, top: int = 3) -> str:
+        v = self.value()
+        return f"{self.name} {v:g}" if v is not None else f"{self.name} -"
+
+
+def _fmt(sec: Optional[float]) -> str:
+    if sec is None:
+        return "-"
+    if sec == float("inf"):
+        return "inf"
+    return f"{sec * 1000:g}ms" if sec < 1 else f"{sec:g}s"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, m: _Metric) -> _Metric:
+        # 同じ名前は同じものを返す（モジュールを読み直しても二重にならない）
+        old = self._metrics.get(m.name)
+        if old is not None and type(old) is type(m):
+            if isinstance(m, Gauge):
+                old.fn = m.fn
+            return old
+        self._metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = SECONDS,
+                  labels: Iterable[str] = ()) -> Histogram:
+        return self._add(Histogram(name, help, buckets, labels))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(name, help, fn))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus テキスト形式（version 0.0.4）"""
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines += self._metrics[name].render()
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """!stats 用（1指標1行）"""
+        return "\n".join(self._metrics[n].summary() for n in sorted(self._metrics))
+
+
+metrics = Registry()
+
+
+# --- Discord REST ---
+REST_SECONDS = metrics.histogram("taskbot_rest_seconds", "Discord REST call time incl. rate-limit waits, by route",
+                                 labels=("route",))
+REST_CALLS = metrics.counter("taskbot_rest_calls_total", "Discord REST calls by route and result",
+                             labels=("route", "result"))
+REST_429 = metrics.counter("taskbot_rest_429_total", "Discord 429 responses by route", labels=("route",))
+_route: contextvars.ContextVar[str] = contextvars.ContextVar("taskbot_route", default="?")
+
+
+class _RateLimitCounter(logging.Filter):
+    """discord.http は 429 を自分で待って再送し、WARNING を出すだけ。そのログを数える（ルートは request の文脈から）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING and ("429" in str(record.msg) or "rate limit" in str(record.msg)):
+            REST_429.inc(_route.get())
+        return True
+
+_rl_filter = _RateLimitCounter()
+
+
+def instrument_http(http) -> None:
+    """bot.http（discord.http.HTTPClient）の request を包んでルート別に数える。ルートは "GET /channels/{channel_id}" の形"""
+    if getattr(http, "_taskbot_metrics", False):
+        return
+    orig = http.request
+
+    async def request(route, **kw):
+        key = route.key
+        token = _route.set(key)
+        t, result = time.perf_counter(), "ok"
+        try:
+            return await orig(route, **kw)
+        except discord.HTTPException as e:
+            result = str(e.status)
+            raise
+        except Exception:
+            result = "error"
+            raise
+        finally:
+            REST_SECONDS.observe(time.perf_counter() - t, key)
+            REST_CALLS.inc(key, result)
+            _route.reset(token)
+
+    http.request = request
+    http._taskbot_metrics = True
+    lg = logging.getLogger("discord.http")
+    if _rl_filter not in lg.filters:
+        lg.addFilter(_rl_filter)
+
+
+def instrument_bot(bot) -> None:
+    """REST の計測とギルド数・ゲートウェイ遅延のゲージ"""
+    instrument_http(bot.http)
+    metrics.gauge("taskbot_guilds", "Guilds the bot is in", lambda: len(bot.guilds))
+    metrics.gauge("taskbot_gateway_latency_seconds", "Gateway heartbeat latency", lambda: bot.latency)
+
+
+# --- /metrics ---
+class MetricsServer:
+    """GET /metrics（Prometheus テキスト）と GET /healthz（health() が真なら 200、偽なら 503）だけの HTTP"""
+
+    def __init__(self, registry: Registry = metrics, health: Optional[Callable[[], bool]] = None,
+                 expose_metrics: bool = True):
+        self.registry, self.health, self.expose_metrics = registry, health, expose_metrics
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.requests = 0
+
+    @property
+    def port(self) -> Optional[int]:
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9100):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, host, port)
+            logger.info(f"[metrics] serving http://{host}:{self.port}/"
+                        f"{'metrics and /healthz' if self.expose_metrics else 'healthz only'}")
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = line.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else ""
+            self.requests += 1
+            if path == "/metrics" and self.expose_metrics:
+                status, body = "200 OK", self.registry.render()
+            elif path == "/healthz":
+                ok = True
+                try: ok = bool(self.health()) if self.health else True
+                except Exception: ok = False
+                status, body = ("200 OK", "ok\n") if ok else ("503 Service Unavailable", "not ready\n")
+            else:
+                status, body = "404 Not Found", "not found\n"
+            data = body.encode()
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            try: writer.close()
+            except Exception: pass
+
+
+async def serve_from_env(health: Optional[Callable[[], bool]] = None) -> Optional[MetricsServer]:
+    """METRICS_PORT があれば METRICS_HOST（既定 127.0.0.1）で /metrics と /healthz を、
+    無くて PORT（Render の web 等）があれば 0.0.0.0 で /healthz だけを開く"""
+    port = os.getenv("METRICS_PORT")
+    host, expose = os.getenv("METRICS_HOST") or "127.0.0.1", True
+    if not port:
+        port, host, expose = os.getenv("PORT"), "0.0.0.0", False
+    if not port:
+        return None
+    try:
+        return await MetricsServer(metrics, health, expose_metrics=expose).start(host, int(port))
+    except Exception as e:
+        logger.warning(f"[metrics] could not listen on {host}:{port}: {e}")
+        return None
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# renamer.py - スレッド名変更（Thread.edit(name=...)）の一元スケジューラ
+# Discord はチャンネル名の変更を 1スレッドあたり 10分に2回 までしか通さない。
+# 以前はクールダウン中の rename を捨てていたので、名前が古いまま残ることがあった。
+# ここではスレッドごとに「最後に望まれた名前」だけを持ち、トークンバケットが許す時刻に1回だけ適用する。
+# 途中で何度名前が変わっても適用されるのは最新の1つで、更新が失われることはない。
+# 5xx・429・通信エラーで失敗した時は枠を使わなかったことにして、名前を残したまま間隔を空けて再試行する
+# （Forbidden / NotFound など、やり直しても通らないものだけ捨てる）。
+# 状態は thread_id をキーにした LRU（MAX_THREADS 件まで）。適用待ちのスレッドは追い出さない。
+import asyncio, logging, time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+import aiohttp
+import discord
+
+from metrics import metrics
+
+logger = logging.getLogger("taskbot")
+
+RATE = 2              # PER 秒あたりに許される名前変更の回数
+PER = 600.0
+MAX_THREADS = 4096    # バケットを覚えておくスレッド数
+BACKOFF = 5.0         # 一時的な失敗（5xx・429・通信エラー）の後の再試行までの秒数（失敗ごとに倍、BACKOFF_MAX まで）
+BACKOFF_MAX = 300.0
+
+RENAMES = metrics.counter("taskbot_renames_total", "Thread renames applied / retried / failed", labels=("result",))
+
+
+def _transient(e: Exception) -> bool:
+    """再試行すればいずれ通る失敗か（Forbidden / NotFound などはそのまま捨てる）"""
+    if isinstance(e, discord.RateLimited):
+        return True
+    if isinstance(e, discord.HTTPException):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+class _Slot:
+    __slots__ = ("used", "thread", "desired", "applied", "timer")
+
+    def __init__(self, rate: int):
+        self.used: deque = deque(maxlen=rate)       # 直近 rate 回の適用時刻（= 使用中のトークン）
+        self.thread: Optional[discord.Thread] = None
+        self.desired: Optional[str] = None          # 適用待ちの名前（None なら無し）
+        self.applied: Optional[str] = None          # 最後に適用した名前（キャッシュの thread.name はゲートウェイ経由で遅れて変わる）
+        self.timer: Optional[asyncio.Task] = None
+
+
+class ThreadRenamer:
+    def __init__(self, rate: int = RATE, per: float = PER, max_threads: int = MAX_THREADS,
+                 clock: Callable[[], float] = time.monotonic, backoff: float = BACKOFF, backoff_max: float = BACKOFF_MAX):
+        self.rate, self.per, self.max_threads = rate, per, max_threads
+        self.backoff, self.backoff_max = backoff, backoff_max
+        self._clock = clock
+        self._slots: "OrderedDict[int, _Slot]" = OrderedDict()
+        self.applied = self.coalesced = self.deferred = self.failed = self.retried = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def queued(self) -> int:
+        """適用待ち（タイマーが動いている）スレッド数"""
+        return sum(1 for s in self._slots.values() if s.timer is not None)
+
+    # --- LRU ---
+    def _slot(self, thread_id: int) -> _Slot:
+        s = self._slots.get(thread_id)
+        if s is None:
+            s = self._slots[thread_id] = _Slot(self.rate)
+            self._evict()
+        else:
+            self._slots.move_to_end(thread_id)
+        return s
+
+    def _evict(self):
+        excess = len(self._slots) - self.max_threads
+        for tid in list(self._slots):
+            if excess <= 0:
+                break
+            if self._slots[tid].timer is None:
+                del self._slots[tid]
+                excess -= 1
+
+    # --- トークンバケット（容量 RATE。使ったトークンは PER 秒後に戻る = どの PER 秒にも RATE 回まで） ---
+    def _wait(self, s: _Slot) -> float:
+        """次の1回が許されるまでの秒数（0 なら今すぐ可）"""
+        if len(s.used) < self.rate:
+            return 0.0
+        return max(0.0, s.used[0] + self.per - self._clock())
+
+    @staticmethod
+    def _current(s: _Slot) -> str:
+        return s.applied if s.applied is not None else (s.thread.name or "")
+
+    # --- 公開API ---
+    def pending(self, thread_id: int) -> Optional[str]:
+        """適用待ちの名前（無ければ None）"""
+        s = self._slots.get(thread_id)
+        return s.desired if s else None
+
+    def expected(self, thread_id: int) -> Optional[str]:
+        """いずれそうなる名前：適用待ちがあればそれ、無ければ最後に適用した名前（知らなければ None）"""
+        s = self._slots.get(thread_id)
+        if not s:
+            return None
+        return s.desired if s.desired is not None else s.applied
+
+    def request(self, thread: discord.Thread, name: str):
+        """thread の名前を name にしたい（待たない。実際の変更はバケットが許す時刻に行う）"""
+        s = self._slot(thread.id)
+        s.thread = thread
+        if name == self._current(s):
+            s.desired = None                        # 途中の変更が元に戻った：適用待ちを取り消す
+            return
+        if s.desired is not None:
+            self.coalesced += 1
+        s.desired = name
+        if s.timer is None:
+            delay = self._wait(s)
+            if delay > 0:
+                self.deferred += 1
+            s.timer = asyncio.get_running_loop().create_task(self._apply_later(thread.id, s, delay))
+
+    async def _apply_later(self, thread_id: int, s: _Slot, delay: float):
+        attempt = 0
+        try:
+            while True:
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                name = s.desired
+                if name is None or name == self._current(s):
+                    s.desired = None
+                    return
+                delay = self._wait(s)
+                if delay > 0:
+                    continue
+                s.used.append(self._clock())
+                try:
+                    res = await s.thread.edit(name=name)
+                    if isinstance(res, discord.Thread):
+                        s.thread = res
+                    s.applied = name
+                    self.applied += 1
+                    RENAMES.inc("applied")
+                    attempt = 0
+                except Exception as e:
+                    if _transient(e):
+                        # 通らなかった変更は枠を使っていない：トークンを返し、名前は残したまま後で再試行
+                        s.used.pop()
+                        delay = min(self.backoff_max, max(self.backoff * 2 ** attempt, getattr(e, "retry_after", 0) or 0))
+                        attempt += 1
+                        self.retried += 1
+                        RENAMES.inc("retried")
+                        logger.warning(f"[rename] {thread_id} -> '{name}' failed ({type(e).__name__}: {e}); "
+                                       f"retrying in {delay:.0f}s")
+                        continue
+                    self.failed += 1
+                    RENAMES.inc("failed")
+                    logger.warning(f"[rename] {thread_id} -> '{name}' failed: {e}")
+                    s.desired = None
+                    return
+                if s.desired == name:
+                    s.desired = None
+                    return
+                delay = self._wait(s)                # 適用中に次の名前が来た
+        finally:
+            s.timer = None
+
+    async def flush(self):
+        """適用待ちが全部終わるまで待つ（停止時・テスト用）"""
+        while True:
+            timers = [s.timer for s in self._slots.values() if s.timer is not None]
+            if not timers:
+                return
+            await asyncio.gather(*timers, return_exceptions=True)
+
+
+renamer = ThreadRenamer()
+metrics.gauge("taskbot_rename_queue", "Threads with a rename waiting for the 2-per-10-minutes bucket",
+              lambda: renamer.queued)
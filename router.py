@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# router.py - on_message の唯一の入口
+# 以前はメッセージ1通ごとにメンション指示（2重に登録）・文字の "/指示"・自動日本語化・probe（毎回 INFO ログ）・
+# on_message・2重に包んだ process_commands がそれぞれ走っていた（"!" のコマンドは2回実行されていた）。
+# ここでは route を order 順に持ち、安い判定（先頭の文字列／Bot へのメンション）で最初に当たった1つだけを呼ぶ。
+# どれにも当たらないメッセージはログも組み立てずに捨てる。件数と所要時間は route ごとに数える。
+import bisect, logging, time
+from typing import Awaitable, Callable, List, Optional
+
+import discord
+
+logger = logging.getLogger("taskbot")
+# メッセージ1通ごとの観測ログ（既定は出さない。LOG_PROBE=1 で INFO、間引きは logpipe.py）
+probe = logging.getLogger("taskbot.probe")
+
+Match = Callable[[discord.Message, str], bool]          # (message, 先頭の空白を除いた本文)
+Handler = Callable[[discord.Message], Awaitable[None]]
+
+
+def prefixed(*prefixes: str) -> Match:
+    return lambda m, text: text.startswith(prefixes)
+
+
+class mentions:
+    """client（Bot 自身）への実メンション、または "@Bot名" で始まる本文"""
+
+    def __init__(self, client: discord.Client, names: bool = True):
+        self.client, self.names = client, names
+        self._uid = None
+        self._tokens = self._heads = ()
+
+    def __call__(self, m: discord.Message, text: str) -> bool:
+        u = self.client.user
+        if u is None:
+            return False
+        if u.id != self._uid:                                 # ログイン後に1回だけ組み立てる
+            self._uid = u.id
+            self._tokens = (f"<@{u.id}>", f"<@!{u.id}>")
+            self._heads = (f"@{u.display_name}", f"@{u.name}") if self.names else ()
+        return self._tokens[0] in text or self._tokens[1] in text or (bool(self._heads) and text.startswith(self._heads))
+
+
+class _Route:
+    __slots__ = ("order", "name", "match", "handler", "bots", "count", "ns")
+
+    def __init__(self, order: int, name: str, match: Match, handler: Handler, bots: bool):
+        self.order, self.name, self.match, self.handler, self.bots = order, name, match, handler, bots
+        self.count = self.ns = 0
+
+    def __lt__(self, other):
+        return self.order < other.order
+
+
+class MessageRouter:
+    def __init__(self):
+        self.routes: List[_Route] = []
+        self.messages = self.ignored = self.errors = 0
+        self.ignored_ns = 0
+
+    def route(self, name: str, match: Match, order: int = 100, bots: bool = False):
+        """@router.route("commands", prefixed("!"), order=10) で handler(message) を登録。
+        order の小さい順に判定し、最初に当たった1つだけを呼ぶ。bots=False の route は Bot の発言を見ない"""
+        def deco(fn: Handler):
+            bisect.insort(self.routes, _Route(order, name, match, fn, bots))
+            return fn
+        return deco
+
+    async def dispatch(self, message: discord.Message) -> Optional[str]:
+        """当たった route の名前（無ければ None）"""
+        t0 = time.perf_counter_ns()
+        self.messages += 1
+        is_bot = message.author.bot
+        text = message.content.lstrip() if message.content else ""
+        if probe.isEnabledFor(logging.INFO):
+            probe.info(f"[probe] g={getattr(message.guild, 'id', None)} ch={message.channel.id} len={len(text)} "
+                       f"bot={is_bot}")
+        for r in self.routes:
+            if (r.bots or not is_bot) and r.match(message, text):
+                break
+        else:
+            self.ignored += 1
+            self.ignored_ns += time.perf_counter_ns() - t0
+            return None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[router] {r.name} g={getattr(message.guild, 'id', None)} ch={message.channel.id}")
+        try:
+            await r.handler(message)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"[router] {r.name}: {type(e).__name__}: {e}", exc_info=True)
+        r.count += 1
+        r.ns += time.perf_counter_ns() - t0
+        return r.name
+
+    def stats(self) -> str:
+        ign = self.ignored_ns / self.ignored / 1000 if self.ignored else 0.0
+        routes = " ".join(f"{r.name}={r.count}({r.ns / r.count / 1e6:.1f}ms)" if r.count else f"{r.name}=0"
+                          for r in self.routes)
+        return f"messages {self.messages} ignored={self.ignored}({ign:.1f}µs) {routes} errors={self.errors}"
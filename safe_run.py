@@ -1,5 +1,6 @@
 import os, asyncio, logging, types, importlib, discord
-logging.basicConfig(level=logging.DEBUG)  # ← DEBUGに
+from logpipe import setup_logging
+setup_logging(logging.DEBUG)  # ← DEBUGに（書き込みは別スレッド。mybot の setup_logging は2回目なので何もしない）
 log = logging.getLogger("safe_run")
 logging.getLogger("discord").setLevel(logging.DEBUG)
 logging.getLogger("discord.http").setLevel(logging.DEBUG)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# scheduler.py - イベント駆動の多段リマインダ（5分ポーリングの置き換え）
+# 予定は reminders テーブル (task_id, fire_at, kind, sent_at) が正。メモリには直近 HORIZON 分の
+# 発火時刻だけを min-heap で持ち、その時刻ちょうどまで眠る。起きたら fire_at の範囲クエリで
+# 未送信行を BATCH 件ずつ sent_at を立てて取り合う（再起動・多重起動でも二重送信しない）。
+# fire_at / sent_at は UTC epoch 秒（INTEGER）。サーバーの現地時刻には依存しない。
+import asyncio, heapq, logging, time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from db import get_adb
+from metrics import metrics
+from settings import Setting, SettingsStore, settings
+from timezones import to_epoch
+
+logger = logging.getLogger("taskbot")
+
+DEFAULT_OFFSETS = (1440, 60, 10)     # 期日の何分前に送るか（ギルドごとに settings で上書き可）
+OVERDUE_GRACE = 0                    # 期日を過ぎてこれだけ（秒）経っても未完了なら指示者へエスカレーション
+HORIZON = 3600.0                     # メモリに載せる先読み幅（秒）
+BATCH = 500                          # 1回の取り合いで確保する件数
+
+REMINDER_LAG = metrics.histogram("taskbot_reminder_lag_seconds", "Reminder claimed for sending minus its fire_at, by kind",
+                                 (1, 5, 15, 30, 60, 120, 300, 900, 3600), labels=("kind",))
+
+
+
+def _due_ts(due) -> Optional[int]:
+    """期日（epoch 秒 / aware な datetime）を epoch 秒に"""
+    if isinstance(due, (int, float)):
+        return int(due)
+    if isinstance(due, datetime):
+        return to_epoch(due)
+    return None
+
+def kind_for(offset_min: int) -> str:
+    return f"before_{offset_min}"
+
+def offset_of(kind: str) -> Optional[int]:
+    """'before_60' -> 60（overdue は None）"""
+    try:
+        return int(kind.split("_", 1)[1]) if kind.startswith("before_") else None
+    except ValueError:
+        return None
+
+def parse_offsets(text: str) -> Tuple[int, ...]:
+    """'1440,60,10' -> (1440, 60, 10)（重複・0以下は捨てて降順）"""
+    vals = sorted({int(x) for x in str(text).replace("，", ",").split(",") if x.strip()}, reverse=True)
+    return tuple(v for v in vals if v > 0)
+
+def _offsets(raw: str) -> Tuple[int, ...]:
+    offs = parse_offsets(raw)
+    if not offs:
+        raise ValueError("no reminder offsets")
+    return offs
+
+# ギルドの "reminder_offsets:<guild_id>"（値は "1440,60,10"）
+OFFSETS = Setting("reminder_offsets", DEFAULT_OFFSETS, parse=_offsets, dump=lambda v: ",".join(str(o) for o in v))
+
+
+class ReminderScheduler:
+    def __init__(self, send: Callable[[List[tuple]], Awaitable[None]], adb=None):
+        self._adb = adb                       # None ならプロセス共通の get_adb()
+        self.send = send                      # send([(reminder_id, task_id, kind), ...])：実際の通知
+        self._heap: list = []                 # 直近の発火時刻（epoch秒）
+        self._horizon_end = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.settings = SettingsStore(adb) if adb is not None else settings
+
+    def __len__(self):
+        return len(self._heap)
+
+    @property
+    def adb(self):
+        return self._adb or get_adb()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # --- ギルドごとの既定オフセット ---
+    async def offsets_for(self, guild_id: int) -> Tuple[int, ...]:
+        if not self.settings.loaded:
+            await self.settings.load()
+        return self.settings.get(OFFSETS, guild_id)
+
+    async def set_offsets(self, guild_id: int, offsets: Sequence[int]):
+        await self.settings.set(OFFSETS, offsets, guild_id)
+
+    # --- 予定の登録／取消 ---
+    def _wake_at(self, ts: float):
+        if ts >= self._horizon_end:
+            return                            # 先読み幅の外：次の補充で拾う
+        heapq.heappush(self._heap, ts)
+        if self._heap[0] == ts:               # 先頭が変わったら眠りを起こす
+            self._wake.set()
+
+    async def plan(self, task_id: int, guild_id: int, due) -> int:
+        """タスクの未送信リマインダを作り直す（段階ごとに1行 + overdue）"""
+        due_ts = _due_ts(due)
+        if due_ts is None:
+            return 0
+        now = time.time()
+        rows = [(task_id, kind_for(o), due_ts - o * 60) for o in await self.offsets_for(guild_id)]
+        rows.append((task_id, "overdue", due_ts + OVERDUE_GRACE))
+        rows = [r for r in rows if r[2] > now]
+
+        def _tx(conn):
+            conn.execute("DELETE FROM reminders WHERE task_id=? AND sent_at IS NULL", (task_id,))
+            conn.executemany("INSERT OR IGNORE INTO reminders(task_id, kind, fire_at) VALUES (?,?,?)", rows)
+        await self.adb.transaction(_tx)
+        for r in rows:
+            self._wake_at(r[2])
+        return len(rows)
+
+    async def unplan(self, task_id: int):
+        # heap に残った時刻は、起きても取り合う行が無いだけなので放置でよい
+        await self.adb.execute("DELETE FROM reminders WHERE task_id=? AND sent_at IS NULL", (task_id,))
+
+    async def on_status(self, task_id: int, status: str, due, guild_id: int):
+        """状態変更フック：受託中なら予定を作り、それ以外は未送信分を取消"""
+        if status == "accepted":
+            await self.plan(task_id, guild_id, due)
+        else:
+            await self.unplan(task_id)
+
+    async def on_due_changed(self, task_id: int, status: str, due, guild_id: int):
+        await self.on_status(task_id, status, due, guild_id)
+
+    # --- 先読み（起動時＋HORIZON ごと） ---
+    async def _refill(self):
+        end = time.time() + HORIZON
+        rows = await self.adb.query(
+            "SELECT fire_at FROM reminders WHERE sent_at IS NULL AND fire_at<=? ORDER BY fire_at",
+            (int(end),))
+        self._heap = [r[0] for r in rows]
+        heapq.heapify(self._heap)
+        self._horizon_end = end
+
+    async def load(self) -> int:
+        await self._refill()
+        logger.info(f"[reminder] {len(self._heap)} reminder(s) due within {int(HORIZON)}s")
+        return len(self._heap)
+
+    # --- 発火 ---
+    async def _claim(self, now: float) -> List[tuple]:
+        """fire_at<=now の未送信行を BATCH 件まで sent_at を立てて確保する"""
+        ts = int(now)
+        def _tx(conn):
+            rows = conn.execute(
+                "SELECT id, task_id, kind, fire_at FROM reminders WHERE sent_at IS NULL AND fire_at<=? "
+                "ORDER BY fire_at LIMIT ?", (ts, BATCH)).fetchall()
+            if rows:
+                conn.execute(f"UPDATE reminders SET sent_at=? WHERE id IN ({','.join('?' * len(rows))})",
+                             (ts, *[r[0] for r in rows]))
+            for r in rows:
+                REMINDER_LAG.observe(max(0.0, now - r[3]), r[2])
+            return [r[:3] for r in rows]
+        return await self.adb.transaction(_tx)
+
+    async def fire_due(self) -> int:
+        """期限の来たリマインダを全部送る（BATCH 件ずつ）"""
+        total = 0
+        while True:
+            batch = await self._claim(time.time())
+            if not batch:
+                return total
+            total += len(batch)
+            try:
+                await self.send(batch)
+            except Exception as e:
+                logger.error(f"[reminder] batch of {len(batch)} failed: {e}", exc_info=True)
+            if len(batch) < BATCH:
+                return total
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if now >= self._horizon_end:
+                await self._refill()
+            fired = False
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+                fired = True
+            if fired:                         # 停止中に過ぎた分も refill で heap に入るのでここで拾う
+                await self.fire_due()
+            self._wake.clear()
+            nxt = self._heap[0] if self._heap else self._horizon_end
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, min(nxt, self._horizon_end) - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# schema.py - DBスキーマの唯一の定義元（バージョン付きマイグレーション）
+# 起動時に1回 migrate() を呼ぶ。適用済みバージョンは schema_version テーブルに記録する。
+# 新しい変更は MIGRATIONS の末尾に (番号, 説明, 関数) を足すだけ。既存の番号は書き換えないこと。
+import sqlite3, logging, os
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger("taskbot")
+
+# 接続ごとに毎回かける PRAGMA（journal_mode=WAL はDBファイルに永続するので migrate 側で1回）
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout=5000",      # ロック待ちで即 SQLITE_BUSY にしない
+    "PRAGMA synchronous=NORMAL",     # WAL なら NORMAL で十分（電源断でも壊れない）
+    "PRAGMA mmap_size=134217728",    # 128MB まで mmap で読む
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",       # 約8MB
+)
+
+
+def apply_pragmas(conn: sqlite3.Connection):
+    for p in CONNECTION_PRAGMAS:
+        conn.execute(p)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+def _add_column(conn: sqlite3.Connection, table: str, col: str, decl: str):
+    if col not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+
+
+def _m1_base(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS admins(
+        user_id INTEGER, guild_id INTEGER, added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(user_id, guild_id))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS instructors(
+        user_id INTEGER, guild_id INTEGER, target_users TEXT, added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(user_id, guild_id))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS tasks(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, instructor_id INTEGER, assignee_id INTEGER,
+        task_name TEXT, due_date TIMESTAMP, status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        message_id INTEGER, channel_id INTEGER)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS notification_channels(
+        guild_id INTEGER, user_id INTEGER, channel_id INTEGER, channel_type TEXT,
+        PRIMARY KEY(guild_id, user_id, channel_type))""")
+    conn.execute("CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, val TEXT)")
+
+def _m2_task_columns(conn):
+    # 古い reminder_bot.db には reminder_sent / thread_id が無い
+    _add_column(conn, "tasks", "reminder_sent", "INTEGER DEFAULT 0")
+    _add_column(conn, "tasks", "thread_id", "INTEGER")
+
+def _m3_task_indexes(conn):
+    # check_reminders: status='accepted' AND reminder_sent=0 AND due_date 範囲（カバリング）
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_remind_due
+        ON tasks(due_date, id, guild_id, assignee_id, task_name, status, reminder_sent)
+        WHERE status='accepted' AND reminder_sent=0""")
+    # 未完了タスクを期日順に（スケジューラ・一覧用）
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_open_due
+        ON tasks(due_date, id) WHERE status IN ('pending','accepted')""")
+    # スレッド色の全件突き合わせ: thread_id IS NOT NULL ORDER BY updated_at, id（カバリング）
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_thread_updated
+        ON tasks(updated_at, id, thread_id, status) WHERE thread_id IS NOT NULL""")
+    # !色直す: WHERE thread_id=?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_thread ON tasks(thread_id, status)")
+
+def _m4_reminders(conn):
+    # 多段リマインダ：1タスクにつき段階 (kind) ごとに1行。sent_at が二重送信防止のマーカー
+    conn.execute("""CREATE TABLE IF NOT EXISTS reminders(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, task_id INTEGER NOT NULL, kind TEXT NOT NULL,
+        fire_at TIMESTAMP NOT NULL, sent_at TIMESTAMP,
+        UNIQUE(task_id, kind))""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders(fire_at) WHERE sent_at IS NULL")
+    # 受託中・未通知のタスクは既定の段階（scheduler.DEFAULT_OFFSETS と同じ）で予定を作る
+    # 過去になってしまう段階は作らない
+    for kind, delta in (("before_1440", "-1440 minutes"), ("before_60", "-60 minutes"),
+                        ("before_10", "-10 minutes"), ("overdue", "+0 minutes")):
+        conn.execute("""INSERT OR IGNORE INTO reminders(task_id, kind, fire_at)
+            SELECT id, ?, datetime(due_date, ?) FROM tasks
+            WHERE status='accepted' AND reminder_sent=0 AND datetime(due_date, ?) > datetime('now','localtime')""",
+                     (kind, delta, delta))
+    # tasks.reminder_sent 用の部分インデックスはもう使わない
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_remind_due")
+
+def _m5_assignee_index(conn):
+    # taskcache.by_assignee: WHERE guild_id=? AND assignee_id=? ORDER BY id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assignee ON tasks(guild_id, assignee_id, id)")
+
+# v6 より前の due_date / fire_at / sent_at はタイムゾーン無しの文字列（sqlite3 の datetime アダプタ）。
+# 利用者が打った壁時計の時刻なので、既定タイムゾーン（timezones.DEFAULT_TZ と同じ BOT_TZ）として読む。
+LEGACY_TZ = os.getenv("BOT_TZ", "Asia/Tokyo")
+
+def _legacy_epoch(val, tz) -> Optional[int]:
+    if val is None or isinstance(val, int):
+        return val
+    try:
+        dt = datetime.fromisoformat(str(val))
+    except ValueError:
+        try:
+            dt = datetime.strptime(str(val), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+    return int((dt if dt.tzinfo else dt.replace(tzinfo=tz)).timestamp())
+
+def _m6_epoch_times(conn):
+    # 期日・リマインダ時刻を UTC epoch 秒（INTEGER）に。比較はすべて整数の範囲検索になる
+    tz = ZoneInfo(LEGACY_TZ)
+    rows = conn.execute("SELECT id, due_date FROM tasks WHERE typeof(due_date)='text'").fetchall()
+    conn.executemany("UPDATE tasks SET due_date=? WHERE id=?", [(_legacy_epoch(d, tz), i) for i, d in rows])
+    rows = conn.execute("SELECT id, sent_at FROM reminders WHERE typeof(sent_at)='text'").fetchall()
+    conn.executemany("UPDATE reminders SET sent_at=? WHERE id=?", [(_legacy_epoch(v, tz) or 0, i) for i, v in rows])
+    # 未送信の fire_at は新しい期日から計算し直す（before_N は N 分前、overdue は期日ちょうど）
+    conn.execute("""UPDATE reminders SET fire_at = (SELECT t.due_date FROM tasks t WHERE t.id = reminders.task_id)
+        - 60 * CASE WHEN substr(kind, 1, 7) = 'before_' THEN CAST(substr(kind, 8) AS INTEGER) ELSE 0 END
+        WHERE sent_at IS NULL""")
+    conn.execute("DELETE FROM reminders WHERE sent_at IS NULL AND fire_at IS NULL")
+    rows = conn.execute("SELECT id, fire_at FROM reminders WHERE typeof(fire_at)='text'").fetchall()
+    conn.executemany("UPDATE reminders SET fire_at=? WHERE id=?", [(_legacy_epoch(v, tz) or 0, i) for i, v in rows])
+
+
+MIGRATIONS = [
+    (1, "base tables", _m1_base),
+    (2, "tasks.reminder_sent / tasks.thread_id", _m2_task_columns),
+    (3, "indexes for hot task queries", _m3_task_indexes),
+    (4, "reminders table (multi-stage reminders)", _m4_reminders),
+    (5, "index for tasks by assignee", _m5_assignee_index),
+    (6, "due_date / fire_at / sent_at as UTC epoch seconds", _m6_epoch_times),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER PRIMARY KEY, "
+                 "description TEXT, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    r = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return (r[0] if r and r[0] is not None else 0)
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """未適用のマイグレーションを順に1つずつトランザクションで当てる。戻り値は適用後のバージョン"""
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.DatabaseError as e:
+        logger.warning(f"[schema] WAL not enabled: {e}")
+    ver = current_version(conn)
+    for num, desc, fn in MIGRATIONS:
+        if num <= ver:
+            continue
+        if target is not None and num > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fn(conn)
+            conn.execute("INSERT INTO schema_version(version, description) VALUES (?,?)", (num, desc))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            logger.error(f"[schema] migration {num} ({desc}) failed", exc_info=True)
+            raise
+        conn.execute("COMMIT")
+        logger.info(f"[schema] applied {num}: {desc}")
+        ver = num
+    return ver
+
+
+# よく走るクエリ。ここに載せたものは EXPLAIN QUERY PLAN でフルスキャンしないことを確認する
+# （tests/test_schema.py）。新しいホットクエリを書いたらここにも追加すること。
+HOT_QUERIES = {
+    "reminders_due":
+        ("SELECT id, task_id, kind FROM reminders WHERE sent_at IS NULL AND fire_at<=? "
+         "ORDER BY fire_at LIMIT ?", (1735689600, 500)),
+    "reminders_horizon":
+        ("SELECT fire_at FROM reminders WHERE sent_at IS NULL AND fire_at<=? ORDER BY fire_at", (1735689600,)),
+    "reminders_by_task":
+        ("DELETE FROM reminders WHERE task_id=? AND sent_at IS NULL", (1,)),
+    "thread_sweep":
+        ("SELECT thread_id, status FROM tasks WHERE thread_id IS NOT NULL ORDER BY updated_at, id", ()),
+    "fixcolor":
+        ("SELECT status FROM tasks WHERE thread_id=?", (1,)),
+    "tasks_by_assignee":
+        ("SELECT * FROM tasks WHERE guild_id=? AND assignee_id=? ORDER BY id", (1, 1)),
+    "task_by_id":
+        ("SELECT * FROM tasks WHERE id=?", (1,)),
+    "open_by_due":
+        ("SELECT id, due_date FROM tasks WHERE status IN ('pending','accepted') "
+         "AND due_date>? ORDER BY due_date LIMIT 100", (1735689600,)),
+}
+# 全行を読むのが目的のもの（インデックスを端から端まで読む SCAN ... USING INDEX は許す）
+SWEEPS = {"thread_sweep"}
+
+
+def full_scans(conn: sqlite3.Connection) -> list:
+    """HOT_QUERIES のうち表やインデックスを全部走査／ソートするものを (名前, 詳細) で返す"""
+    bad = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[-1]
+            scan = detail.startswith("SCAN") and ("USING" not in detail or name not in SWEEPS)
+            if scan or "TEMP B-TREE" in detail:
+                bad.append((name, detail))
+    return bad
+
+
+if __name__ == "__main__":
+    # python schema.py [DBファイル]  … 手動でマイグレーションだけ当てる
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else "reminder_bot.db"
+    c = sqlite3.connect(path, isolation_level=None)
+    print(f"{path}: schema version {migrate(c)}")
+    c.close()
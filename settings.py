@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# settings.py - settings テーブル（key TEXT, val TEXT）をメモリに持つ型付きの設定
+# 以前は fmt_due が日付1つごとに get_display_mode() → 接続・CREATE TABLE IF NOT EXISTS・SELECT をしていた。
+# 表示モード・タイムゾーン・リマインダの段階もそれぞれ自前で SELECT / キャッシュしていた。
+# ここでは起動時に全行を1回だけ読み、読み出しは dict 1回（I/O なし）。書くのは set() だけで、DB とメモリを一緒に更新する。
+# キーは Setting.name に範囲を ":" でつなぐ（"display_mode" / "display_mode:<guild>" / "tz:<guild>:<user>"）。
+# get() は細かい範囲から順に探す（ユーザー → ギルド → 全体 → 既定値）。
+import asyncio, logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from db import get_adb
+
+logger = logging.getLogger("taskbot")
+
+MEMO_SIZE = 4096       # get() の結果を覚えておく (name, scope) の数（ユーザー単位の範囲があるので上限付きの LRU）
+
+
+class Setting:
+    """1つの設定の型：parse は DB の文字列 -> 値（不正なら ValueError）、dump は値 -> 文字列"""
+    __slots__ = ("name", "default", "parse", "dump")
+
+    def __init__(self, name: str, default: Any = None, parse: Callable[[str], Any] = str,
+                 dump: Callable[[Any], str] = str):
+        self.name, self.default, self.parse, self.dump = name, default, parse, dump
+
+    def key(self, *scope) -> str:
+        return ":".join([self.name, *(str(s) for s in scope)])
+
+    def __repr__(self):
+        return f"Setting({self.name!r})"
+
+
+def _scope(scope: tuple) -> tuple:
+    """末尾の None（ギルド外・ユーザー指定なし）を落とす"""
+    n = len(scope)
+    while n and scope[n - 1] is None:
+        n -= 1
+    return scope[:n]
+
+
+class SettingsStore:
+    def __init__(self, adb=None, memo_size: int = MEMO_SIZE):
+        self._adb = adb
+        self.memo_size = memo_size
+        self._raw: Dict[str, str] = {}
+        self._resolved: "OrderedDict[Tuple[str, tuple], Any]" = OrderedDict()   # (name, scope) -> 値（set() で捨てる）
+        self._bad: Set[str] = set()
+        self._loaded: Optional[asyncio.Task] = None
+        self.reads = self.writes = self.loads = 0
+
+    @property
+    def adb(self):
+        return self._adb or get_adb()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded is not None and self._loaded.done() and not self._loaded.exception()
+
+    def __len__(self):
+        return len(self._raw)
+
+    def stats(self) -> str:
+        return f"settings {len(self._raw)} keys reads={self.reads} writes={self.writes} loads={self.loads}"
+
+    async def load(self) -> int:
+        """全行を DB から一度だけ読み込む（何度呼んでもよい）"""
+        if self._loaded is None:
+            self._loaded = asyncio.ensure_future(self._load())
+        try:
+            await asyncio.shield(self._loaded)
+        except Exception:
+            self._loaded = None                   # 次の呼び出しで読み直す
+            raise
+        return len(self._raw)
+
+    async def _load(self):
+        rows = await self.adb.query("SELECT key, val FROM settings")
+        self._raw = {k: v for k, v in rows if v is not None}
+        self._resolved.clear(); self._bad.clear()
+        self.loads += 1
+
+    def _value(self, setting: Setting, key: str):
+        raw = self._raw.get(key)
+        if raw is None or key in self._bad:
+            return None
+        try:
+            return setting.parse(raw)
+        except (ValueError, TypeError) as e:
+            self._bad.add(key)
+            logger.warning(f"[settings] ignoring {key}={raw!r}: {e}")
+            return None
+
+    def get(self, setting: Setting, *scope) -> Any:
+        """最も細かい範囲の値（無ければ既定値）。load() 前は DB を見ずに既定値"""
+        self.reads += 1
+        scope = _scope(scope)
+        ck = (setting.name, scope)
+        try:
+            val = self._resolved[ck]
+            self._resolved.move_to_end(ck)
+            return val
+        except KeyError:
+            pass
+        val = setting.default
+        for n in range(len(scope), -1, -1):
+            v = self._value(setting, setting.key(*scope[:n]))
+            if v is not None:
+                val = v
+                break
+        if self.loaded:
+            self._resolved[ck] = val
+            if len(self._resolved) > self.memo_size:
+                self._resolved.popitem(last=False)
+        return val
+
+    async def set(self, setting: Setting, value: Any, *scope) -> Any:
+        """値を保存する（parse できない値は ValueError で、DB もメモリも変えない）"""
+        raw = setting.dump(value)
+        parsed = setting.parse(raw)
+        key = setting.key(*_scope(scope))
+        await self.adb.execute(
+            "INSERT INTO settings(key,val) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET val=excluded.val", (key, raw))
+        self._raw[key] = raw
+        self._bad.discard(key)
+        self._resolved.clear()                    # 下の範囲の読み出しも変わりうる
+        self.writes += 1
+        return parsed
+
+
+settings = SettingsStore()
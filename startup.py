@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# startup.py - READY 後の起動処理（1プロセスで1回だけ）
+# 以前は setup_roles をギルドごとに直列で回し、Reminderbot は on_ready のたびに（再接続の READY でも）
+# 全ギルドへ bot.tree.sync(guild=g) を直列で投げていた。ギルドが多いと起動に数分かかり、同期のレート制限も食う。
+# mybot の最後の setup_hook は中で wait_until_ready() を待っていた（setup_hook は接続前に呼ばれるので READY は来ない）。
+# ここでは:
+#   - start() は何度呼んでも1回だけ。READY を待つのは別 task なので setup_hook / on_ready から呼んでよい
+#   - ready_step（1回だけの処理）とギルドごとの guild_step + スラッシュ同期を並行に流す（ギルドは同時 CONCURRENCY 件）
+#   - スラッシュは登録内容のハッシュを settings（"command_hash:global" / "command_hash:<guild_id>"）に持ち、
+#     変わった時だけ同期する。再起動しても定義が同じなら同期は0回。ギルド固有のコマンドが無いギルドは同期しない
+#   - 拡張（cogs/）は extension() で登録。lazy なものは READY 後に読む（READY までの時間に入れない）
+# StartupProfile は --profile-startup 用：import・DDL・拡張の読み込み・READY までの時間とリスナー数を1回だけ出す
+import asyncio, hashlib, json, logging, time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from settings import Setting, settings
+
+logger = logging.getLogger("taskbot")
+
+CONCURRENCY = 5
+COMMAND_HASH = Setting("command_hash")                   # ギルド："command_hash:<guild_id>"
+GLOBAL_COMMAND_HASH = Setting("command_hash:global")     # ギルドの読み出しがこちらに落ちないよう別の名前
+
+GuildStep = Callable[[discord.Guild], Awaitable[None]]
+
+
+class StartupProfile:
+    """プロセス開始（t0）からの時刻（mark）と段階ごとの所要時間（timed）"""
+
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+        self.spans: List[Tuple[str, float]] = []
+
+    def mark(self, name: str, at: Optional[float] = None):
+        self.marks.append((name, (at if at is not None else time.perf_counter()) - self.t0))
+
+    @contextmanager
+    def timed(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, time.perf_counter() - t))
+
+    def report(self, bot, router=None) -> str:
+        lines = ["[profile] since process start:"]
+        lines += [f"  {name:<28} {sec * 1000:>9.1f} ms" for name, sec in self.marks]
+        lines.append("[profile] phases:")
+        lines += [f"  {name:<28} {sec * 1000:>9.1f} ms" for name, sec in self.spans]
+        lines.append("[profile] " + " ".join(f"{k}={v}" for k, v in listener_counts(bot, router).items()))
+        return "\n".join(lines)
+
+
+def listener_counts(bot, router=None) -> Dict[str, int]:
+    """登録済みのイベント・コマンド数（@bot.event は Bot の属性、listen / Cog のリスナーは extra_events）"""
+    counts = {
+        "events": sum(1 for k in vars(bot) if k.startswith("on_")) + sum(len(v) for v in bot.extra_events.values()),
+        "commands": len(bot.commands),
+        "app_commands": len(bot.tree.get_commands()),
+        "cogs": len(bot.cogs),
+    }
+    if router is not None:
+        counts["routes"] = len(router.routes)
+    return counts
+
+
+def tree_hash(tree: discord.app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """guild（None ならグローバル）に同期される定義のハッシュ（Discord に送るのと同じ JSON から）"""
+    payload = sorted((c.to_dict(tree) for c in tree.get_commands(guild=guild)),
+                     key=lambda d: (d.get("type", 1), d["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class Startup:
+    def __init__(self, bot, store=None, concurrency: int = CONCURRENCY, sync_global: bool = True,
+                 profile: Optional[StartupProfile] = None):
+        self.bot = bot
+        self.store = store if store is not None else settings      # 空の SettingsStore は偽（__len__）
+        self.profile = profile or StartupProfile()
+        self.sync_global = sync_global
+        self.ready_steps: List[Callable[[], Awaitable[None]]] = []
+        self.guild_steps: List[GuildStep] = []
+        self.extensions: List[Tuple[str, bool]] = []
+        self.finished = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._sem = asyncio.Semaphore(concurrency)
+        self.synced = self.skipped = self.failed = 0
+        self.guilds = 0
+        self.elapsed: Optional[float] = None
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def stats(self) -> str:
+        took = f"{self.elapsed * 1000:.0f}ms" if self.elapsed is not None else "running" if self.started else "-"
+        return (f"startup {took} guilds={self.guilds} synced={self.synced} "
+                f"unchanged={self.skipped} failed={self.failed}")
+
+    def ready_step(self, fn):
+        """@startup.ready_step で READY 後に1回だけ呼ぶ fn() を登録（ギルドの処理と並行）"""
+        self.ready_steps.append(fn)
+        return fn
+
+    def guild_step(self, fn):
+        """@startup.guild_step で各ギルドに1回ずつ呼ぶ fn(guild) を登録（登録順に直列。スラッシュ同期はその後）"""
+        self.guild_steps.append(fn)
+        return fn
+
+    def extension(self, name: str, lazy: bool = True):
+        """拡張（"cogs.threads" 等）を登録。lazy=False は load_extensions(lazy=False) で（setup_hook から）読む"""
+        self.extensions.append((name, lazy))
+
+    async def load_extensions(self, lazy: bool = True) -> int:
+        n = 0
+        for name, l in self.extensions:
+            if l != lazy or name in self.bot.extensions:
+                continue
+            try:
+                with self.profile.timed(f"extension {name}"):
+                    await self.bot.load_extension(name)
+                n += 1
+            except Exception as e:
+                logger.error(f"[startup] extension {name} failed: {type(e).__name__}: {e}", exc_info=True)
+        return n
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        self.profile.mark("READY")
+        t0 = time.perf_counter()
+        try:
+            await self.store.load()
+        except Exception as e:
+            logger.warning(f"[startup] settings load failed (syncing everything): {e}")
+        guilds = list(self.bot.guilds)
+        jobs = [self._ready_step(fn) for fn in self.ready_steps]
+        if any(lazy for _, lazy in self.extensions):
+            jobs.append(self.load_extensions(lazy=True))
+        if self.sync_global:
+            jobs.append(self.sync(None))
+        jobs += [self.join(g) for g in guilds]
+        await asyncio.gather(*jobs)
+        self.elapsed = time.perf_counter() - t0
+        self.profile.mark("startup done")
+        self.finished.set()
+        logger.info(f"[startup] {len(guilds)} guild(s) ready in {self.elapsed * 1000:.0f} ms "
+                    f"(slash synced {self.synced}, unchanged {self.skipped}, failed {self.failed})")
+
+    async def _ready_step(self, fn):
+        try:
+            await fn()
+        except Exception as e:
+            logger.warning(f"[startup] {getattr(fn, '__name__', fn)} failed: {type(e).__name__}: {e}")
+
+    async def join(self, guild: discord.Guild):
+        """1ギルド分（起動時と on_guild_join から）"""
+        async with self._sem:
+            self.guilds += 1
+            for fn in self.guild_steps:
+                try:
+                    await fn(guild)
+                except Exception as e:
+                    logger.warning(f"[startup] {getattr(fn, '__name__', fn)} skipped in {guild.id}: "
+                                   f"{type(e).__name__}: {e}")
+            await self.sync(guild)
+
+    async def sync(self, guild: Optional[discord.Guild] = None, force: bool = False) -> bool:
+        """定義が前回の同期から変わっていれば（force なら必ず）同期する。同期したら True"""
+        tree = self.bot.tree
+        h = tree_hash(tree, guild)
+        key, scope = (COMMAND_HASH, (guild.id,)) if guild is not None else (GLOBAL_COMMAND_HASH, ())
+        stored = self.store.get(key, *scope)
+        # コマンドは全部グローバル登録：ギルド固有が無く、前にも同期していないギルドには空の PUT を送らない
+        # （前にギルド固有を同期していたら、消すために1回だけ送る）
+        empty = guild is not None and not tree.get_commands(guild=guild) and stored in (None, h)
+        if empty or (not force and stored == h):
+            self.skipped += 1
+            return False
+        try:
+            await tree.sync(guild=guild)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"[startup] slash sync failed for {guild.id if guild else 'global'}: {type(e).__name__}: {e}")
+            return False
+        self.synced += 1
+        try:
+            await self.store.set(key, h, *scope)
+        except Exception as e:
+            logger.warning(f"[startup] saving command hash failed: {e}")
+        return True
+
+    async def resync(self, force: bool = True) -> int:
+        """全ギルド（とグローバル）を同期し直す（!sync 用）。同期した数"""
+        async def _one(g):
+            async with self._sem:
+                return await self.sync(g, force)
+        jobs = [self.sync(None, force)] if self.sync_global else []
+        return sum(await asyncio.gather(*jobs, *(_one(g) for g in self.bot.guilds)))
+
+
+async def profile_run(bot, startup: Startup, token: Optional[str], prepare: Optional[Callable[[], Awaitable[None]]] = None,
+                      router=None) -> str:
+    """--profile-startup：接続して startup が終わるまで動かし、止めてから報告を返す。
+    token が無ければ接続しない部分（prepare と拡張の読み込み）だけを測る"""
+    if not token:
+        if prepare is not None:
+            await prepare()
+        await startup.load_extensions(lazy=True)
+        startup.profile.mark("READY (skipped: no token)")
+        return startup.profile.report(bot, router)
+    async with bot:
+        runner = asyncio.ensure_future(bot.start(token))
+        waiter = asyncio.ensure_future(startup.finished.wait())
+        done, _ = await asyncio.wait({runner, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if runner in done:
+            runner.result()                       # ログイン失敗などはここで例外
+        await bot.close()
+        await asyncio.gather(runner, return_exceptions=True)
+    return startup.profile.report(bot, router)
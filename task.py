@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# task.py - tasks 1行を表すレコード型
+# 以前は sqlite のタプルをそのまま持ち回り、trow[5]（期日）・t2[3]（担当者）のような位置で読んでいた。
+# 期日も embed を作るたびに fromisoformat / strptime で文字列から読み直していた。
+# Task は __slots__ の小さなオブジェクトで、期日は UTC epoch 秒（int。DB もこの形）、
+# status は Status（str の Enum なので既存の "accepted" との比較や dict 引きはそのまま通る）にする。
+# 作るのは row_factory（task_factory）だけ：カーソルに付けておけば fetch 1回につき1回で済む。
+from datetime import datetime, tzinfo
+from enum import Enum
+from typing import Optional
+
+COLUMNS = ("id", "guild_id", "instructor_id", "assignee_id", "task_name", "due_date", "status",
+           "message_id", "channel_id", "thread_id", "updated_at")
+SELECT = f"SELECT {', '.join(COLUMNS)} FROM tasks"
+
+
+class Status(str, Enum):
+    PENDING = "pending"
+    ACCEPTED = "accepted"
+    COMPLETED = "completed"
+    ABANDONED = "abandoned"
+    DECLINED = "declined"
+
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+_STATUS = {s.value: s for s in Status}
+
+# スレッド名・embed の先頭に付ける絵文字（両 Bot・threadsync で共通。既存スレッドの名前もこの形）
+STATUS_EMOJI = {
+    Status.PENDING: "🟥",
+    Status.ACCEPTED: "🟨",
+    Status.COMPLETED: "🟩",
+    Status.ABANDONED: "⚠️",
+    Status.DECLINED: "❌",
+}
+UNKNOWN_EMOJI = "⚪"
+EMOJI_PREFIXES = (*STATUS_EMOJI.values(), UNKNOWN_EMOJI)      # 付け替え時に外す先頭絵文字
+
+def status_of(s) -> str:
+    """DB の文字列 -> Status（知らない値はそのままの文字列、空なら PENDING）"""
+    return _STATUS.get(s, s or Status.PENDING)
+
+
+def due_epoch(raw) -> Optional[int]:
+    """due_date（epoch 秒 / datetime / v6 より前の文字列）を epoch 秒に。読めなければ None"""
+    if raw is None:
+        return None
+    if isinstance(raw, (int, float)):
+        return int(raw)
+    if isinstance(raw, datetime):
+        return int(raw.timestamp())
+    try:
+        return int(datetime.fromisoformat(str(raw)).timestamp())
+    except ValueError:
+        try:
+            return int(datetime.strptime(str(raw), "%Y-%m-%d %H:%M:%S").timestamp())
+        except ValueError:
+            return None
+
+
+class Task:
+    __slots__ = ("id", "guild_id", "instructor_id", "assignee_id", "name", "due", "status",
+                 "message_id", "channel_id", "thread_id", "updated_at")
+
+    def __init__(self, id, guild_id, instructor_id, assignee_id, name, due, status,
+                 message_id=None, channel_id=None, thread_id=None, updated_at=None):
+        self.id = id
+        self.guild_id = guild_id
+        self.instructor_id = instructor_id
+        self.assignee_id = assignee_id
+        self.name = name
+        self.due = due_epoch(due)
+        self.status = status_of(status)
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.thread_id = thread_id
+        self.updated_at = updated_at          # DB の文字列のまま（同じスレッドのどのタスクが最新かを比べるだけ）
+
+    @classmethod
+    def from_row(cls, row) -> "Task":
+        """COLUMNS の順の行から"""
+        return cls(*row)
+
+    def due_at(self, tz: Optional[tzinfo] = None) -> Optional[datetime]:
+        """期日を tz（ギルド／ユーザーのタイムゾーン）の aware な datetime で"""
+        return datetime.fromtimestamp(self.due, tz) if self.due is not None else None
+
+    def due_text(self, tz: Optional[tzinfo] = None, fmt: str = "%Y/%m/%d %H:%M") -> str:
+        return self.due_at(tz).strftime(fmt) if self.due is not None else "-"
+
+    def __eq__(self, other):
+        if not isinstance(other, Task):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Task(id={self.id}, status={self.status}, assignee={self.assignee_id}, thread={self.thread_id})"
+
+
+def task_factory(cursor, row) -> Task:
+    """sqlite3 の row_factory（SELECT は COLUMNS の順で）"""
+    return Task(*row)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# taskcache.py - tasks 行のプロセス内キャッシュ（write-through）
+# クリック・!色直す・!紐付け・リマインダ配信は毎回 SQLite から tasks を読み直していた。
+# ここでは id をキーにした LRU（MAX_TASKS 件まで）に行を持ち、thread_id と (guild_id, assignee_id) の
+# 副インデックスも張る。tasks を書き換える箇所は必ず write() / execute() を通すので、キャッシュは常に最新。
+# write() で書いた行は transaction() / execute() が COMMIT の後に入れ直す（ROLLBACK なら捨てる）。
+#   - 行は task.Task（読み込みは task_factory で1回だけ組み立てる）
+#   - 副インデックスは「その thread_id / 担当者の行を全部持っている」ものだけ DB を読まずに答える。
+#     行を追い出したらそのキーは未ロード扱いに戻す。
+#   - DB スレッド（書き込み）とイベントループ（読み取り）から触るのでロックで守る。
+#   - 読み込み中に書き込みがあった時に捨てるのは、その書き込みが触ったキー（id・thread_id・担当者）の行だけ。
+#     キーごとに「最後に書き込んだ時の _seq」を STAMPS 個のバケツに記録し、読み始めの _seq と比べる。
+import logging, threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from db import get_adb
+from task import SELECT, Task, task_factory
+
+logger = logging.getLogger("taskbot")
+
+MAX_TASKS = 10000      # 保持する行数
+STAMPS = 4096          # 書き込み時刻を覚えるバケツ数（衝突しても余計に捨てるだけ）
+
+
+class TaskCache:
+    def __init__(self, adb=None, max_tasks: int = MAX_TASKS):
+        self._adb = adb
+        self.max_tasks = max_tasks
+        self._lock = threading.RLock()
+        self._local = threading.local()  # DB スレッド：transaction() 中に write() した行（id -> 行 / None）
+        self._rows: "OrderedDict[int, Task]" = OrderedDict()
+        self._by_thread: Dict[int, Set[int]] = {}
+        self._by_assignee: Dict[Tuple[int, int], Set[int]] = {}
+        self._threads_loaded: Set[int] = set()
+        self._assignees_loaded: Set[Tuple[int, int]] = set()
+        self._seq = 0                  # 書き込みごとに増える
+        self._stamps = [0] * STAMPS    # キーのバケツ -> そのキーに最後に書き込んだ時の _seq
+        self.hits = self.misses = self.evictions = self.stale = 0
+
+    @property
+    def adb(self):
+        return self._adb or get_adb()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (f"tasks {len(self._rows)}/{self.max_tasks} hit={self.hits} miss={self.misses} "
+                f"({rate:.1f}%) evict={self.evictions} stale={self.stale}")
+
+    # --- 内部（ロックを握って呼ぶ） ---
+    @staticmethod
+    def _keys(t: Task):
+        """t が載るキー：id・("t", thread_id)・("a", guild_id, assignee_id)"""
+        yield t.id
+        if t.thread_id is not None:
+            yield ("t", t.thread_id)
+        yield ("a", t.guild_id, t.assignee_id)
+
+    def _touch(self, task_id: int, *rows: Optional[Task]):
+        """書き込み：task_id と rows（書き込み前後の行）のキーに今の _seq を記録する"""
+        self._seq += 1
+        self._stamps[hash(task_id) % STAMPS] = self._seq
+        for t in rows:
+            if t is not None:
+                for k in self._keys(t):
+                    self._stamps[hash(k) % STAMPS] = self._seq
+
+    def _fresh(self, key, seq: int) -> bool:
+        """seq 以降 key に書き込みが無いか"""
+        return self._stamps[hash(key) % STAMPS] <= seq
+
+    def _unindex(self, t: Task):
+        if t.thread_id is not None:
+            s = self._by_thread.get(t.thread_id)
+            if s is not None:
+                s.discard(t.id)
+                if not s:
+                    del self._by_thread[t.thread_id]
+        key = (t.guild_id, t.assignee_id)
+        s = self._by_assignee.get(key)
+        if s is not None:
+            s.discard(t.id)
+            if not s:
+                del self._by_assignee[key]
+
+    def _put(self, t: Task):
+        old = self._rows.pop(t.id, None)
+        if old is not None:
+            self._unindex(old)
+        self._rows[t.id] = t
+        if t.thread_id is not None:
+            self._by_thread.setdefault(t.thread_id, set()).add(t.id)
+        self._by_assignee.setdefault((t.guild_id, t.assignee_id), set()).add(t.id)
+        while len(self._rows) > self.max_tasks:
+            _, ev = self._rows.popitem(last=False)
+            self._unindex(ev)
+            self._threads_loaded.discard(ev.thread_id)
+            self._assignees_loaded.discard((ev.guild_id, ev.assignee_id))
+            self.evictions += 1
+
+    def _drop(self, tid: int):
+        old = self._rows.pop(tid, None)
+        if old is not None:
+            self._unindex(old)
+
+    def _fill(self, rows: Iterable[Task], seq: int, key=None) -> bool:
+        """読み込んだ行を入れる。読み込み中に書き込まれた行は入れない（古い行で上書きしないため）。
+        key（副インデックス）を渡した時は、全行を入れられてかつ key にも書き込みが無かった時だけ True"""
+        with self._lock:
+            ok = key is None or self._fresh(key, seq)
+            for t in rows:
+                if self._fresh(t.id, seq):
+                    self._put(t)
+                else:
+                    ok = False
+                    self.stale += 1
+            return ok
+
+    def _ids(self, ids: Iterable[int]) -> List[Task]:
+        out = []
+        for tid in sorted(ids):
+            self._rows.move_to_end(tid)
+            out.append(self._rows[tid])
+        return out
+
+    # --- 書き込み（write-through）：DB スレッドの conn 上で呼ぶ ---
+    def refresh(self, conn, task_id: int) -> Optional[Task]:
+        """conn から task_id の行を読み直して入れる（消えていれば捨てる）"""
+        cur = conn.execute(f"{SELECT} WHERE id=?", (task_id,))
+        cur.row_factory = task_factory
+        t = cur.fetchone()
+        if t is None:
+            self.invalidate(task_id)
+        else:
+            self.put(t)
+        written = getattr(self._local, "written", None)
+        if written is not None:
+            written[task_id] = t
+        return t
+
+    def put(self, t: Task):
+        """書き込んだ直後の行をそのまま入れる"""
+        with self._lock:
+            self._touch(t.id, self._rows.get(t.id), t)
+            self._put(t)
+
+    def invalidate(self, task_id: int):
+        with self._lock:
+            self._touch(task_id, self._rows.get(task_id))
+            self._drop(task_id)
+
+    def write(self, conn, sql: str, params: tuple = (), task_id: Optional[int] = None) -> Optional[int]:
+        """tasks を書き換える1文を実行して行を読み直す。task_id 省略時は lastrowid（INSERT）。
+        戻り値は task_id（UPDATE で該当行が無ければ None）"""
+        cur = conn.execute(sql, params)
+        if task_id is None:
+            task_id = cur.lastrowid
+        elif cur.rowcount == 0:
+            return None
+        self.refresh(conn, task_id)
+        return task_id
+
+    async def transaction(self, fn):
+        """fn(conn) を1トランザクションで（async ハンドラ用）。fn の中で write() した行は COMMIT 後に
+        入れ直す：COMMIT 前に読み始めた読み取りが古い行を入れていても上書きされ、読み途中のものは捨てられる"""
+        written: Dict[int, Optional[Task]] = {}
+        def run(conn):
+            self._local.written = written
+            try:
+                return fn(conn)
+            finally:
+                self._local.written = None
+        try:
+            res = await self.adb.transaction(run)
+        except Exception:
+            for tid in written:
+                self.invalidate(tid)         # ROLLBACK された：キャッシュ側も捨てる
+            raise
+        for tid, t in written.items():
+            if t is None:
+                self.invalidate(tid)
+            else:
+                self.put(t)
+        return res
+
+    async def execute(self, sql: str, params: tuple = (), task_id: Optional[int] = None) -> Optional[int]:
+        """write() を1トランザクションで"""
+        try:
+            return await self.transaction(lambda c: self.write(c, sql, params, task_id))
+        except Exception:
+            if task_id is not None:
+                self.invalidate(task_id)     # 書く前に失敗した（written に入っていない）
+            raise
+
+    # --- 読み取り ---
+    async def get(self, task_id: int) -> Optional[Task]:
+        with self._lock:
+            t = self._rows.get(task_id)
+            if t is not None:
+                self._rows.move_to_end(task_id)
+                self.hits += 1
+                return t
+            self.misses += 1
+            seq = self._seq
+        t = await self.adb.query_one(f"{SELECT} WHERE id=?", (task_id,), task_factory)
+        if t is not None:
+            self._fill((t,), seq)
+        return t
+
+    async def get_many(self, ids: Iterable[int]) -> Dict[int, Task]:
+        """id -> 行（無い id は入らない）。キャッシュに無い分だけ1回の IN で読む"""
+        out, missing = {}, []
+        with self._lock:
+            for tid in dict.fromkeys(ids):
+                t = self._rows.get(tid)
+                if t is not None:
+                    self._rows.move_to_end(tid)
+                    out[tid] = t
+                else:
+                    missing.append(tid)
+            self.hits += len(out)
+            self.misses += len(missing)
+            seq = self._seq
+        if missing:
+            rows = await self.adb.query(
+                f"{SELECT} WHERE id IN ({','.join('?' * len(missing))})", tuple(missing), task_factory)
+            self._fill(rows, seq)
+            out.update((t.id, t) for t in rows)
+        return out
+
+    async def by_thread(self, thread_id: int) -> List[Task]:
+        """thread_id に紐付いたタスク（id 順）"""
+        with self._lock:
+            if thread_id in self._threads_loaded:
+                self.hits += 1
+                return self._ids(self._by_thread.get(thread_id, ()))
+            self.misses += 1
+            seq = self._seq
+        rows = await self.adb.query(f"{SELECT} WHERE thread_id=? ORDER BY id", (thread_id,), task_factory)
+        with self._lock:
+            if self._fill(rows, seq, ("t", thread_id)) and len(rows) < self.max_tasks:
+                self._threads_loaded.add(thread_id)
+        return rows
+
+    async def by_assignee(self, guild_id: int, assignee_id: int) -> List[Task]:
+        """(guild_id, assignee_id) のタスク（id 順）"""
+        key = (guild_id, assignee_id)
+        with self._lock:
+            if key in self._assignees_loaded:
+                self.hits += 1
+                return self._ids(self._by_assignee.get(key, ()))
+            self.misses += 1
+            seq = self._seq
+        rows = await self.adb.query(
+            f"{SELECT} WHERE guild_id=? AND assignee_id=? ORDER BY id", key, task_factory)
+        with self._lock:
+            if self._fill(rows, seq, ("a", *key)) and len(rows) < self.max_tasks:
+                self._assignees_loaded.add(key)
+        return rows
+
+    async def status_by_thread(self, thread_id: int) -> Optional[str]:
+        """スレッドの状態：複数タスクがあれば最後に更新したもの（threadsync.sweep と同じ ORDER BY updated_at, id）"""
+        rows = await self.by_thread(thread_id)
+        if not rows:
+            return None
+        return max(rows, key=lambda t: (t.updated_at is not None, t.updated_at or "", t.id)).status
+
+    async def warm(self, limit: Optional[int] = None) -> int:
+        """未完了タスクを先に読み込んでおく（起動時）"""
+        with self._lock:
+            seq = self._seq
+        rows = await self.adb.query(
+            f"{SELECT} WHERE status IN ('pending','accepted') ORDER BY id DESC LIMIT ?",
+            (limit or self.max_tasks,), task_factory)
+        self._fill(reversed(rows), seq)
+        return len(rows)
+
+
+task_cache = TaskCache()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# tests/ - 本体はトップレベルのモジュールなのでリポジトリ直下を import パスに入れる
+# 時間を測るものは bench.py、振る舞いの確認はここ（async は asyncio.run で回す）
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_FILE", "")      # Reminderbot を import しても bot.log を作らない
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "reminder_bot.db")
+
+
+@pytest.fixture
+def database(db_path):
+    from db import Database
+    db = Database(db_path)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def adb(database):
+    from db import AsyncDatabase
+    adb = AsyncDatabase(database)
+    yield adb
+    adb.close()
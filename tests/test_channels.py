@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import asyncio, itertools
+
+from channels import ChannelRegistry
+
+_ids = itertools.count(1000)
+
+
+class Channel:
+    def __init__(self, name):
+        self.id, self.name = next(_ids), name
+
+    async def send(self, **kw):
+        pass
+
+
+class Member:
+    def __init__(self, uid):
+        self.id, self.display_name = uid, f"user{uid}"
+
+
+class Guild:
+    def __init__(self):
+        self.id, self.default_role, self.channels, self.creates = 1, object(), {}, 0
+
+    @property
+    def text_channels(self):
+        return list(self.channels.values())
+
+    def get_channel(self, cid):
+        return self.channels.get(cid)
+
+    async def create_text_channel(self, name, **kw):
+        self.creates += 1
+        await asyncio.sleep(0.01)
+        ch = Channel(name)
+        self.channels[ch.id] = ch
+        return ch
+
+
+def test_concurrent_resolve_creates_once_and_drops_locks(adb):
+    reg, guild, m = ChannelRegistry(adb), Guild(), Member(100)
+
+    async def go():
+        got = await asyncio.gather(*(reg.resolve(guild, m) for _ in range(20)))
+        assert len({c.id for c in got}) == 1
+    asyncio.run(go())
+    assert guild.creates == 1 and reg.created == 1
+    assert reg._locks == {}
+
+
+def test_locks_do_not_grow_with_members(adb):
+    reg, guild = ChannelRegistry(adb), Guild()
+
+    async def go():
+        for uid in range(200):
+            await reg.resolve(guild, Member(uid), create=False)
+    asyncio.run(go())
+    assert reg.misses == 200 and reg._locks == {}
+
+
+def test_cancelled_waiter_releases_entry(adb):
+    reg, guild, m = ChannelRegistry(adb), Guild(), Member(100)
+
+    async def go():
+        first = asyncio.ensure_future(reg.resolve(guild, m))
+        waiter = asyncio.ensure_future(reg.resolve(guild, m))
+        await asyncio.sleep(0.001)
+        waiter.cancel()
+        await first
+        await asyncio.gather(waiter, return_exceptions=True)
+    asyncio.run(go())
+    assert reg._locks == {}
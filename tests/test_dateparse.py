@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import dateparse
+from dateparse import normalize, parse_date
+
+# 基準時刻 2025-08-20（水）10:15:42 での期待値（bench.py parse_date も入力に使う）
+NOW = datetime(2025, 8, 20, 10, 15, 42)
+CORPUS = [
+    ("今日", datetime(2025, 8, 20, 23, 59)), ("today 9:00", datetime(2025, 8, 20, 9, 0)),
+    ("明日 18:00", datetime(2025, 8, 21, 18, 0)), ("Tomorrow", datetime(2025, 8, 21, 23, 59)),
+    ("明日18:00", datetime(2025, 8, 21, 18, 0)), ("明日 18時", datetime(2025, 8, 21, 18, 0)),
+    ("明日 9時半", datetime(2025, 8, 21, 9, 30)), ("明日 9時05分", datetime(2025, 8, 21, 9, 5)),
+    ("明後日", datetime(2025, 8, 22, 23, 59)), ("あさって 7:30", datetime(2025, 8, 22, 7, 30)),
+    ("day after tomorrow 12:00", datetime(2025, 8, 22, 12, 0)), ("昨日", datetime(2025, 8, 19, 23, 59)),
+    ("3日後", datetime(2025, 8, 23, 23, 59)), ("3 days 10:00", datetime(2025, 8, 23, 10, 0)),
+    ("1 day", datetime(2025, 8, 21, 23, 59)), ("2週間後", datetime(2025, 9, 3, 23, 59)),
+    ("2 weeks later", datetime(2025, 9, 3, 23, 59)),
+    ("5時間後", datetime(2025, 8, 20, 15, 15)), ("30分後", datetime(2025, 8, 20, 10, 45)),
+    ("90 minutes", datetime(2025, 8, 20, 11, 45)), ("2 hours 9:00", datetime(2025, 8, 20, 9, 0)),
+    ("金曜 14:30", datetime(2025, 8, 22, 14, 30)), ("金曜日", datetime(2025, 8, 22, 23, 59)),
+    ("金", datetime(2025, 8, 22, 23, 59)), ("水曜", datetime(2025, 8, 27, 23, 59)),
+    ("月曜 9:00", datetime(2025, 8, 25, 9, 0)), ("日曜", datetime(2025, 8, 24, 23, 59)),
+    ("friday", datetime(2025, 8, 22, 23, 59)), ("Fri. 8:00", datetime(2025, 8, 22, 8, 0)),
+    ("sun", datetime(2025, 8, 24, 23, 59)), ("Tuesday 17:45", datetime(2025, 8, 26, 17, 45)),
+    ("2025/08/23 09:00", datetime(2025, 8, 23, 9, 0)), ("2025-9-1", datetime(2025, 9, 1, 23, 59)),
+    ("2025年8月23日", datetime(2025, 8, 23, 23, 59)), ("2025年8月23日 10:00", datetime(2025, 8, 23, 10, 0)),
+    ("8/23", datetime(2025, 8, 23, 23, 59)), ("12-01 08:00", datetime(2025, 12, 1, 8, 0)),
+    ("8月23日", datetime(2025, 8, 23, 23, 59)), ("8月23日 18時", datetime(2025, 8, 23, 18, 0)),
+    ("  明日　１８：００ ", datetime(2025, 8, 21, 18, 0)), ("２０２５／９／１", datetime(2025, 9, 1, 23, 59)),
+    # 時刻だけ：今日のその時刻、過ぎていれば明日
+    ("18時", datetime(2025, 8, 20, 18, 0)), ("18:00", datetime(2025, 8, 20, 18, 0)),
+    ("１８時半", datetime(2025, 8, 20, 18, 30)), ("9時", datetime(2025, 8, 21, 9, 0)),
+    ("10時15分", datetime(2025, 8, 21, 10, 15)), ("10:16", datetime(2025, 8, 20, 10, 16)),
+    # 読めないもの
+    ("", None), ("2025/02/30", None), ("明日 25:00", None), ("明日 18:75", None), ("25時", None),
+    ("sunset", None), ("monthly", None), ("来月のどこか", None), ("日程未定", None), ("3", None), ("18", None),
+]
+
+
+@pytest.fixture(autouse=True)
+def _fresh_memo():
+    dateparse._memo.clear()
+    yield
+    dateparse._memo.clear()
+
+
+@pytest.mark.parametrize("s,want", CORPUS, ids=[repr(s) for s, _ in CORPUS])
+def test_corpus(s, want):
+    assert parse_date(s, NOW) == want
+
+
+@pytest.mark.parametrize("s,want", [(s, w) for s, w in CORPUS if w is not None][:12])
+def test_tz_aware(s, want):
+    tz = ZoneInfo("Asia/Tokyo")
+    got = parse_date(s, NOW.replace(tzinfo=tz), tz=tz)
+    assert got == want.replace(tzinfo=tz) and got.tzinfo is tz
+
+
+def test_now_is_converted_to_tz():
+    # UTC 01:15 = 東京 10:15：「18時」は東京の今日 18:00
+    got = parse_date("18時", datetime(2025, 8, 20, 1, 15, tzinfo=ZoneInfo("UTC")), tz=ZoneInfo("Asia/Tokyo"))
+    assert got == datetime(2025, 8, 20, 18, 0, tzinfo=ZoneInfo("Asia/Tokyo"))
+
+
+def test_memo_is_per_minute():
+    assert parse_date("30分後", NOW) == datetime(2025, 8, 20, 10, 45)
+    assert parse_date("30分後", NOW + timedelta(seconds=10)) == datetime(2025, 8, 20, 10, 45)   # 同じ分
+    assert parse_date("30分後", NOW + timedelta(minutes=1)) == datetime(2025, 8, 20, 10, 46)
+
+
+def test_memo_is_bounded():
+    for i in range(dateparse.MEMO_SIZE * 2):
+        parse_date(f"{i % 28 + 1}日後", NOW)
+        parse_date(f"x{i}", NOW)
+    assert len(dateparse._memo) <= dateparse.MEMO_SIZE
+
+
+def test_normalize():
+    assert normalize("  明日　１８：００ ") == "明日 18:00"
+    assert normalize("Fri.  8:00") == "fri. 8:00"
+    assert normalize(None) == ""
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import asyncio, threading
+
+import pytest
+
+import db as dbmod
+from db import AsyncDatabase, Database
+
+
+def test_open_runs_on_db_thread(db_path):
+    opened = []
+
+    def opener():
+        opened.append(threading.current_thread().name)
+        return Database(db_path)
+
+    adb = AsyncDatabase(opener=opener)          # ここでは開かない
+    assert opened == []
+
+    async def go():
+        loop_thread = threading.current_thread().name
+        rows = await asyncio.gather(*(adb.query_one("SELECT COUNT(*) FROM tasks") for _ in range(5)))
+        return loop_thread, rows
+    loop_thread, rows = asyncio.run(go())
+    assert rows == [(0,)] * 5
+    assert len(opened) == 1 and opened[0] != loop_thread and opened[0].startswith("db")
+    adb.db.close()
+    adb.close()
+
+
+def test_failed_open_is_retried(db_path):
+    calls = []
+
+    def opener():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("disk not mounted")
+        return Database(db_path)
+
+    adb = AsyncDatabase(opener=opener)
+
+    async def go():
+        with pytest.raises(OSError):
+            await adb.query("SELECT 1")
+        return await adb.query_one("SELECT 1")
+    assert asyncio.run(go()) == (1,)
+    assert len(calls) == 2
+    adb.db.close()
+    adb.close()
+
+
+def test_get_adb_does_no_io(db_path, monkeypatch):
+    monkeypatch.setattr(dbmod, "DB_PATH", db_path)
+    monkeypatch.setattr(dbmod, "_default", None)
+    monkeypatch.setattr(dbmod, "_default_async", None)
+    adb = dbmod.get_adb()
+    assert dbmod._default is None
+    with pytest.raises(RuntimeError):
+        adb.db
+
+    async def go():
+        return threading.current_thread(), await adb.open()
+    loop_thread, db = asyncio.run(go())
+    assert db is dbmod._default is dbmod.get_db()            # 同期側と同じ Database を共有
+    assert loop_thread is threading.main_thread()
+    db.close()
+    adb.close()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import asyncio, sqlite3
+
+import pytest
+
+from dispatch import ALLOWED_FROM, TASK_ACTIONS, parse_custom_id, transition
+from taskcache import TaskCache
+
+
+def _task(database, status="pending", tid=1, assignee=100):
+    database.execute("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,status) "
+                     "VALUES (?,1,10,?,'t',?)", (tid, assignee, status))
+
+
+def _status(database, tid=1):
+    return database.query_one("SELECT status FROM tasks WHERE id=?", (tid,))[0]
+
+
+def test_parse_custom_id():
+    assert parse_custom_id("accept_task_12") == ("accept_task", 12)
+    assert parse_custom_id("undo_completion_3") == ("undo_completion", 3)
+    assert parse_custom_id("accept_task_x") is None
+    assert parse_custom_id(None) is None
+
+
+@pytest.mark.parametrize("action,before", [(a, s) for a, froms in ALLOWED_FROM.items() for s in froms])
+def test_allowed_transition_updates_db_and_cache(database, adb, action, before):
+    _task(database, before)
+    cache = TaskCache(adb)
+    res, _, t = asyncio.run(transition(adb, 1, 100, action, cache=cache))
+    assert res == "ok" and t.status == TASK_ACTIONS[action]
+    assert _status(database) == TASK_ACTIONS[action]
+    assert cache._rows[1] == t
+
+
+@pytest.mark.parametrize("action,before", [
+    ("accept_task", "completed"),                # 完了後に古いメッセージの「受託」を押した
+    ("accept_task", "accepted"),
+    ("decline_task", "accepted"),
+    ("complete_task", "pending"),
+    ("complete_task", "completed"),
+    ("undo_completion", "accepted"),
+    ("abandon_task", "declined"),
+])
+def test_invalid_transition_is_rejected(database, adb, action, before):
+    _task(database, before)
+    cache = TaskCache(adb)
+    assert asyncio.run(transition(adb, 1, 100, action, cache=cache)) == ("invalid", None, None)
+    assert _status(database) == before
+    assert 1 not in cache._rows
+
+
+def test_missing_and_forbidden(database, adb):
+    _task(database)
+    assert asyncio.run(transition(adb, 2, 100, "accept_task"))[0] == "missing"
+    assert asyncio.run(transition(adb, 1, 999, "accept_task"))[0] == "forbidden"
+    assert _status(database) == "pending"
+
+
+def test_cache_untouched_when_commit_fails(database, adb):
+    _task(database)
+    cache = TaskCache(adb)
+
+    class FailingCommit:
+        async def transaction(self, fn):
+            def run(c):
+                fn(c)
+                raise sqlite3.OperationalError("disk I/O error")
+            return await adb.transaction(run)
+
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(transition(FailingCommit(), 1, 100, "accept_task", cache=cache))
+    assert _status(database) == "pending"
+    assert 1 not in cache._rows
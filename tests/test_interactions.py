@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import asyncio, gc
+
+from interactions import InteractionLifecycle
+
+
+def test_spawn_keeps_reference_until_done():
+    lc = InteractionLifecycle()
+    done = []
+
+    async def work():
+        await asyncio.sleep(0.01)
+        done.append(1)
+
+    async def go():
+        lc.spawn(work())                 # 呼び出し側は参照を持たない
+        gc.collect()
+        assert len(lc._bg) == 1
+        await lc.drain()
+
+    asyncio.run(go())
+    assert done == [1] and not lc._bg
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import discord
+import pytest
+
+import Reminderbot
+from delivery import deliver
+
+KEY = (1, 100, "remind")
+
+
+class Member:
+    def __init__(self, uid):
+        self.id, self.mention, self.sent = uid, f"<@{uid}>", []
+
+    async def send(self, *, embeds):
+        self.sent.append(embeds)
+
+
+class Guild:
+    """キャッシュ（get_member）には誰も居ない。members に居る人だけ fetch_member で取れる"""
+
+    def __init__(self, members=()):
+        self.id, self.members = 1, {m.id: m for m in members}
+
+    def get_member(self, uid):
+        return None
+
+    async def fetch_member(self, uid):
+        if uid not in self.members:
+            raise discord.NotFound(type("R", (), {"status": 404, "reason": "Not Found"})(), "Unknown Member")
+        return self.members[uid]
+
+
+def _deliver(monkeypatch, guild):
+    monkeypatch.setattr(Reminderbot.bot, "get_guild", lambda gid: guild)
+    return asyncio.run(deliver([(KEY, discord.Embed(title="x"))], Reminderbot._send_reminder))
+
+
+def test_uncached_member_is_fetched(monkeypatch):
+    m = Member(100)
+    assert _deliver(monkeypatch, Guild([m])) == (1, 0)
+    assert len(m.sent) == 1
+
+
+@pytest.mark.parametrize("guild", [None, Guild()], ids=["guild gone", "member left"])
+def test_unreachable_recipient_counts_as_failed(monkeypatch, caplog, guild):
+    assert _deliver(monkeypatch, guild) == (0, 1)
+    assert "[delivery]" in caplog.text
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import asyncio, time
+
+import discord
+import pytest
+
+from renamer import ThreadRenamer
+
+
+class _Resp:
+    def __init__(self, status):
+        self.status, self.reason = status, "x"
+
+
+class FakeThread:
+    def __init__(self, tid=1, name="🟥 task", errors=()):
+        self.id, self.name = tid, name
+        self.errors = list(errors)                # edit() ごとに先頭から投げる（None なら成功）
+        self.calls = 0
+
+    async def edit(self, *, name):
+        self.calls += 1
+        err = self.errors.pop(0) if self.errors else None
+        if err is not None:
+            raise err
+        self.name = name
+
+
+def _run(rn, th, *names):
+    async def go():
+        for n in names:
+            rn.request(th, n)
+        await rn.flush()
+    asyncio.run(go())
+
+
+@pytest.mark.parametrize("err", [
+    discord.HTTPException(_Resp(503), "unavailable"),
+    discord.HTTPException(_Resp(429), "rate limited"),
+    OSError("connection reset"),
+    asyncio.TimeoutError(),
+])
+def test_transient_failure_is_retried_and_recovers(err):
+    rn = ThreadRenamer(per=60.0, backoff=0.01)
+    th = FakeThread(errors=[err, err])
+    _run(rn, th, "🟩 task")
+    assert th.name == "🟩 task" and th.calls == 3
+    assert rn.retried == 2 and rn.failed == 0 and rn.applied == 1
+    slot = rn._slots[th.id]
+    assert len(slot.used) == 1                    # 失敗した2回は枠を使っていない
+    assert rn.pending(th.id) is None
+
+
+def test_retry_applies_the_latest_name():
+    rn = ThreadRenamer(per=60.0, backoff=0.05)
+    th = FakeThread(errors=[OSError("reset")])
+
+    async def go():
+        rn.request(th, "🟨 task")
+        await asyncio.sleep(0.01)                 # 1回目が失敗して待っている間に次の名前
+        rn.request(th, "🟩 task")
+        await rn.flush()
+    asyncio.run(go())
+    assert th.name == "🟩 task" and rn.coalesced == 1
+
+
+@pytest.mark.parametrize("err", [
+    discord.Forbidden(_Resp(403), "missing access"),
+    discord.NotFound(_Resp(404), "unknown channel"),
+])
+def test_permanent_failure_is_dropped(err):
+    rn = ThreadRenamer(per=60.0, backoff=0.01)
+    th = FakeThread(errors=[err])
+    _run(rn, th, "🟩 task")
+    assert th.name == "🟥 task" and th.calls == 1
+    assert rn.failed == 1 and rn.retried == 0 and rn.pending(th.id) is None
+
+
+def test_bucket_allows_rate_edits_per_window():
+    rn = ThreadRenamer(rate=2, per=0.2)
+    th = FakeThread()
+    _run(rn, th, "🟨 task")
+    _run(rn, th, "🟩 task")
+    start = time.monotonic()
+    _run(rn, th, "⚠️ task")                      # 3回目は最初の枠が戻るまで待つ
+    assert th.name == "⚠️ task" and th.calls == 3
+    assert time.monotonic() - start > 0.1
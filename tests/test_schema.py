@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import schema
+from db import Database
+
+# v1 より前の reminder_bot.db（thread_id / reminder_sent も schema_version も無い）
+OLD_TASKS = """CREATE TABLE tasks(
+    id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, instructor_id INTEGER, assignee_id INTEGER,
+    task_name TEXT, due_date TIMESTAMP, status TEXT DEFAULT 'pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    message_id INTEGER, channel_id INTEGER)"""
+
+
+def _epoch(s: str) -> int:
+    return int(datetime.strptime(s, "%Y-%m-%d %H:%M:%S").replace(tzinfo=ZoneInfo(schema.LEGACY_TZ)).timestamp())
+
+
+@pytest.fixture
+def old_db(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(OLD_TASKS)
+    conn.executemany("INSERT INTO tasks (guild_id,assignee_id,task_name,due_date,status) VALUES (1,?,?,?,?)",
+                     [(i, f"old {i}", "2025-08-23 18:00:00", "pending") for i in range(20)])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _versions(db):
+    return [r[0] for r in db.query("SELECT version FROM schema_version ORDER BY version")]
+
+
+def test_old_db_upgrades_to_latest(old_db):
+    db = Database(old_db)
+    try:
+        assert db.schema_version == schema.LATEST
+        assert _versions(db) == [n for n, _, _ in schema.MIGRATIONS]
+        assert [r[1] for r in db.query("PRAGMA table_info(tasks)")][-2:] == ["reminder_sent", "thread_id"]
+        assert db.query_one("PRAGMA journal_mode")[0] == "wal"
+        assert db.query_one("SELECT COUNT(*), SUM(reminder_sent) FROM tasks") == (20, 0)
+        # v6: 文字列の期日は BOT_TZ の壁時計として epoch 秒に
+        assert db.query("SELECT DISTINCT typeof(due_date), due_date FROM tasks") == \
+            [("integer", _epoch("2025-08-23 18:00:00"))]
+    finally:
+        db.close()
+
+
+def test_reopen_is_idempotent(old_db):
+    Database(old_db).close()
+    db = Database(old_db)
+    try:
+        assert db.schema_version == schema.LATEST
+        assert db.query_one("SELECT COUNT(*) FROM schema_version")[0] == schema.LATEST
+        assert db.query_one("SELECT COUNT(*) FROM tasks")[0] == 20
+    finally:
+        db.close()
+
+
+def test_step_by_step_matches_fresh(db_path, tmp_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    for n, _, _ in schema.MIGRATIONS:
+        assert schema.migrate(conn, target=n) == n
+    fresh = sqlite3.connect(str(tmp_path / "fresh.db"), isolation_level=None)
+    schema.migrate(fresh)
+
+    def objects(c):
+        return c.execute("SELECT type, name, sql FROM sqlite_master WHERE name != 'sqlite_sequence' "
+                         "ORDER BY type, name").fetchall()
+    assert objects(conn) == objects(fresh)
+    conn.close(); fresh.close()
+
+
+def test_v5_reminders_move_to_epoch(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    schema.migrate(conn, target=5)
+    due = (datetime.now() + timedelta(days=3)).replace(microsecond=0).strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("INSERT INTO tasks (id,guild_id,assignee_id,task_name,due_date,status) VALUES (1,1,2,'t',?,'accepted')",
+                 (due,))
+    conn.execute("INSERT INTO reminders (task_id,kind,fire_at) VALUES (1,'before_60','2000-01-01 00:00:00')")
+    conn.execute("INSERT INTO reminders (task_id,kind,fire_at,sent_at) "
+                 "VALUES (1,'before_1440','2000-01-01 00:00:00','2000-01-01 00:00:05')")
+    assert schema.migrate(conn) == schema.LATEST
+    rows = dict(conn.execute("SELECT kind, fire_at FROM reminders").fetchall())
+    # 未送信の段階は新しい期日から計算し直し、送信済みはそのまま epoch に
+    assert rows["before_60"] == _epoch(due) - 3600
+    assert rows["before_1440"] == _epoch("2000-01-01 00:00:00")
+    assert conn.execute("SELECT sent_at FROM reminders WHERE kind='before_1440'").fetchone()[0] == \
+        _epoch("2000-01-01 00:00:05")
+    conn.close()
+
+
+def test_failed_migration_rolls_back(db_path, monkeypatch):
+    def boom(conn):
+        conn.execute("CREATE TABLE half_done(x)")
+        raise RuntimeError("boom")
+    monkeypatch.setattr(schema, "MIGRATIONS", schema.MIGRATIONS + [(schema.LATEST + 1, "broken", boom)])
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    with pytest.raises(RuntimeError):
+        schema.migrate(conn)
+    assert schema.current_version(conn) == schema.LATEST
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name='half_done'").fetchone()
+    conn.close()
+
+
+def test_hot_queries_use_indexes(database):
+    assert schema.full_scans(database._writer) == []
+
+
+def test_full_scans_reports_missing_index(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    schema.migrate(conn)
+    conn.execute("DROP INDEX idx_tasks_thread")
+    conn.execute("DROP INDEX idx_tasks_open_due")
+    names = {name for name, _ in schema.full_scans(conn)}
+    # fixcolor は idx_tasks_thread_updated を端から読む（USING INDEX でも全走査）
+    assert names == {"fixcolor", "open_by_due"}
+    conn.close()
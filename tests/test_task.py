@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from task import EMOJI_PREFIXES, STATUS_EMOJI, Status, status_of
+from threadsync import current_emoji, renamed, status_emoji
+
+
+def test_every_status_has_one_emoji():
+    assert set(STATUS_EMOJI) == set(Status)
+    assert len(set(STATUS_EMOJI.values())) == len(Status)
+    assert STATUS_EMOJI["abandoned"] == STATUS_EMOJI[Status.ABANDONED]       # str でも Status でも引ける
+
+
+def test_thread_name_emoji_round_trip():
+    for st in Status:
+        name = renamed("🟥 課題 - 詳細", st)
+        assert current_emoji(name) == status_emoji(st) == STATUS_EMOJI[st]
+        assert name.endswith("課題 - 詳細")
+    assert current_emoji("課題") is None
+    assert all(current_emoji(f"{e} x") == e for e in EMOJI_PREFIXES)
+
+
+def test_status_of():
+    assert status_of("accepted") is Status.ACCEPTED
+    assert status_of(None) is Status.PENDING
+    assert status_of("weird") == "weird"
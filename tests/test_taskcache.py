@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import asyncio, random, sqlite3
+
+import pytest
+
+from dispatch import TASK_ACTIONS, transition
+from task import SELECT, task_factory as tf
+from taskcache import TaskCache
+
+THREAD = 500000
+
+
+@pytest.fixture
+def seeded(database):
+    database.executemany("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,due_date,thread_id) "
+                         "VALUES (?,1,10,?,?,0,?)",
+                         [(i, 100 + i % 10, f"task {i}", THREAD + i) for i in range(1, 201)])
+    return database
+
+
+class MidReadADB:
+    """読み取りの結果を返す前に hook()（= 読んでいる間に走った書き込み）を1回だけ挟む"""
+
+    def __init__(self, adb):
+        self.adb, self.hook = adb, None
+
+    async def _after_read(self, res):
+        hook, self.hook = self.hook, None
+        if hook is not None:
+            await hook()
+        return res
+
+    async def query(self, *a):
+        return await self._after_read(await self.adb.query(*a))
+
+    async def query_one(self, *a):
+        return await self._after_read(await self.adb.query_one(*a))
+
+    async def transaction(self, fn):
+        return await self.adb.transaction(fn)
+
+
+def _db_row(db, tid):
+    return db.query_one(f"{SELECT} WHERE id=?", (tid,), tf)
+
+
+def test_unrelated_write_keeps_read(seeded, adb):
+    mid = MidReadADB(adb)
+    cache = TaskCache(mid)
+
+    async def go():
+        mid.hook = lambda: cache.execute("UPDATE tasks SET status='accepted' WHERE id=?", (2,), 2)
+        await cache.get(1)
+        assert 1 in cache._rows
+        await cache.get(1)
+    asyncio.run(go())
+    assert cache.hits == 1 and cache.stale == 0
+
+
+def test_write_to_same_row_discards_read(seeded, adb):
+    mid = MidReadADB(adb)
+    cache = TaskCache(mid)
+
+    async def go():
+        mid.hook = lambda: cache.execute("DELETE FROM tasks WHERE id=?", (1,), 1)
+        old = await cache.get(1)
+        assert old is not None and old.id == 1           # 読んだ時点の行は返す
+        assert 1 not in cache._rows                      # が、キャッシュには入れない
+        assert await cache.get(1) is None
+    asyncio.run(go())
+    assert cache.stale == 1
+
+
+def test_row_moved_into_thread_during_read(seeded, adb):
+    mid = MidReadADB(adb)
+    cache = TaskCache(mid)
+
+    async def go():
+        mid.hook = lambda: cache.execute("UPDATE tasks SET thread_id=? WHERE id=?", (THREAD + 1, 2), 2)
+        assert [t.id for t in await cache.by_thread(THREAD + 1)] == [1]
+        assert THREAD + 1 not in cache._threads_loaded   # 一覧は古いかもしれない：読み込み済みにしない
+        assert [t.id for t in await cache.by_thread(THREAD + 1)] == [1, 2]
+    asyncio.run(go())
+
+
+def test_row_moved_out_of_assignee_during_read(seeded, adb):
+    mid = MidReadADB(adb)
+    cache = TaskCache(mid)
+
+    async def go():
+        mid.hook = lambda: cache.execute("UPDATE tasks SET assignee_id=999 WHERE id=?", (1,), 1)
+        await cache.by_assignee(1, 101)
+        assert (1, 101) not in cache._assignees_loaded
+        assert 1 not in [t.id for t in await cache.by_assignee(1, 101)]
+    asyncio.run(go())
+
+
+def test_stale_fill_before_commit_is_overwritten(seeded, adb):
+    cache = TaskCache(adb)
+    old = _db_row(seeded, 1)
+
+    def fn(c):
+        cache.write(c, "UPDATE tasks SET status='completed' WHERE id=?", (1,), 1)
+        cache._fill((old,), cache._seq)          # COMMIT 前に読み終えた読み取り（古い行）
+    asyncio.run(cache.transaction(fn))
+    assert cache._rows[1].status == "completed" == _db_row(seeded, 1).status
+
+
+def test_rollback_drops_written_rows(seeded, adb):
+    cache = TaskCache(adb)
+
+    def fn(c):
+        cache.write(c, "INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name) VALUES (1,10,100,'x')")
+        cache.write(c, "UPDATE tasks SET status='completed' WHERE id=?", (1,), 1)
+        raise sqlite3.OperationalError("disk I/O error")
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(cache.transaction(fn))
+    assert set(cache._rows) == set()
+    assert seeded.query_one("SELECT COUNT(*) FROM tasks")[0] == 200
+    assert _db_row(seeded, 1).status == "pending"
+
+
+def _check_all(cache, db):
+    for tid, row in list(cache._rows.items()):
+        assert row == _db_row(db, tid), f"id {tid}"
+    for th in cache._threads_loaded:
+        assert cache._ids(cache._by_thread.get(th, ())) == \
+            db.query(f"{SELECT} WHERE thread_id=? ORDER BY id", (th,), tf), f"thread {th}"
+    for g, a in cache._assignees_loaded:
+        assert cache._ids(cache._by_assignee.get((g, a), ())) == \
+            db.query(f"{SELECT} WHERE guild_id=? AND assignee_id=? ORDER BY id", (g, a), tf), f"assignee {a}"
+
+
+async def _random_op(cache, adb, db, rnd, thread_ids, check: bool):
+    op = rnd.random()
+    tid = rnd.randint(1, db.query_one("SELECT MAX(id) FROM tasks")[0])
+    if op < 0.15:
+        await cache.execute("INSERT INTO tasks (guild_id,instructor_id,assignee_id,task_name,thread_id) "
+                            "VALUES (1,10,?,'new',?)", (100 + rnd.randint(0, 9), rnd.choice(thread_ids)))
+    elif op < 0.35:
+        row = db.query_one("SELECT assignee_id FROM tasks WHERE id=?", (tid,))
+        if row:
+            await transition(adb, tid, row[0], rnd.choice(list(TASK_ACTIONS)), cache=cache)
+    elif op < 0.45:
+        await cache.execute("UPDATE tasks SET thread_id=? WHERE id=?", (rnd.choice(thread_ids), tid), tid)
+    elif op < 0.50:
+        await cache.execute("UPDATE tasks SET assignee_id=? WHERE id=?", (100 + rnd.randint(0, 9), tid), tid)
+    elif op < 0.53:
+        await cache.execute("DELETE FROM tasks WHERE id=?", (tid,), tid)
+    elif op < 0.75:
+        got = await cache.get(tid)
+        if check:
+            assert got == _db_row(db, tid), f"id {tid}"
+    elif op < 0.90:
+        th = rnd.choice(thread_ids[:-1])
+        got = await cache.by_thread(th)
+        if check:
+            assert got == db.query(f"{SELECT} WHERE thread_id=? ORDER BY id", (th,), tf), f"thread {th}"
+    else:
+        aid = 100 + rnd.randint(0, 9)
+        got = await cache.by_assignee(1, aid)
+        if check:
+            assert got == db.query(f"{SELECT} WHERE guild_id=1 AND assignee_id=? ORDER BY id", (aid,), tf), \
+                f"assignee {aid}"
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_mutations_match_db(seeded, adb, seed):
+    """小さいキャッシュ（追い出しが起きる）にランダムな書き込みと読み取りを混ぜ、毎回 DB と突き合わせる"""
+    rnd = random.Random(seed)
+    cache = TaskCache(adb, max_tasks=50)
+    thread_ids = [THREAD + rnd.randint(1, 60) for _ in range(8)] + [None]
+
+    async def go():
+        for _ in range(1500):
+            await _random_op(cache, adb, seeded, rnd, thread_ids, check=True)
+    asyncio.run(go())
+    _check_all(cache, seeded)
+    assert cache.evictions > 0
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_concurrent_mutations_settle_to_db(seeded, adb, seed):
+    """読み取りと書き込みを並行で走らせ、落ち着いた後のキャッシュ（行と読み込み済みの一覧）が DB と一致する"""
+    rnd = random.Random(seed)
+    cache = TaskCache(adb, max_tasks=100)
+    thread_ids = [THREAD + rnd.randint(1, 60) for _ in range(8)] + [None]
+
+    async def go():
+        for _ in range(40):
+            await asyncio.gather(*(_random_op(cache, adb, seeded, rnd, thread_ids, check=False) for _ in range(25)))
+    asyncio.run(go())
+    _check_all(cache, seeded)
+
+
+def test_status_by_thread_is_last_updated(database, adb):
+    """同じスレッドに複数タスク：threadsync.sweep（ORDER BY updated_at, id の最後）と同じものを選ぶ"""
+    database.executemany("INSERT INTO tasks (id,guild_id,instructor_id,assignee_id,task_name,status,thread_id,updated_at) "
+                         "VALUES (?,1,10,100,'t',?,?,?)",
+                         [(1, "accepted", THREAD, "2025-01-01 00:00:02"), (2, "completed", THREAD, "2025-01-01 00:00:01"),
+                          (3, "pending", THREAD, "2025-01-01 00:00:02")])
+    cache = TaskCache(adb)
+
+    def swept():
+        rows = database.query("SELECT thread_id, status FROM tasks WHERE thread_id IS NOT NULL ORDER BY updated_at, id")
+        return dict(rows)[THREAD]
+
+    async def go():
+        assert await cache.status_by_thread(THREAD) == swept() == "pending"       # 同時刻なら id の大きい方
+        await transition(adb, 1, 100, "complete_task", cache=cache)
+        assert await cache.status_by_thread(THREAD) == swept() == "completed"
+        assert await cache.status_by_thread(THREAD + 1) is None
+    asyncio.run(go())
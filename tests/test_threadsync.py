@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import asyncio, time
+
+import discord
+
+from renamer import ThreadRenamer
+from threadsync import CONCURRENCY, ThreadReconciler
+
+
+class FakeThread(discord.Thread):
+    def __init__(self, tid):
+        self.id, self.name = tid, "🟥 task"
+
+    async def edit(self, *, name):
+        self.name = name
+        return self
+
+
+class SlowClient:
+    """キャッシュには何も無く、fetch_channel に delay 秒かかる"""
+
+    def __init__(self, delay=0.05):
+        self.delay, self.threads, self.fetches = delay, {}, 0
+
+    def get_channel(self, tid):
+        return None
+
+    async def fetch_channel(self, tid):
+        self.fetches += 1
+        await asyncio.sleep(self.delay)
+        return self.threads.setdefault(tid, FakeThread(tid))
+
+
+async def _settle(rs, client, tids):
+    while any(rs._want.get(t) for t in tids) or rs._running:
+        await asyncio.sleep(0.005)
+    await rs.renamer.flush()
+
+
+def test_latest_status_wins_while_fetching():
+    client = SlowClient()
+
+    async def go():
+        rs = ThreadReconciler(client, adb=object(), renamer=ThreadRenamer())
+        rs.start()
+        rs.publish(1, "accepted")
+        await asyncio.sleep(0.01)                  # fetch_channel の途中
+        rs.publish(1, "completed")
+        await asyncio.sleep(0.01)
+        await _settle(rs, client, [1])
+        rs.stop()
+    asyncio.run(go())
+    assert client.threads[1].name == "🟩 task"
+
+
+def test_threads_are_applied_concurrently():
+    client = SlowClient(delay=0.05)
+    n = CONCURRENCY
+
+    async def go():
+        rs = ThreadReconciler(client, adb=object(), renamer=ThreadRenamer())
+        rs.start()
+        t0 = time.perf_counter()
+        for tid in range(1, n + 1):
+            rs.publish(tid, "accepted")
+        await asyncio.sleep(0.01)
+        await _settle(rs, client, range(1, n + 1))
+        rs.stop()
+        return time.perf_counter() - t0
+    elapsed = asyncio.run(go())
+    assert all(client.threads[t].name == "🟨 task" for t in range(1, n + 1))
+    assert elapsed < n * client.delay / 2         # 順番に fetch していたら n * delay
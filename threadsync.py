@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# threadsync.py - タスク状態 → スレッド名先頭の絵文字 の同期（変更駆動）
+# 状態を変えた箇所から publish / task_changed を呼ぶとキューに積まれ、ワーカーが反映する
+# （fetch_channel を待つ間に次のスレッドへ進めるよう、CONCURRENCY 件まで並行）。
+# 同じスレッドへの変更は最新の1件にまとまり、名前がすでに合っていれば REST を一切叩かない。
+# 実際の名前変更は renamer.py（スレッドごとのトークンバケット）に任せる。
+# 全件の突き合わせ（sweep）は起動時と !色全同期 の時だけ（旧 color_enforcer の15秒ポーリングは廃止）。
+import asyncio, logging
+from typing import Dict, Optional
+
+import discord
+
+from db import get_adb
+from renamer import renamer as default_renamer
+from task import EMOJI_PREFIXES, STATUS_EMOJI, UNKNOWN_EMOJI
+from taskcache import TaskCache, task_cache
+
+logger = logging.getLogger("taskbot")
+
+CONCURRENCY = 8        # 同時に反映するスレッド数
+
+
+def status_emoji(st: str) -> str:
+    return STATUS_EMOJI.get(st, UNKNOWN_EMOJI)
+
+def current_emoji(name: str) -> Optional[str]:
+    for e in EMOJI_PREFIXES:
+        if (name or "").startswith(e):
+            return e
+    return None
+
+def renamed(name: str, status: str) -> str:
+    """スレッド名の先頭絵文字を status のものに置換／付与した名前"""
+    cur = name or ""
+    em = status_emoji(status)
+    e = current_emoji(cur)
+    return (em + cur[len(e):] if e else f"{em} {cur}").lstrip()
+
+
+class ThreadReconciler:
+    def __init__(self, client: discord.Client, adb=None, renamer=None, cache=None):
+        self.client = client
+        self._adb = adb
+        self.renamer = renamer or default_renamer
+        self.cache = cache or (TaskCache(adb) if adb is not None else task_cache)
+        self._want: Dict[int, str] = {}       # thread_id -> 反映したい status（後勝ち）
+        self._applied: Dict[int, str] = {}    # thread_id -> 最後に反映した絵文字（キャッシュに無いスレッド用）
+        self._queue: "asyncio.Queue[int]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()            # 反映中の apply（GC で消えないように参照を持つ）
+        self.renames = self.fetches = self.skipped = 0
+
+    @property
+    def adb(self):
+        return self._adb or get_adb()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _applied_emoji(self, thread_id: int) -> Optional[str]:
+        name = self.renamer.expected(thread_id)
+        if name is not None:                     # バケット待ち・適用直後の名前はキャッシュより新しい
+            return current_emoji(name)
+        th = self.client.get_channel(thread_id)
+        if isinstance(th, discord.Thread):
+            return current_emoji(th.name)
+        return self._applied.get(thread_id)
+
+    def publish(self, thread_id: Optional[int], status: Optional[str]):
+        """状態変更イベント。反映済みと同じなら何もしない"""
+        if not thread_id:
+            return
+        status = status or "pending"
+        if self._applied_emoji(thread_id) == status_emoji(status):
+            self._want.pop(thread_id, None)   # 途中の変更が元に戻った場合も取り消す
+            self.skipped += 1
+            return
+        queued = thread_id in self._want
+        self._want[thread_id] = status
+        if not queued:
+            self._queue.put_nowait(thread_id)
+
+    async def task_changed(self, task_id: int, status: str):
+        """task_id しか分からない呼び出し元用（thread_id を引いてから publish）"""
+        t = await self.cache.get(task_id)
+        if t and t.thread_id:
+            self.publish(t.thread_id, status)
+
+    async def _resolve(self, thread_id: int) -> Optional[discord.Thread]:
+        th = self.client.get_channel(thread_id)
+        if isinstance(th, discord.Thread):
+            return th
+        try:
+            self.fetches += 1
+            th = await self.client.fetch_channel(thread_id)
+        except Exception:
+            return None
+        return th if isinstance(th, discord.Thread) else None
+
+    async def apply(self, thread_id: int) -> bool:
+        if thread_id not in self._want:
+            return False
+        th = await self._resolve(thread_id)
+        # status は解決を待った後に取る：待っている間の publish は _want を上書きするだけで、
+        # 同じスレッドの apply が並んでも pop から request までの間に await が無いので最後の status が勝つ
+        status = self._want.pop(thread_id, None)
+        if th is None or status is None:
+            return False
+        cur = self.renamer.expected(thread_id) or th.name
+        new = renamed(cur, status)
+        if new != cur:
+            self.renames += 1
+        self.renamer.request(th, new)            # 同じ名前なら適用待ちの取り消しになる
+        self._applied[thread_id] = status_emoji(status)
+        return True
+
+    async def drain(self):
+        """キューに溜まっている分をこの場で全部反映（ワーカー無しで使う時・テスト用）"""
+        while not self._queue.empty():
+            await self.apply(self._queue.get_nowait())
+        await self.renamer.flush()
+
+    async def _apply_safely(self, thread_id: int, sem: asyncio.Semaphore):
+        try:
+            await self.apply(thread_id)
+        except Exception as e:
+            logger.error(f"[threadsync] {thread_id}: {e}", exc_info=True)
+        finally:
+            sem.release()
+
+    async def _run(self):
+        sem = asyncio.Semaphore(CONCURRENCY)
+        while True:
+            thread_id = await self._queue.get()
+            await sem.acquire()
+            task = asyncio.get_running_loop().create_task(self._apply_safely(thread_id, sem))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def sweep(self) -> int:
+        """thread_id 付きタスクを全件突き合わせて、ずれているものだけ積む（起動時・手動）。
+        キャッシュに無い（アーカイブ済み）スレッドは触らない：名前を変えるとアーカイブが解除されるため"""
+        rows = await self.adb.query(
+            "SELECT thread_id, status FROM tasks WHERE thread_id IS NOT NULL ORDER BY updated_at, id")
+        latest = {tid: st for tid, st in rows}   # 同じスレッドに複数タスクがあれば最後に更新したもの
+        before = self._queue.qsize()
+        for thread_id, status in latest.items():
+            if isinstance(self.client.get_channel(thread_id), discord.Thread):
+                self.publish(thread_id, status)
+        queued = self._queue.qsize() - before
+        logger.info(f"[threadsync] sweep: {len(latest)} thread(s), {queued} out of sync")
+        return queued
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
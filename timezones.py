@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# timezones.py - ギルド／ユーザーごとのタイムゾーン
+# 期日は DB に UTC の epoch 秒（INTEGER）で持ち、人が読み書きする時だけタイムゾーンを当てる。
+# サーバー（Render のシンガポール等）の現地時刻には一切依存しない。
+# 設定は settings テーブル：ギルド既定 "tz:<guild_id>"、個人 "tz:<guild_id>:<user_id>"（個人が優先。settings.py）。
+import os
+from datetime import datetime, tzinfo
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from settings import Setting, SettingsStore, settings
+
+DEFAULT_TZ = os.getenv("BOT_TZ", "Asia/Tokyo")
+
+
+@lru_cache(maxsize=None)
+def zone(name: str) -> tzinfo:
+    """IANA 名（Asia/Tokyo 等）-> tzinfo。知らない名前は ValueError"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"unknown timezone: {name}") from e
+
+def to_epoch(dt: datetime, tz: Optional[tzinfo] = None) -> int:
+    """datetime -> UTC epoch 秒。naive なら tz（省略時 DEFAULT_TZ）の壁時計として読む"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz or zone(DEFAULT_TZ))
+    return int(dt.timestamp())
+
+def from_epoch(ts: int, tz: Optional[tzinfo] = None) -> datetime:
+    return datetime.fromtimestamp(ts, tz or zone(DEFAULT_TZ))
+
+
+def _tz_name(tz: tzinfo) -> str:
+    return getattr(tz, "key", None) or str(tz)
+
+# 個人 "tz:<guild>:<user>" → ギルド "tz:<guild>" → DEFAULT_TZ（知らない名前の設定は無視）
+TZ = Setting("tz", None, parse=zone, dump=_tz_name)
+
+
+class TimezoneStore:
+    """settings.py の設定ストアから tzinfo を引く（読み込み後は I/O なし）"""
+
+    def __init__(self, adb=None, store: Optional[SettingsStore] = None):
+        self.store = store if store is not None else (SettingsStore(adb) if adb is not None else settings)
+
+    def now(self, guild_id: Optional[int], user_id: Optional[int] = None) -> tzinfo:
+        return (self.store.get(TZ, guild_id, user_id) if guild_id else None) or zone(DEFAULT_TZ)
+
+    async def get(self, guild_id: Optional[int], user_id: Optional[int] = None) -> tzinfo:
+        """個人設定 → ギルド設定 → DEFAULT_TZ の順"""
+        if not self.store.loaded:
+            await self.store.load()
+        return self.now(guild_id, user_id)
+
+    async def set(self, guild_id: int, name: str, user_id: Optional[int] = None) -> tzinfo:
+        return await self.store.set(TZ, zone(name), guild_id, user_id)     # 知らない名前は ValueError
+
+
+tzstore = TimezoneStore()